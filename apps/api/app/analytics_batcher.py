@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import weakref
+from typing import Any
+
+import httpx
+
+from .config import read_int_env
+from .supabase_rest import insert_many
+
+
+TABLE = "analytics_events"
+RETRYABLE_HTTP_STATUSES = {408, 425, 429}
+
+
+def _is_rejected_batch(exc: Exception) -> bool:
+    # A 4xx other than throttling means a row is bad, not that the DB is down.
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    status = exc.response.status_code
+    return 400 <= status < 500 and status not in RETRYABLE_HTTP_STATUSES
+
+
+class AnalyticsBatcher:
+    """Background writer for analytics_events rows recorded by request handlers.
+
+    `enqueue` returns immediately; a flusher task writes queued rows with one
+    `insert_many` per batch when `max_batch` rows are waiting or every
+    `flush_interval_seconds`. Analytics never blocks product flow, so a batch
+    that still fails after one retry is logged and dropped, and once
+    `max_queue` rows are waiting new rows are dropped rather than growing
+    memory without bound.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_batch: int,
+        flush_interval_seconds: float,
+        max_queue: int,
+        insert_timeout_seconds: float = 10.0,
+    ) -> None:
+        self.max_batch = max(max_batch, 1)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue = max(max_queue, self.max_batch)
+        self.insert_timeout_seconds = insert_timeout_seconds
+        self.stats = {"inserted": 0, "dropped": 0, "batches": 0}
+        self._rows: list[dict[str, Any]] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._closed = False
+
+    def start(self) -> None:
+        if self._task is None and not self._closed:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def enqueue(self, row: dict[str, Any]) -> bool:
+        """Queue `row` for the next batch; False if it was dropped."""
+        if self._closed or len(self._rows) >= self.max_queue:
+            self.stats["dropped"] += 1
+            return False
+        self._rows.append(row)
+        self.start()
+        if len(self._rows) >= self.max_batch:
+            self._wake.set()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_seconds)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"api: analytics flush error: {e}", file=sys.stderr, flush=True)
+
+    async def _insert(self, rows: list[dict[str, Any]]) -> None:
+        async with asyncio.timeout(self.insert_timeout_seconds):
+            await insert_many(TABLE, rows, returning=None)
+
+    async def _write(self, rows: list[dict[str, Any]]) -> None:
+        for attempt in range(2):
+            try:
+                await self._insert(rows)
+                self.stats["inserted"] += len(rows)
+                return
+            except Exception as e:
+                if _is_rejected_batch(e):
+                    break
+                if attempt == 1:
+                    self.stats["dropped"] += len(rows)
+                    print(f"api: analytics batch dropped ({len(rows)} rows): {e}", file=sys.stderr, flush=True)
+                    return
+        # PostgREST rejected the batch: write row by row so one bad event
+        # (e.g. a deleted job) doesn't take the rest with it.
+        for row in rows:
+            try:
+                await self._insert([row])
+                self.stats["inserted"] += 1
+            except Exception as e:
+                self.stats["dropped"] += 1
+                print(f"api: analytics event dropped: {e}", file=sys.stderr, flush=True)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._rows:
+                batch, self._rows = self._rows[: self.max_batch], self._rows[self.max_batch :]
+                self.stats["batches"] += 1
+                await self._write(batch)
+
+    async def close(self) -> None:
+        """Stop the flusher and write whatever is still queued."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"queued": len(self._rows), **self.stats}
+
+
+_batchers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AnalyticsBatcher] = weakref.WeakKeyDictionary()
+
+
+def get_analytics_batcher() -> AnalyticsBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = AnalyticsBatcher(
+            max_batch=read_int_env("ANALYTICS_BATCH_SIZE", 200, minimum=1, maximum=5000),
+            flush_interval_seconds=float(
+                read_int_env("ANALYTICS_FLUSH_INTERVAL_MS", 1000, minimum=50, maximum=600000)
+            )
+            / 1000.0,
+            max_queue=read_int_env("ANALYTICS_MAX_QUEUE", 10000, minimum=1, maximum=1_000_000),
+        )
+        _batchers[loop] = batcher
+    return batcher
+
+
+async def close_analytics_batcher() -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    batcher = _batchers.pop(loop, None)
+    if batcher is not None:
+        await batcher.close()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from .config import get_optional_env
+
+
+# Must match worker_app.apify.webhook_signal_key / WEBHOOK_SECRET_HEADER.
+WEBHOOK_SECRET_HEADER = "x-apify-webhook-secret"
+SIGNAL_TTL_SECONDS = 600
+
+_redis: Any = None
+
+
+def webhook_signal_key(run_id: str) -> str:
+    return f"apify:run:{run_id}"
+
+
+def get_redis() -> Any:
+    global _redis
+    if _redis is None:
+        from redis import asyncio as redis_asyncio
+
+        _redis = redis_asyncio.from_url(
+            get_optional_env("REDIS_URL", "redis://localhost:6379/0") or "redis://localhost:6379/0"
+        )
+    return _redis
+
+
+def run_signal_from_payload(payload: dict[str, Any]) -> dict[str, Any] | None:
+    """Extract the run state from Apify's default webhook payload."""
+    resource = payload.get("resource")
+    event_data = payload.get("eventData")
+    run_id: Any = None
+    if isinstance(resource, dict):
+        run_id = resource.get("id")
+    if not run_id and isinstance(event_data, dict):
+        run_id = event_data.get("actorRunId")
+    if not isinstance(run_id, str) or not run_id:
+        return None
+    resource = resource if isinstance(resource, dict) else {}
+    return {
+        "run_id": run_id,
+        "event_type": payload.get("eventType"),
+        "status": resource.get("status"),
+        "default_dataset_id": resource.get("defaultDatasetId"),
+        "status_message": resource.get("statusMessage"),
+    }
+
+
+async def publish_run_signal(signal: dict[str, Any]) -> int:
+    # SET first so a worker that subscribes late still finds the result.
+    key = webhook_signal_key(str(signal["run_id"]))
+    message = json.dumps(signal)
+    redis = get_redis()
+    await redis.set(key, message, ex=SIGNAL_TTL_SECONDS)
+    return int(await redis.publish(key, message))
@@ -25,3 +25,18 @@ def get_env(name: str) -> str:
 
 def get_optional_env(name: str, default: str | None = None) -> str | None:
     return os.getenv(name, default)
+
+
+def read_int_env(name: str, default: int, *, minimum: int = 1, maximum: int = 600) -> int:
+    raw = get_optional_env(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        return default
+    if value < minimum:
+        return minimum
+    if value > maximum:
+        return maximum
+    return value
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import functools
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from .config import get_optional_env
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is the fallback.
+    orjson = None  # type: ignore[assignment]
+
+
+# JSON encode/decode for everything the API sends to or reads from the
+# database, plus the response class for its own JSON responses. Job and stage
+# payloads are large nested dicts, so use orjson when it is installed
+# (`pip install orjson`); JSON_CODEC=json forces the stdlib.
+
+
+@functools.cache
+def backend() -> str:
+    requested = (get_optional_env("JSON_CODEC", "auto") or "auto").strip().lower()
+    if requested == "json" or orjson is None:
+        return "json"
+    return "orjson"
+
+
+def dumps(value: Any) -> bytes:
+    if backend() == "orjson":
+        # Non-str keys are stringified like json.dumps does.
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | bytearray | str) -> Any:
+    if backend() == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CodecJSONResponse(JSONResponse):
+    """FastAPI default response class that renders with `dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -6,23 +6,45 @@ import json
 import re
 import time
 import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Literal
 
 import httpx
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+from .analytics_batcher import close_analytics_batcher, get_analytics_batcher
+from .apify_webhooks import WEBHOOK_SECRET_HEADER, publish_run_signal, run_signal_from_payload
 from .auth import AuthenticatedUser, require_user
 from .config import get_env, get_optional_env, load_env
 from .credit_packs import CreditPack, INITIAL_CREDIT_PACKS
-from .supabase_rest import insert_one, rpc, select_many, select_one, update_one
+from .json_codec import CodecJSONResponse, loads
+from .supabase_rest import insert_many, insert_one, rpc, select_many, select_one, update_one
 
 
 load_env()
 
-app = FastAPI(title="Avatar Polling System API", version="0.1.0")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    get_analytics_batcher().start()
+    try:
+        yield
+    finally:
+        # Drain queued analytics events before the process exits.
+        await close_analytics_batcher()
+
+
+app = FastAPI(
+    title="Avatar Polling System API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=CodecJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,6 +64,8 @@ EVENT_NAME_RE = re.compile(r"^[a-z0-9_.:-]{2,64}$")
 class CreateJobRequest(BaseModel):
     asin_a: str
     asin_b: str
+    # `bulk` jobs (scheduled re-runs, research batches) use the OpenAI Batch API.
+    priority: Literal["interactive", "bulk"] = "interactive"
 
 
 class CreateCheckoutSessionRequest(BaseModel):
@@ -57,6 +81,10 @@ class TrackEventRequest(BaseModel):
     properties: dict[str, Any] = Field(default_factory=dict)
 
 
+class TrackEventsBatchRequest(BaseModel):
+    events: list[TrackEventRequest] = Field(min_length=1, max_length=100)
+
+
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -145,11 +173,17 @@ def verify_stripe_signature(payload: bytes, sig_header: str, secret: str) -> Non
         raise HTTPException(status_code=400, detail="Stale Stripe webhook signature")
 
 
+# Columns the profile and job endpoints read and return, instead of select=*.
+PROFILE_COLUMNS = "id,credit_balance,daily_credit_used,daily_credit_reset_date"
+JOB_COLUMNS = "id,user_id,status,asin_a,asin_b,priority,created_at,updated_at"
+STAGE_COLUMNS = "id,job_id,stage_number,status,output,started_at,completed_at,created_at"
+
+
 async def ensure_user_profile(user_id: str) -> dict[str, Any]:
-    profile = await select_one("user_profiles", {"select": "*", "id": f"eq.{user_id}"})
+    profile = await select_one("user_profiles", {"select": PROFILE_COLUMNS, "id": f"eq.{user_id}"})
     if profile:
         return profile
-    return await insert_one("user_profiles", {"id": user_id})
+    return await insert_one("user_profiles", {"id": user_id}, returning=PROFILE_COLUMNS)
 
 
 async def ensure_job_owned_by_user(*, job_id: str, user_id: str) -> None:
@@ -165,7 +199,16 @@ async def ensure_job_owned_by_user(*, job_id: str, user_id: str) -> None:
         raise HTTPException(status_code=400, detail="Invalid job_id for current user")
 
 
-async def record_analytics_event(
+def canonical_job_id(job_id: str) -> str:
+    # Ids are interpolated into PostgREST filters, so anything but a UUID is
+    # a client error rather than a query that fails upstream.
+    try:
+        return str(uuid.UUID(job_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job_id") from None
+
+
+def record_analytics_event(
     *,
     user_id: str,
     event_name: str,
@@ -183,11 +226,9 @@ async def record_analytics_event(
     if stage_number is not None:
         payload["stage_number"] = stage_number
 
-    try:
-        await insert_one("analytics_events", payload)
-    except Exception:
-        # Analytics should never block product flow.
-        return
+    # Analytics should never block product flow: the batcher writes the row
+    # in the background and drops it if the DB is unavailable.
+    get_analytics_batcher().enqueue(payload)
 
 
 async def create_stripe_checkout_session(
@@ -261,9 +302,11 @@ async def create_job(
             "user_id": user.user_id,
             "asin_a": asin_a,
             "asin_b": asin_b,
+            "priority": body.priority,
             # Avoid a race where the worker claims the job before stage rows exist.
             "status": "seeding",
         },
+        returning="id",
     )
     job_id = str(job.get("id"))
 
@@ -277,35 +320,39 @@ async def create_job(
         4: "avatars",
         5: "verdict",
     }
-    for stage_number, stage_name in stages.items():
-        await insert_one(
-            "job_stages",
+    await insert_many(
+        "job_stages",
+        [
             {
                 "job_id": job_id,
                 "stage_number": stage_number,
                 "status": "pending",
                 "output": {"stage_name": stage_name},
-            },
-        )
+            }
+            for stage_number, stage_name in stages.items()
+        ],
+        returning=None,
+    )
 
     await update_one(
         "jobs",
         {"id": f"eq.{job_id}"},
         {"status": "queued", "updated_at": utc_now_iso()},
+        returning=None,
     )
-    await record_analytics_event(
+    record_analytics_event(
         user_id=user.user_id,
         job_id=job_id,
         event_name="job_created",
-        properties={"asin_a": asin_a, "asin_b": asin_b},
+        properties={"asin_a": asin_a, "asin_b": asin_b, "priority": body.priority},
     )
 
-    return {"job_id": job_id, "status": "queued"}
+    return {"job_id": job_id, "status": "queued", "priority": body.priority}
 
 
 @app.get("/jobs/{job_id}")
 async def get_job(job_id: str, user: AuthenticatedUser = Depends(require_user)) -> dict:
-    job = await select_one("jobs", {"select": "*", "id": f"eq.{job_id}"})
+    job = await select_one("jobs", {"select": JOB_COLUMNS, "id": f"eq.{job_id}"})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     if str(job.get("user_id")) != user.user_id:
@@ -326,7 +373,7 @@ async def get_job_stages(
     stages = await select_many(
         "job_stages",
         {
-            "select": "*",
+            "select": STAGE_COLUMNS,
             "job_id": f"eq.{job_id}",
             "order": "stage_number.asc",
         },
@@ -334,6 +381,40 @@ async def get_job_stages(
     return {"job_id": job_id, "stages": stages}
 
 
+@app.get("/jobs/{job_id}/stages/{stage_number}/debug")
+async def get_job_stage_debug(
+    job_id: str, stage_number: int, user: AuthenticatedUser = Depends(require_user)
+) -> dict:
+    # Stage outputs keep a summary; the worker stores attempts, sampled images,
+    # notes and full evidence as a shared, content-addressed stage artifact.
+    job = await select_one("jobs", {"select": "id,user_id", "id": f"eq.{job_id}"})
+    if not job or str(job.get("user_id")) != user.user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    stage = await select_one(
+        "job_stages",
+        {
+            "select": "debug_artifact:output->>debug_artifact",
+            "job_id": f"eq.{job_id}",
+            "stage_number": f"eq.{stage_number}",
+        },
+    )
+    content_hash = str((stage or {}).get("debug_artifact") or "")
+    artifact = None
+    if content_hash:
+        artifact = await select_one(
+            "stage_artifacts", {"select": "content", "content_hash": f"eq.{content_hash}"}
+        )
+    if not artifact:
+        raise HTTPException(status_code=404, detail="No debug artifact for this stage")
+    return {
+        "job_id": job_id,
+        "stage_number": stage_number,
+        "content_hash": content_hash,
+        "debug": artifact.get("content"),
+    }
+
+
 @app.get("/jobs/recent")
 async def get_recent_jobs(
     user: AuthenticatedUser = Depends(require_user),
@@ -418,7 +499,7 @@ async def create_credit_checkout(
             detail=f"Stripe checkout is not configured: {exc}",
         ) from exc
 
-    await record_analytics_event(
+    record_analytics_event(
         user_id=user.user_id,
         event_name="stripe_checkout_session_created",
         properties={
@@ -458,9 +539,9 @@ async def track_event(
     user: AuthenticatedUser = Depends(require_user),
 ) -> dict:
     if body.job_id:
-        await ensure_job_owned_by_user(job_id=body.job_id, user_id=user.user_id)
+        await ensure_job_owned_by_user(job_id=canonical_job_id(body.job_id), user_id=user.user_id)
 
-    await record_analytics_event(
+    record_analytics_event(
         user_id=user.user_id,
         event_name=body.event_name,
         job_id=body.job_id,
@@ -470,6 +551,37 @@ async def track_event(
     return {"ok": True}
 
 
+@app.post("/analytics/events/batch")
+async def track_events_batch(
+    body: TrackEventsBatchRequest,
+    user: AuthenticatedUser = Depends(require_user),
+) -> dict:
+    job_ids = sorted({canonical_job_id(event.job_id) for event in body.events if event.job_id})
+    if job_ids:
+        owned = await select_many(
+            "jobs",
+            {
+                "select": "id",
+                "id": f"in.({','.join(job_ids)})",
+                "user_id": f"eq.{user.user_id}",
+            },
+        )
+        if {str(row.get("id")) for row in owned} != set(job_ids):
+            raise HTTPException(status_code=400, detail="Invalid job_id for current user")
+
+    # Validate every name before queueing any, so a bad batch is all-or-nothing.
+    names = [normalize_event_name(event.event_name) for event in body.events]
+    for event, name in zip(body.events, names):
+        record_analytics_event(
+            user_id=user.user_id,
+            event_name=name,
+            job_id=event.job_id,
+            stage_number=event.stage_number,
+            properties=event.properties,
+        )
+    return {"ok": True, "accepted": len(body.events)}
+
+
 @app.get("/analytics/events")
 async def get_analytics_events(
     user: AuthenticatedUser = Depends(require_user),
@@ -488,6 +600,36 @@ async def get_analytics_events(
     return {"events": rows}
 
 
+@app.post("/webhooks/apify")
+async def apify_webhook(request: Request) -> dict:
+    webhook_secret = get_optional_env("APIFY_WEBHOOK_SECRET")
+    if not webhook_secret:
+        raise HTTPException(status_code=503, detail="Apify webhooks are not configured")
+    provided = request.headers.get(WEBHOOK_SECRET_HEADER) or ""
+    if not hmac.compare_digest(provided.encode("utf-8"), webhook_secret.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid Apify webhook secret")
+
+    payload = await request.body()
+    try:
+        event = loads(payload)
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Invalid webhook JSON") from exc
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Invalid webhook JSON")
+
+    signal = run_signal_from_payload(event)
+    if signal is None:
+        return {"ok": True, "ignored": True, "reason": "missing_run_id"}
+
+    try:
+        receivers = await publish_run_signal(signal)
+    except Exception as exc:
+        # Apify retries failed webhook deliveries; the worker also falls back
+        # to long-polling the run if no signal arrives.
+        raise HTTPException(status_code=503, detail="Run signal could not be published") from exc
+    return {"ok": True, "run_id": signal["run_id"], "receivers": receivers}
+
+
 @app.post("/webhooks/stripe")
 async def stripe_webhook(request: Request) -> dict:
     sig_header = request.headers.get("stripe-signature")
@@ -499,7 +641,7 @@ async def stripe_webhook(request: Request) -> dict:
     verify_stripe_signature(payload, sig_header, webhook_secret)
 
     try:
-        event = json.loads(payload.decode("utf-8"))
+        event = loads(payload)
     except json.JSONDecodeError as exc:
         raise HTTPException(status_code=400, detail="Invalid webhook JSON") from exc
 
@@ -599,7 +741,7 @@ async def stripe_webhook(request: Request) -> dict:
     applied = bool(resolved.get("applied")) if isinstance(resolved, dict) else False
     reason = str(resolved.get("reason") or "") if isinstance(resolved, dict) else ""
 
-    await record_analytics_event(
+    record_analytics_event(
         user_id=user_id,
         event_name="stripe_checkout_completed",
         properties={
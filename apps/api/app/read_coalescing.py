@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from .config import get_optional_env, read_int_env
+
+
+ReadKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def read_key(table: str, params: dict[str, str]) -> ReadKey:
+    return table, tuple(sorted((str(k), str(v)) for k, v in params.items()))
+
+
+class ReadCoalescer:
+    """Singleflight (plus an optional micro-TTL cache) for identical REST reads.
+
+    Callers asking for the same (table, params) while a request is in flight
+    share it and each decode the same response body, so nobody sees another
+    caller's mutations. Tables listed in `cache_tables` keep the body for
+    `cache_ttl_seconds` after it arrives. Any write through this process to a
+    table drops its cached bodies and detaches its in-flight reads, so a read
+    issued after a write never reuses a response fetched before it.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        cache_tables: frozenset[str] = frozenset(),
+        cache_ttl_seconds: float = 0.0,
+        max_cache_entries: int = 1024,
+    ) -> None:
+        self.enabled = enabled
+        self.cache_tables = cache_tables
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.max_cache_entries = max(max_cache_entries, 1)
+        self.stats = {"fetches": 0, "coalesced": 0, "cache_hits": 0}
+        self._inflight: dict[ReadKey, asyncio.Task[bytes]] = {}
+        self._cache: dict[ReadKey, tuple[float, bytes]] = {}
+
+    async def read(self, table: str, params: dict[str, str], fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        if not self.enabled:
+            self.stats["fetches"] += 1
+            return await fetch()
+
+        key = read_key(table, params)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self.stats["cache_hits"] += 1
+                return cached[1]
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["fetches"] += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+        else:
+            self.stats["coalesced"] += 1
+        # shield: one caller giving up must not cancel the others' request.
+        return await asyncio.shield(task)
+
+    def _settle(self, key: ReadKey, task: asyncio.Task[bytes]) -> None:
+        failed = task.cancelled() or task.exception() is not None
+        if self._inflight.get(key) is not task:
+            return  # detached by a write; don't cache what it returned
+        del self._inflight[key]
+        if failed:
+            return
+        if key[0] in self.cache_tables and self.cache_ttl_seconds > 0:
+            while len(self._cache) >= self.max_cache_entries:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = (time.monotonic() + self.cache_ttl_seconds, task.result())
+
+    def invalidate(self, table: str | None = None) -> None:
+        """Forget reads of `table` (every table when None) after a write."""
+        for store in (self._inflight, self._cache):
+            for key in [k for k in store if table is None or k[0] == table]:
+                del store[key]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"inflight": len(self._inflight), "cached": len(self._cache), **self.stats}
+
+
+_coalescers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ReadCoalescer] = weakref.WeakKeyDictionary()
+
+
+def get_read_coalescer() -> ReadCoalescer:
+    loop = asyncio.get_running_loop()
+    coalescer = _coalescers.get(loop)
+    if coalescer is None:
+        raw_tables = get_optional_env("SUPABASE_READ_CACHE_TABLES", "") or ""
+        coalescer = ReadCoalescer(
+            enabled=(get_optional_env("SUPABASE_READ_COALESCING", "on") or "on").strip().lower() != "off",
+            cache_tables=frozenset(t.strip() for t in raw_tables.split(",") if t.strip()),
+            cache_ttl_seconds=read_int_env("SUPABASE_READ_CACHE_TTL_MS", 1000, minimum=0, maximum=60000) / 1000.0,
+        )
+        _coalescers[loop] = coalescer
+    return coalescer
@@ -5,6 +5,8 @@ from typing import Any
 import httpx
 
 from .config import get_env
+from .json_codec import dumps, loads
+from .read_coalescing import get_read_coalescer
 
 
 def _rest_base_url() -> str:
@@ -21,25 +23,58 @@ def _service_headers() -> dict[str, str]:
     }
 
 
-async def insert_one(table: str, row: dict[str, Any]) -> dict[str, Any]:
+# Writes take `returning`: the columns to send back ("*" for the whole row,
+# like PostgREST's `select`), or None for `Prefer: return=minimal`, in which
+# case nothing comes back and the helpers return [] / {} / None.
+def _write_options(
+    params: dict[str, str] | None, returning: str | None
+) -> tuple[dict[str, str] | None, dict[str, str]]:
+    if returning is None:
+        return params, {**_service_headers(), "Prefer": "return=minimal"}
+    if returning.strip() != "*":
+        params = {**(params or {}), "select": returning}
+    return params, {**_service_headers(), "Prefer": "return=representation"}
+
+
+def _rows(resp: httpx.Response) -> list[dict[str, Any]]:
+    if not resp.content:
+        return []
+    data = loads(resp.content)
+    return data if isinstance(data, list) else [data]
+
+
+async def insert_one(table: str, row: dict[str, Any], *, returning: str | None = "*") -> dict[str, Any]:
+    rows = await insert_many(table, [row], returning=returning)
+    return rows[0] if rows else {}
+
+
+async def insert_many(
+    table: str, rows: list[dict[str, Any]], *, returning: str | None = "*"
+) -> list[dict[str, Any]]:
+    if not rows:
+        return []
     url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
+    params, headers = _write_options(None, returning)
     async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(url, headers=headers, json=row)
+        resp = await client.post(url, headers=headers, params=params, content=dumps(rows))
+    get_read_coalescer().invalidate(table)
     resp.raise_for_status()
-    data = resp.json()
-    if isinstance(data, list):
-        return data[0] if data else {}
-    return data
+    return _rows(resp)
 
 
-async def select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+async def _get(table: str, params: dict[str, str]) -> bytes:
     url = f"{_rest_base_url()}/{table}"
     headers = _service_headers()
     async with httpx.AsyncClient(timeout=15.0) as client:
         resp = await client.get(url, headers=headers, params=params)
     resp.raise_for_status()
-    data = resp.json()
+    return resp.content
+
+
+async def select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+    # Identical concurrent reads share one request (see read_coalescing).
+    body = await get_read_coalescer().read(table, params, lambda: _get(table, params))
+    data = loads(body)
     if isinstance(data, list):
         return data
     return [data]
@@ -56,22 +91,26 @@ async def update_many(
     table: str,
     match_params: dict[str, str],
     patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
 ) -> list[dict[str, Any]]:
     url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
+    params, headers = _write_options(match_params, returning)
     async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.patch(url, headers=headers, params=match_params, json=patch)
+        resp = await client.patch(url, headers=headers, params=params, content=dumps(patch))
+    get_read_coalescer().invalidate(table)
     resp.raise_for_status()
-    data = resp.json()
-    return data if isinstance(data, list) else [data]
+    return _rows(resp)
 
 
 async def update_one(
     table: str,
     match_params: dict[str, str],
     patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
 ) -> dict[str, Any] | None:
-    rows = await update_many(table, match_params, patch)
+    rows = await update_many(table, match_params, patch, returning=returning)
     if not rows:
         return None
     return rows[0]
@@ -81,6 +120,7 @@ async def rpc(function_name: str, params: dict[str, Any]) -> Any:
     url = f"{_rest_base_url()}/rpc/{function_name}"
     headers = {**_service_headers(), "Prefer": "return=representation"}
     async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(url, headers=headers, json=params)
+        resp = await client.post(url, headers=headers, content=dumps(params))
+    get_read_coalescer().invalidate()
     resp.raise_for_status()
-    return resp.json()
+    return loads(resp.content)
@@ -5,7 +5,7 @@ import { Eye, Package, Trophy, Users, Wrench } from "lucide-react";
 import { useEffect, useMemo, useState } from "react";
 import { useParams, useRouter } from "next/navigation";
 
-import { trackEvent } from "@/lib/api";
+import { getStageDebug, trackEvent } from "@/lib/api";
 import { getSupabaseClient } from "@/lib/supabase/client";
 
 type JobRow = {
@@ -80,6 +80,8 @@ export default function JobPage() {
   const [notesInput, setNotesInput] = useState("");
   const [saveMessage, setSaveMessage] = useState<string | null>(null);
   const [isSavingExperiment, setIsSavingExperiment] = useState(false);
+  // Debug artifacts by stage number, fetched when a stage's JSON is opened.
+  const [stageDebug, setStageDebug] = useState<Record<number, unknown>>({});
 
   const title = useMemo(() => {
     if (!jobId) return "Job";
@@ -263,6 +265,22 @@ export default function JobPage() {
     }
   }
 
+  async function loadStageDebug(stage: JobStageRow) {
+    if (!jobId || stage.stage_number in stageDebug) return;
+    if (!asRecord(stage.output)?.debug_artifact) return;
+    setStageDebug((current) => ({ ...current, [stage.stage_number]: "Loading..." }));
+    try {
+      const { data: sessionData } = await getSupabaseClient().auth.getSession();
+      const accessToken = sessionData.session?.access_token;
+      if (!accessToken) throw new Error("Not signed in.");
+      const artifact = await getStageDebug({ accessToken, jobId, stageNumber: stage.stage_number });
+      setStageDebug((current) => ({ ...current, [stage.stage_number]: artifact.debug }));
+    } catch (reason) {
+      const message = reason instanceof Error ? reason.message : "Failed to load debug artifact.";
+      setStageDebug((current) => ({ ...current, [stage.stage_number]: message }));
+    }
+  }
+
   return (
     <div className="space-y-6">
       <section className="space-y-1">
@@ -284,6 +302,8 @@ export default function JobPage() {
           {STAGE_META.map((metadata) => {
             const row = stageMap.get(metadata.number);
             const status = row?.status ?? "pending";
+            const provisional =
+              status === "in_progress" && stageOutputMap.get(metadata.number)?.provisional === true;
             return (
               <div
                 key={metadata.number}
@@ -291,7 +311,9 @@ export default function JobPage() {
               >
                 <div className="font-semibold">Stage {metadata.number}</div>
                 <div className="mt-1">{metadata.label}</div>
-                <div className="mt-2 uppercase tracking-wide">{status}</div>
+                <div className="mt-2 uppercase tracking-wide">
+                  {provisional ? "provisional" : status}
+                </div>
               </div>
             );
           })}
@@ -519,6 +541,9 @@ export default function JobPage() {
                 key={stage.id}
                 className="rounded-xl border border-zinc-200 bg-zinc-50 p-4 text-sm dark:border-zinc-800 dark:bg-black"
                 open={stage.status === "failed"}
+                onToggle={(event) => {
+                  if (event.currentTarget.open) void loadStageDebug(stage);
+                }}
               >
                 <summary className="flex cursor-pointer list-none items-center justify-between gap-2">
                   <span className="font-medium">
@@ -531,6 +556,11 @@ export default function JobPage() {
                 <pre className="mt-3 overflow-x-auto whitespace-pre-wrap text-xs text-zinc-700 dark:text-zinc-300">
                   {JSON.stringify(stage.output, null, 2)}
                 </pre>
+                {stage.stage_number in stageDebug ? (
+                  <pre className="mt-3 overflow-x-auto whitespace-pre-wrap border-t border-zinc-200 pt-3 text-xs text-zinc-500 dark:border-zinc-800 dark:text-zinc-400">
+                    {JSON.stringify(stageDebug[stage.stage_number], null, 2)}
+                  </pre>
+                ) : null}
               </details>
             ))
           ) : (
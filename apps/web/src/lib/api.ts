@@ -36,6 +36,13 @@ export type RecentExperiment = {
   change_tags: string[] | null;
 };
 
+export type StageDebugArtifact = {
+  job_id: string;
+  stage_number: number;
+  content_hash: string;
+  debug: Record<string, unknown>;
+};
+
 export type AnalyticsEventRow = {
   event_name: string;
   stage_number: number | null;
@@ -189,6 +196,37 @@ export async function trackEvent(params: {
   }
 }
 
+export async function trackEvents(params: {
+  accessToken: string;
+  events: {
+    eventName: string;
+    jobId?: string;
+    stageNumber?: number;
+    properties?: Record<string, unknown>;
+  }[];
+}): Promise<void> {
+  if (params.events.length === 0) return;
+  const resp = await fetch(`${API_BASE_URL}/analytics/events/batch`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Authorization: `Bearer ${params.accessToken}`,
+    },
+    body: JSON.stringify({
+      events: params.events.map((event) => ({
+        event_name: event.eventName,
+        job_id: event.jobId ?? null,
+        stage_number: event.stageNumber ?? null,
+        properties: event.properties ?? {},
+      })),
+    }),
+  });
+
+  if (!resp.ok) {
+    throw new Error(`Analytics batch failed (${resp.status})`);
+  }
+}
+
 export async function getRecentJobs(params: {
   accessToken: string;
   limit?: number;
@@ -266,3 +304,30 @@ export async function getAnalyticsEvents(params: {
 
   return (await resp.json()) as { events: AnalyticsEventRow[] };
 }
+
+export async function getStageDebug(params: {
+  accessToken: string;
+  jobId: string;
+  stageNumber: number;
+}): Promise<StageDebugArtifact> {
+  const path = `/jobs/${encodeURIComponent(params.jobId)}/stages/${params.stageNumber}/debug`;
+  const resp = await fetch(`${API_BASE_URL}${path}`, {
+    method: "GET",
+    headers: {
+      Authorization: `Bearer ${params.accessToken}`,
+    },
+  });
+
+  if (!resp.ok) {
+    let detail = `HTTP ${resp.status}`;
+    try {
+      const body = (await resp.json()) as { detail?: string };
+      if (body.detail) detail = body.detail;
+    } catch {
+      // ignore
+    }
+    throw new Error(detail);
+  }
+
+  return (await resp.json()) as StageDebugArtifact;
+}
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .config import get_optional_env, read_int_env
+from .storage import insert_many
+
+
+TABLE = "analytics_events"
+RETRYABLE_HTTP_STATUSES = {408, 425, 429}
+
+
+def default_spool_path() -> Path:
+    raw = get_optional_env("ANALYTICS_SPOOL_PATH")
+    if raw:
+        return Path(raw)
+    return Path(tempfile.gettempdir()) / "worker-analytics-spool.ndjson"
+
+
+def _is_rejected_batch(exc: Exception) -> bool:
+    # A 4xx other than throttling (PostgREST), or a data or constraint error
+    # (SQLSTATE class 22/23, postgres backend), means a row is bad, not that
+    # the DB is down.
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return 400 <= status < 500 and status not in RETRYABLE_HTTP_STATUSES
+    return str(getattr(exc, "sqlstate", None) or "")[:2] in ("22", "23")
+
+
+class AnalyticsBuffer:
+    """Write-behind buffer for analytics_events rows.
+
+    `add` never waits on the database: rows from every running job are
+    queued and written with one `insert_many` per batch, when the batch is
+    full or every `flush_interval_seconds`. A batch that cannot be written
+    (DB slow or down) is appended to an NDJSON spool file, which is replayed
+    after the next successful flush. A batch PostgREST rejects (bad row) is
+    retried row by row so one bad event doesn't hold back the others.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_batch: int,
+        flush_interval_seconds: float,
+        spool_path: Path,
+        spool_max_bytes: int,
+        insert_timeout_seconds: float = 10.0,
+    ) -> None:
+        self.max_batch = max(max_batch, 1)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self.insert_timeout_seconds = insert_timeout_seconds
+        self.stats = {"inserted": 0, "spooled": 0, "replayed": 0, "dropped": 0}
+        self._rows: list[dict[str, Any]] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._late_spools: set[asyncio.Task[None]] = set()
+        self._closed = False
+
+    def add(self, row: dict[str, Any]) -> None:
+        if self._closed:
+            task = asyncio.get_running_loop().create_task(self._spool([row]))
+            self._late_spools.add(task)
+            task.add_done_callback(self._late_spools.discard)
+            return
+        self._rows.append(row)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if len(self._rows) >= self.max_batch:
+            self._wake.set()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_seconds)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"worker: analytics flush error: {e}", file=sys.stderr, flush=True)
+
+    async def _insert(self, rows: list[dict[str, Any]]) -> None:
+        async with asyncio.timeout(self.insert_timeout_seconds):
+            await insert_many(TABLE, rows, returning=None)
+
+    async def _write(self, rows: list[dict[str, Any]]) -> bool:
+        """Insert `rows`; False if the DB is unavailable and they should be spooled."""
+        try:
+            await self._insert(rows)
+            self.stats["inserted"] += len(rows)
+            return True
+        except Exception as e:
+            if not _is_rejected_batch(e):
+                return False
+        for row in rows:
+            try:
+                await self._insert([row])
+                self.stats["inserted"] += 1
+            except Exception as e:
+                if not _is_rejected_batch(e):
+                    return False
+                self.stats["dropped"] += 1
+                print(f"worker: analytics event rejected: {e}", file=sys.stderr, flush=True)
+        return True
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._rows:
+                batch, self._rows = self._rows[: self.max_batch], self._rows[self.max_batch :]
+                if not await self._write(batch):
+                    # DB is unhappy: park everything queued so far on disk.
+                    # Rows added while the spool write runs stay queued.
+                    pending, self._rows = batch + self._rows, []
+                    await self._spool(pending)
+                    return
+            await self._replay_spool()
+
+    async def _spool(self, rows: list[dict[str, Any]]) -> None:
+        data = "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode("utf-8")
+        try:
+            # File I/O runs in a thread so a slow disk doesn't stall the loop.
+            written = await asyncio.to_thread(self._append_to_spool, data)
+        except OSError as e:
+            written = False
+            print(f"worker: analytics spool error: {e}", file=sys.stderr, flush=True)
+        self.stats["spooled" if written else "dropped"] += len(rows)
+
+    def _append_to_spool(self, data: bytes) -> bool:
+        size = self.spool_path.stat().st_size if self.spool_path.exists() else 0
+        if size + len(data) > self.spool_max_bytes:
+            return False
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.spool_path.open("ab") as f:
+            f.write(data)
+        return True
+
+    def _take_spool(self, replaying: Path) -> list[str]:
+        # Move the spool aside first so events spooled during the replay go to
+        # a fresh file. A .replaying file left by a replay that never finished
+        # (crash, cancellation) still holds unsent events, so the spool is
+        # appended to it instead of renamed over it.
+        if self.spool_path.exists():
+            if replaying.exists():
+                with replaying.open("ab") as f:
+                    f.write(self.spool_path.read_bytes())
+                self.spool_path.unlink()
+            else:
+                os.replace(self.spool_path, replaying)
+        if not replaying.exists():
+            return []
+        return replaying.read_text(encoding="utf-8").splitlines()
+
+    async def _replay_spool(self) -> None:
+        replaying = self.spool_path.with_name(self.spool_path.name + ".replaying")
+        try:
+            lines = await asyncio.to_thread(self._take_spool, replaying)
+        except OSError:
+            return
+        if not lines:
+            return
+        rows: list[dict[str, Any]] = []
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict):
+                rows.append(row)
+        for i in range(0, len(rows), self.max_batch):
+            batch = rows[i : i + self.max_batch]
+            if not await self._write(batch):
+                await self._spool(rows[i:])
+                break
+            self.stats["replayed"] += len(batch)
+        await asyncio.to_thread(replaying.unlink, missing_ok=True)
+
+    async def close(self) -> None:
+        """Stop the flusher and write (or spool) whatever is still queued."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"queued": len(self._rows), **self.stats}
+
+
+_buffers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AnalyticsBuffer] = weakref.WeakKeyDictionary()
+
+
+def get_analytics_buffer() -> AnalyticsBuffer:
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = AnalyticsBuffer(
+            max_batch=read_int_env("ANALYTICS_BATCH_SIZE", 200, minimum=1, maximum=5000),
+            flush_interval_seconds=float(
+                read_int_env("ANALYTICS_FLUSH_INTERVAL_MS", 2000, minimum=50, maximum=600000)
+            )
+            / 1000.0,
+            spool_path=default_spool_path(),
+            spool_max_bytes=read_int_env(
+                "ANALYTICS_SPOOL_MAX_BYTES", 50_000_000, minimum=0, maximum=10_000_000_000
+            ),
+        )
+        _buffers[loop] = buffer
+    return buffer
+
+
+async def close_analytics_buffer() -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    buffer = _buffers.pop(loop, None)
+    if buffer is not None:
+        await buffer.close()
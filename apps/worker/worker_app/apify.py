@@ -0,0 +1,709 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import re
+import time
+import weakref
+from typing import Any
+
+from .config import get_optional_env, read_int_env
+from .http_clients import APIFY, get_client
+
+
+TERMINAL_RUN_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+
+# How run completion is observed: fixed-interval polling, Apify-side
+# long-polling (waitForFinish), the run-sync-get-dataset-items endpoint, or a
+# webhook relayed by the API over Redis.
+COMPLETION_MODES = ("poll", "wait", "sync", "webhook")
+WAIT_FOR_FINISH_MAX_SECONDS = 60
+SYNC_RUN_MAX_SECONDS = 300
+WEBHOOK_SECRET_HEADER = "X-Apify-Webhook-Secret"
+WEBHOOK_EVENT_TYPES = [
+    "ACTOR.RUN.SUCCEEDED",
+    "ACTOR.RUN.FAILED",
+    "ACTOR.RUN.ABORTED",
+    "ACTOR.RUN.TIMED_OUT",
+]
+
+# Official Apify actor format; we use a minimal input that extracts only
+# what our pipeline needs and keeps payload small.
+PAGE_FUNCTION = """
+async function pageFunction(context) {
+  const { request } = context;
+  const clean = (v) => (v || '').replace(/\\s+/g, ' ').trim();
+  const titleNode = document.querySelector('#productTitle');
+  const title = clean(titleNode ? titleNode.textContent : '');
+
+  const bullets = Array.from(
+    document.querySelectorAll('#feature-bullets li span.a-list-item')
+  ).map((el) => clean(el.textContent || '')).filter(Boolean).slice(0, 10);
+
+  const landingImage = document.querySelector('#landingImage');
+  const mainImage = landingImage ? landingImage.getAttribute('src') : null;
+
+  const imageUrls = [];
+  for (const el of Array.from(document.querySelectorAll('[data-old-hires]'))) {
+    const v = clean(el.getAttribute('data-old-hires') || '');
+    if (v && !imageUrls.includes(v)) imageUrls.push(v);
+    if (imageUrls.length >= 15) break;
+  }
+  if (mainImage && !imageUrls.includes(mainImage)) imageUrls.unshift(mainImage);
+
+  return {
+    url: request.url,
+    asin: (request.url.match(/\\/dp\\/([A-Z0-9]{10})/i) || [null, null])[1],
+    title,
+    bullets,
+    main_image_url: mainImage,
+    image_urls: imageUrls.slice(0, 15),
+  };
+}
+""".strip()
+
+_run_slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def apify_api_base_url() -> str:
+    base_url = get_optional_env("APIFY_API_BASE_URL", "https://api.apify.com/v2") or "https://api.apify.com/v2"
+    return base_url.rstrip("/")
+
+
+def amazon_product_url(asin: str) -> str:
+    return f"https://www.amazon.com/dp/{asin}"
+
+
+def build_run_input(urls: list[str]) -> dict[str, Any]:
+    return {
+        "startUrls": [{"url": u} for u in urls],
+        "maxPagesPerCrawl": len(urls),
+        "maxRequestsPerCrawl": len(urls),
+        "proxyConfiguration": {"useApifyProxy": True},
+        "pageFunction": PAGE_FUNCTION,
+    }
+
+
+def _run_slot() -> asyncio.Semaphore:
+    # Caps concurrent actor runs across all jobs (Apify plans limit them).
+    loop = asyncio.get_running_loop()
+    slot = _run_slots.get(loop)
+    if slot is None:
+        slot = asyncio.Semaphore(read_int_env("APIFY_MAX_CONCURRENT_RUNS", 4, minimum=1, maximum=100))
+        _run_slots[loop] = slot
+    return slot
+
+
+def normalize_image_urls(raw_item: dict[str, Any]) -> list[str]:
+    out: list[str] = []
+    candidates = [
+        raw_item.get("image_urls"),
+        raw_item.get("images"),
+        raw_item.get("gallery"),
+        raw_item.get("galleryImages"),
+    ]
+    for value in candidates:
+        if isinstance(value, list):
+            for v in value:
+                if isinstance(v, str) and v and v not in out:
+                    out.append(v)
+                elif isinstance(v, dict):
+                    for key in ("url", "src", "hiRes", "large"):
+                        u = v.get(key)
+                        if isinstance(u, str) and u and u not in out:
+                            out.append(u)
+                            break
+
+    # Try common single-image fields too.
+    for key in ("main_image_url", "mainImage", "image", "imageUrl"):
+        u = raw_item.get(key)
+        if isinstance(u, str) and u and u not in out:
+            out.insert(0, u)
+            break
+
+    return out[:15]
+
+
+def asin_from_item(item: dict[str, Any]) -> str | None:
+    raw = item.get("asin")
+    if isinstance(raw, str) and raw.strip():
+        return raw.strip().upper()
+    url = item.get("url")
+    if isinstance(url, str):
+        m = re.search(r"/dp/([A-Z0-9]{10})", url, re.IGNORECASE)
+        if m:
+            return m.group(1).upper()
+    return None
+
+
+def listing_from_item(asin: str, url: str, item: Any, run_id: str | None) -> dict[str, Any]:
+    if not isinstance(item, dict):
+        return {
+            "asin": asin,
+            "url": url,
+            "ok": False,
+            "provider": "apify_actor",
+            "error": "Apify actor output was not an object.",
+        }
+
+    title = item.get("title")
+    bullets = item.get("bullets")
+    image_urls = normalize_image_urls(item)
+    main_image_url = item.get("main_image_url") if isinstance(item.get("main_image_url"), str) else None
+    if not main_image_url and image_urls:
+        main_image_url = image_urls[0]
+
+    ok = bool(title) and bool(main_image_url)
+    out: dict[str, Any] = {
+        "asin": asin,
+        "url": str(item.get("url") or url),
+        "ok": ok,
+        "provider": "apify_actor",
+        "apify_run_id": run_id,
+        "title": str(title) if title else None,
+        "bullets": [str(x) for x in bullets[:10]] if isinstance(bullets, list) else [],
+        "main_image_url": main_image_url,
+        "image_urls": image_urls,
+    }
+    if not ok:
+        out["error"] = "Apify actor returned incomplete listing payload."
+    return out
+
+
+async def abort_run(run_id: str, apify_api_key: str) -> None:
+    try:
+        await get_client(APIFY).post(
+            f"{apify_api_base_url()}/actor-runs/{run_id}/abort",
+            params={"token": apify_api_key},
+            timeout=10.0,
+        )
+    except Exception:
+        return
+
+
+def _run_state(run_obj: Any) -> tuple[str | None, str | None, str | None]:
+    if not isinstance(run_obj, dict):
+        return None, None, None
+    status = str(run_obj["status"]) if run_obj.get("status") else None
+    d_id = run_obj.get("defaultDatasetId")
+    dataset_id = d_id if isinstance(d_id, str) and d_id else None
+    status_message = (
+        str(run_obj.get("statusMessage")) if run_obj.get("statusMessage") is not None else None
+    )
+    return status, dataset_id, status_message
+
+
+def _finished_run(status: str, dataset_id: str | None, status_message: str | None) -> dict[str, Any]:
+    if status != "SUCCEEDED":
+        return {
+            "ok": False,
+            "apify_status": status,
+            "error": (
+                f"Apify run did not succeed (status={status})."
+                + (f" {status_message}" if status_message else "")
+            ),
+        }
+    if not dataset_id:
+        return {"ok": False, "error": "Apify run succeeded but default dataset id is missing."}
+    return {"ok": True, "dataset_id": dataset_id}
+
+
+def completion_mode() -> str:
+    mode = (get_optional_env("APIFY_COMPLETION_MODE", "poll") or "poll").strip().lower()
+    if mode not in COMPLETION_MODES:
+        return "poll"
+    if mode == "webhook" and not (
+        get_optional_env("APIFY_WEBHOOK_URL") and get_optional_env("APIFY_WEBHOOK_SECRET")
+    ):
+        # Without a reachable receiver the webhook would never arrive.
+        return "wait"
+    return mode
+
+
+def build_webhooks_param(request_url: str, secret: str) -> str:
+    # Ad-hoc run webhooks are passed base64-encoded on the start-run call.
+    spec = [
+        {
+            "eventTypes": WEBHOOK_EVENT_TYPES,
+            "requestUrl": request_url,
+            "headersTemplate": json.dumps({WEBHOOK_SECRET_HEADER: secret}),
+        }
+    ]
+    return base64.b64encode(json.dumps(spec).encode("utf-8")).decode("ascii")
+
+
+def webhook_signal_key(run_id: str) -> str:
+    # Shared with apps/api/app/apify_webhooks.py.
+    return f"apify:run:{run_id}"
+
+
+_signal_redis: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any] = weakref.WeakKeyDictionary()
+
+
+def get_signal_redis() -> Any:
+    loop = asyncio.get_running_loop()
+    client = _signal_redis.get(loop)
+    if client is None:
+        from redis import asyncio as redis_asyncio
+
+        client = redis_asyncio.from_url(
+            get_optional_env("REDIS_URL", "redis://localhost:6379/0") or "redis://localhost:6379/0"
+        )
+        _signal_redis[loop] = client
+    return client
+
+
+async def _start_run(
+    actor_id: str,
+    apify_api_key: str,
+    run_input: dict[str, Any],
+    *,
+    extra_params: dict[str, str] | None = None,
+) -> dict[str, Any]:
+    try:
+        start_resp = await get_client(APIFY).post(
+            f"{apify_api_base_url()}/acts/{actor_id}/runs",
+            params={"token": apify_api_key, **(extra_params or {})},
+            json=run_input,
+            timeout=90.0,
+        )
+    except Exception as e:
+        return {"ok": False, "error": f"Apify start run failed: {e}"}
+
+    if start_resp.status_code not in {200, 201}:
+        return {
+            "ok": False,
+            "http_status": start_resp.status_code,
+            "error": f"Apify actor start failed with HTTP {start_resp.status_code}.",
+        }
+
+    start_data = start_resp.json() if start_resp.content else {}
+    run_data = start_data.get("data") if isinstance(start_data, dict) else None
+    run_id = run_data.get("id") if isinstance(run_data, dict) else None
+    if not isinstance(run_id, str) or not run_id:
+        return {"ok": False, "error": "Apify start response missing run id."}
+    return {"ok": True, "run_id": run_id, "run": run_data}
+
+
+async def _wait_for_run(
+    run_id: str,
+    apify_api_key: str,
+    *,
+    wait_for_finish_seconds: int = 0,
+    deadline: float | None = None,
+) -> dict[str, Any]:
+    """Poll the run until it is terminal.
+
+    With `wait_for_finish_seconds` each GET long-polls on Apify's side
+    (`waitForFinish`), so a run usually completes within one request.
+    """
+    status = "RUNNING"
+    default_dataset_id: str | None = None
+    status_message: str | None = None
+    if deadline is None:
+        run_timeout_seconds = float(read_int_env("APIFY_RUN_TIMEOUT_SECONDS", 180, minimum=30, maximum=900))
+        deadline = time.monotonic() + run_timeout_seconds
+    poll_interval_seconds = float(read_int_env("APIFY_POLL_INTERVAL_SECONDS", 2, minimum=1, maximum=30))
+    client = get_client(APIFY)
+    requests = 0
+
+    try:
+        while time.monotonic() < deadline:
+            params = {"token": apify_api_key}
+            if wait_for_finish_seconds > 0:
+                remaining = max(int(deadline - time.monotonic()), 1)
+                params["waitForFinish"] = str(min(wait_for_finish_seconds, remaining))
+            requested_at = time.monotonic()
+            run_resp = await client.get(
+                f"{apify_api_base_url()}/actor-runs/{run_id}",
+                params=params,
+                timeout=30.0 + wait_for_finish_seconds,
+            )
+            requests += 1
+            if run_resp.status_code >= 400:
+                return {
+                    "ok": False,
+                    "http_status": run_resp.status_code,
+                    "error": f"Apify run polling returned HTTP {run_resp.status_code}.",
+                    "requests": requests,
+                }
+            run_payload = run_resp.json() if run_resp.content else {}
+            run_status, d_id, message = _run_state(
+                run_payload.get("data") if isinstance(run_payload, dict) else None
+            )
+            status = run_status or status
+            status_message = message if run_status else status_message
+            default_dataset_id = d_id or default_dataset_id
+
+            if status in TERMINAL_RUN_STATUSES:
+                break
+            if wait_for_finish_seconds <= 0 or time.monotonic() - requested_at < 1.0:
+                # Plain polling, or a server that answered a long poll early.
+                await asyncio.sleep(poll_interval_seconds)
+    except Exception as e:
+        return {"ok": False, "error": f"Apify run polling failed: {e}", "requests": requests}
+
+    return {**_finished_run(status, default_dataset_id, status_message), "requests": requests}
+
+
+async def _wait_for_webhook(run_id: str, apify_api_key: str, *, deadline: float) -> dict[str, Any]:
+    """Block until the API's /webhooks/apify receiver signals this run.
+
+    The API publishes the run state on a Redis channel and also stores it
+    under the same key briefly, so a webhook that lands before we subscribe
+    is not lost. Falls back to long-polling if Redis is unavailable or the
+    signal never arrives.
+    """
+    key = webhook_signal_key(run_id)
+    signal: dict[str, Any] | None = None
+    try:
+        redis = get_signal_redis()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(key)
+        try:
+            cached = await redis.get(key)
+            if cached:
+                signal = json.loads(cached)
+            while signal is None and time.monotonic() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=min(max(deadline - time.monotonic(), 0.01), 5.0),
+                )
+                if message and message.get("type") == "message":
+                    signal = json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        signal = None
+
+    if isinstance(signal, dict) and signal.get("status") in TERMINAL_RUN_STATUSES:
+        result = _finished_run(
+            str(signal["status"]),
+            signal.get("default_dataset_id") if isinstance(signal.get("default_dataset_id"), str) else None,
+            signal.get("status_message") if isinstance(signal.get("status_message"), str) else None,
+        )
+        return {**result, "requests": 0, "webhook_signalled": True}
+
+    waited = await _wait_for_run(
+        run_id,
+        apify_api_key,
+        wait_for_finish_seconds=WAIT_FOR_FINISH_MAX_SECONDS,
+        deadline=max(deadline, time.monotonic() + 1.0),
+    )
+    return {**waited, "webhook_signalled": False}
+
+
+async def _fetch_dataset_items(dataset_id: str, apify_api_key: str) -> dict[str, Any]:
+    try:
+        items_resp = await get_client(APIFY).get(
+            f"{apify_api_base_url()}/datasets/{dataset_id}/items",
+            params={
+                "token": apify_api_key,
+                "clean": "true",
+                "format": "json",
+            },
+            timeout=60.0,
+        )
+    except Exception as e:
+        return {"ok": False, "error": f"Apify dataset fetch failed: {e}"}
+
+    if items_resp.status_code != 200:
+        return {
+            "ok": False,
+            "http_status": items_resp.status_code,
+            "error": f"Apify dataset items failed with HTTP {items_resp.status_code}.",
+        }
+
+    try:
+        body = items_resp.json()
+    except json.JSONDecodeError:
+        body = []
+    return {"ok": True, "items": body if isinstance(body, list) else []}
+
+
+def run_timeout_seconds(url_count: int = 1) -> int:
+    """How long one actor run over `url_count` URLs may take.
+
+    APIFY_RUN_TIMEOUT_SECONDS is the budget for one URL; a batched run gets
+    that per URL, up to APIFY_BATCH_RUN_TIMEOUT_SECONDS.
+    """
+    single = read_int_env("APIFY_RUN_TIMEOUT_SECONDS", 180, minimum=30, maximum=900)
+    if url_count <= 1:
+        return single
+    batch_cap = read_int_env("APIFY_BATCH_RUN_TIMEOUT_SECONDS", 600, minimum=30, maximum=3600)
+    return max(single, min(single * url_count, batch_cap))
+
+
+async def _run_sync(
+    actor_id: str,
+    apify_api_key: str,
+    run_input: dict[str, Any],
+    run_timeout_seconds: int,
+) -> dict[str, Any]:
+    # One request: Apify runs the actor and answers with its dataset items.
+    # The endpoint gives us no run id, so a cancelled caller cannot abort it.
+    run_timeout_seconds = min(run_timeout_seconds, SYNC_RUN_MAX_SECONDS)
+    try:
+        resp = await get_client(APIFY).post(
+            f"{apify_api_base_url()}/acts/{actor_id}/run-sync-get-dataset-items",
+            params={
+                "token": apify_api_key,
+                "timeout": str(run_timeout_seconds),
+                "clean": "true",
+                "format": "json",
+            },
+            json=run_input,
+            timeout=float(run_timeout_seconds) + 30.0,
+        )
+    except Exception as e:
+        return {"ok": False, "error": f"Apify sync run failed: {e}"}
+
+    if resp.status_code == 408:
+        return {
+            "ok": False,
+            "http_status": 408,
+            "apify_status": "TIMED-OUT",
+            "error": "Apify sync run did not finish within the timeout.",
+        }
+    if resp.status_code not in {200, 201}:
+        return {
+            "ok": False,
+            "http_status": resp.status_code,
+            "error": f"Apify sync run failed with HTTP {resp.status_code}.",
+        }
+    try:
+        body = resp.json()
+    except json.JSONDecodeError:
+        body = []
+    return {"ok": True, "items": body if isinstance(body, list) else []}
+
+
+async def _run_async(
+    actor_id: str,
+    apify_api_key: str,
+    run_input: dict[str, Any],
+    mode: str,
+    run_timeout_seconds: int,
+) -> dict[str, Any]:
+    deadline = time.monotonic() + run_timeout_seconds
+    extra_params: dict[str, str] = {}
+    if mode == "wait":
+        extra_params["waitForFinish"] = str(WAIT_FOR_FINISH_MAX_SECONDS)
+    elif mode == "webhook":
+        extra_params["webhooks"] = build_webhooks_param(
+            str(get_optional_env("APIFY_WEBHOOK_URL")),
+            str(get_optional_env("APIFY_WEBHOOK_SECRET")),
+        )
+
+    started = await _start_run(actor_id, apify_api_key, run_input, extra_params=extra_params)
+    requests = 1
+    if not started["ok"]:
+        return {**started, "requests": requests}
+    run_id = str(started["run_id"])
+    try:
+        status, dataset_id, status_message = _run_state(started.get("run"))
+        if status in TERMINAL_RUN_STATUSES:
+            # waitForFinish on the start call already covered the whole run.
+            waited = _finished_run(str(status), dataset_id, status_message)
+        elif mode == "webhook":
+            waited = await _wait_for_webhook(run_id, apify_api_key, deadline=deadline)
+        else:
+            waited = await _wait_for_run(
+                run_id,
+                apify_api_key,
+                wait_for_finish_seconds=WAIT_FOR_FINISH_MAX_SECONDS if mode == "wait" else 0,
+                deadline=deadline,
+            )
+        requests += int(waited.pop("requests", 0))
+        signalled = {k: waited[k] for k in ("webhook_signalled",) if k in waited}
+        if not waited["ok"]:
+            return {**waited, "run_id": run_id, "requests": requests}
+        fetched = await _fetch_dataset_items(str(waited["dataset_id"]), apify_api_key)
+        return {**fetched, **signalled, "run_id": run_id, "requests": requests + 1}
+    except asyncio.CancelledError:
+        # Hedged Stage 0 cancels the losing provider; don't leave the actor
+        # run burning compute units after nobody is waiting for it.
+        await abort_run(run_id, apify_api_key)
+        raise
+
+
+async def run_actor(actor_id: str, apify_api_key: str, urls: list[str]) -> dict[str, Any]:
+    """Run the scraper actor over `urls` and return its dataset items.
+
+    Holds one of APIFY_MAX_CONCURRENT_RUNS slots for the whole run. How the
+    run's completion is observed follows APIFY_COMPLETION_MODE. If the caller
+    is cancelled after the run started, the run is aborted. The run's
+    deadline grows with the number of URLs (see run_timeout_seconds).
+    """
+    mode = completion_mode()
+    timeout_seconds = run_timeout_seconds(len(urls))
+    async with _run_slot():
+        started_at = time.monotonic()
+        if mode == "sync":
+            result = await _run_sync(actor_id, apify_api_key, build_run_input(urls), timeout_seconds)
+            result["requests"] = 1
+        else:
+            result = await _run_async(actor_id, apify_api_key, build_run_input(urls), mode, timeout_seconds)
+    result["apify_requests"] = result.pop("requests")
+    result["completion_mode"] = mode
+    result["run_ms"] = round((time.monotonic() - started_at) * 1000.0, 1)
+    return result
+
+
+def run_metrics(run: dict[str, Any]) -> dict[str, Any]:
+    # Per-fetch cost of observing the run, copied onto listing results.
+    out = {
+        "apify_completion_mode": run.get("completion_mode"),
+        "apify_requests": run.get("apify_requests"),
+        "apify_run_ms": run.get("run_ms"),
+    }
+    if "webhook_signalled" in run:
+        out["apify_webhook_signalled"] = run["webhook_signalled"]
+    return out
+
+
+class ApifyBatcher:
+    """Coalesces ASIN fetches from concurrent jobs into multi-URL actor runs.
+
+    Requests arriving within `window_seconds` (or until `max_urls` distinct
+    ASINs are queued) share one run; dataset items are routed back to each
+    waiter by ASIN. A run is aborted once every waiter on it has gone away.
+    """
+
+    def __init__(
+        self,
+        apify_api_key: str,
+        actor_id: str,
+        *,
+        window_seconds: float,
+        max_urls: int,
+    ) -> None:
+        self.apify_api_key = apify_api_key
+        self.actor_id = actor_id
+        self.window_seconds = window_seconds
+        self.max_urls = max(max_urls, 1)
+        self.runs_started = 0
+        self._pending: dict[str, list[asyncio.Future[dict[str, Any]]]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    async def fetch(self, asin: str) -> dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[dict[str, Any]] = loop.create_future()
+        self._pending.setdefault(asin, []).append(future)
+        if len(self._pending) >= self.max_urls:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        def abandon_if_unwanted(_: asyncio.Future[dict[str, Any]]) -> None:
+            if not task.done() and all(f.cancelled() for futs in batch.values() for f in futs):
+                task.cancel()
+
+        for futures in batch.values():
+            for future in futures:
+                future.add_done_callback(abandon_if_unwanted)
+
+    async def _run_batch(self, batch: dict[str, list[asyncio.Future[dict[str, Any]]]]) -> None:
+        # Whatever goes wrong, no waiter is left hanging on its future.
+        try:
+            await self._deliver(batch)
+        except asyncio.CancelledError:
+            for futures in batch.values():
+                for future in futures:
+                    future.cancel()
+            raise
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _deliver(self, batch: dict[str, list[asyncio.Future[dict[str, Any]]]]) -> None:
+        asins = [a for a, futs in batch.items() if any(not f.done() for f in futs)]
+        if not asins:
+            return
+        urls = {asin: amazon_product_url(asin) for asin in asins}
+        self.runs_started += 1
+        try:
+            run = await run_actor(self.actor_id, self.apify_api_key, list(urls.values()))
+        except Exception as e:
+            run = {"ok": False, "error": f"Apify batch run failed: {e}"}
+
+        by_asin: dict[str, Any] = {}
+        for item in run.get("items") or []:
+            if isinstance(item, dict):
+                item_asin = asin_from_item(item)
+                if item_asin and item_asin not in by_asin:
+                    by_asin[item_asin] = item
+
+        for asin in asins:
+            url = urls[asin]
+            if not run.get("ok"):
+                result: dict[str, Any] = {
+                    "asin": asin,
+                    "url": url,
+                    "ok": False,
+                    "provider": "apify_actor",
+                    "apify_run_id": run.get("run_id"),
+                    **{k: run[k] for k in ("http_status", "apify_status", "error") if k in run},
+                }
+            elif asin not in by_asin:
+                result = {
+                    "asin": asin,
+                    "url": url,
+                    "ok": False,
+                    "provider": "apify_actor",
+                    "apify_run_id": run.get("run_id"),
+                    "error": "Apify batch run returned no dataset item for this ASIN.",
+                }
+            else:
+                result = listing_from_item(asin, url, by_asin[asin], run.get("run_id"))
+            result.update(run_metrics(run))
+            result["apify_batch_size"] = len(asins)
+            for future in batch[asin]:
+                if not future.done():
+                    future.set_result(dict(result))
+
+
+_batchers: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple[str, str], ApifyBatcher]
+] = weakref.WeakKeyDictionary()
+
+
+def get_batcher(apify_api_key: str, actor_id: str) -> ApifyBatcher | None:
+    """Process-wide batcher when APIFY_BATCH_WINDOW_MS > 0, else None."""
+    window_ms = read_int_env("APIFY_BATCH_WINDOW_MS", 0, minimum=0, maximum=10000)
+    if window_ms <= 0:
+        return None
+    loop = asyncio.get_running_loop()
+    batchers = _batchers.setdefault(loop, {})
+    key = (apify_api_key, actor_id)
+    batcher = batchers.get(key)
+    if batcher is None:
+        batcher = ApifyBatcher(
+            apify_api_key,
+            actor_id,
+            window_seconds=window_ms / 1000.0,
+            max_urls=read_int_env("APIFY_BATCH_MAX_URLS", 20, minimum=1, maximum=200),
+        )
+        batchers[key] = batcher
+    return batcher
@@ -26,3 +26,32 @@ def get_env(name: str) -> str:
 def get_optional_env(name: str, default: str | None = None) -> str | None:
     return os.getenv(name, default)
 
+
+def read_int_env(name: str, default: int, *, minimum: int = 1, maximum: int = 600) -> int:
+    raw = get_optional_env(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        return default
+    if value < minimum:
+        return minimum
+    if value > maximum:
+        return maximum
+    return value
+
+
+def read_float_env(name: str, default: float, *, minimum: float, maximum: float) -> float:
+    raw = get_optional_env(name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        return default
+    if value < minimum:
+        return minimum
+    if value > maximum:
+        return maximum
+    return value
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import random
+from typing import Any
+
+import httpx
+
+from .config import read_int_env
+from .resilience import CircuitBreaker
+
+
+# Statuses PostgREST (or the gateway in front of it) returns for trouble that
+# may clear on its own. 429/503 mean the request was refused before it ran.
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+REFUSED_HTTP_STATUSES = {429, 503}
+
+# The same for the postgres backend, by SQLSTATE (asyncpg errors carry
+# `.sqlstate`): class 08 is a broken connection, 57P0x a restarting server,
+# 53300 no free connections. A serialization failure or deadlock rolled the
+# statement back, so like a refused connection it never took effect.
+TRANSIENT_SQLSTATES = {"57P01", "57P02", "57P03", "53300", "40001", "40P01"}
+REFUSED_SQLSTATES = {"08001", "08004", "57P03", "53300", "40001", "40P01"}
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in TRANSIENT_HTTP_STATUSES
+    if isinstance(exc, (httpx.TransportError, OSError, TimeoutError)):
+        return True
+    sqlstate = str(getattr(exc, "sqlstate", None) or "")
+    return sqlstate.startswith("08") or sqlstate in TRANSIENT_SQLSTATES
+
+
+def never_reached_db(exc: BaseException) -> bool:
+    """True when the request certainly did not run, so even a POST is safe to resend."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in REFUSED_HTTP_STATUSES
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, ConnectionRefusedError)):
+        return True
+    return getattr(exc, "sqlstate", None) in REFUSED_SQLSTATES
+
+
+def should_retry(exc: BaseException, *, idempotent: bool) -> bool:
+    return is_transient(exc) and (idempotent or never_reached_db(exc))
+
+
+def max_retries() -> int:
+    return read_int_env("SUPABASE_MAX_RETRIES", 3, minimum=0, maximum=10)
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (1-based)."""
+    base = read_int_env("SUPABASE_RETRY_BASE_MS", 200, minimum=10, maximum=10000) / 1000.0
+    cap = float(read_int_env("SUPABASE_RETRY_MAX_WAIT_SECONDS", 5, minimum=1, maximum=60))
+    return min(random.uniform(0, base * (2 ** (attempt - 1))), cap)
+
+
+_db_breaker: CircuitBreaker | None = None
+
+
+def get_db_breaker() -> CircuitBreaker:
+    # Process-wide: every job and the claim loop see the same DB.
+    global _db_breaker
+    if _db_breaker is None:
+        _db_breaker = CircuitBreaker(
+            "supabase",
+            failure_threshold=read_int_env("DB_CIRCUIT_FAILURE_THRESHOLD", 5, minimum=1, maximum=100),
+            window_seconds=float(read_int_env("DB_CIRCUIT_WINDOW_SECONDS", 60, minimum=5, maximum=3600)),
+            cooldown_seconds=float(read_int_env("DB_CIRCUIT_COOLDOWN_SECONDS", 15, minimum=1, maximum=3600)),
+        )
+    return _db_breaker
+
+
+class TableStats:
+    """Per-table call, error, retry and latency counters for DB requests."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_error: str | None = None
+
+    def record(self, elapsed_ms: float, *, retries: int, error: BaseException | None) -> None:
+        self.calls += 1
+        self.retries += retries
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if error is not None:
+            self.errors += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else None,
+            "max_ms": round(self.max_ms, 1),
+            "last_error": self.last_error,
+        }
+
+
+_table_stats: dict[str, TableStats] = {}
+
+
+def table_stats(table: str) -> TableStats:
+    stats = _table_stats.get(table)
+    if stats is None:
+        stats = _table_stats[table] = TableStats()
+    return stats
+
+
+def db_health_snapshot() -> dict[str, Any]:
+    return {
+        "circuit": get_db_breaker().snapshot(),
+        "tables": {table: stats.snapshot() for table, stats in sorted(_table_stats.items())},
+    }
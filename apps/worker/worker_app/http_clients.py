@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+from .config import read_float_env, read_int_env
+
+
+# Host classes share one keep-alive pool and one request-rate budget across
+# every in-flight job in the process.
+AMAZON_PAGES = "amazon_pages"
+AMAZON_IMAGES = "amazon_images"
+APIFY = "apify"
+OPENAI = "openai"
+EXTERNAL = "external"
+
+_AMAZON_IMAGE_HOST_SUFFIXES = (
+    "media-amazon.com",
+    "ssl-images-amazon.com",
+    "images-amazon.com",
+)
+
+# (env prefix, default max connections, default rate/s, default burst)
+_HOST_CLASS_DEFAULTS: dict[str, tuple[str, int, float, int]] = {
+    AMAZON_PAGES: ("AMAZON_PAGE", 4, 2.0, 4),
+    AMAZON_IMAGES: ("AMAZON_IMAGE", 8, 20.0, 16),
+    APIFY: ("APIFY_HTTP", 8, 0.0, 1),
+    OPENAI: ("OPENAI_HTTP", 32, 0.0, 1),
+    EXTERNAL: ("EXTERNAL_HTTP", 16, 0.0, 1),
+}
+
+_clients_by_loop: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple[str, str | None], httpx.AsyncClient]
+] = weakref.WeakKeyDictionary()
+_buckets: dict[str, "TokenBucket"] = {}
+_transport_overrides: dict[str, httpx.AsyncBaseTransport] = {}
+
+
+class TokenBucket:
+    """Reservation-style token bucket.
+
+    Callers take a token immediately and sleep for the returned debt, so
+    concurrent waiters are spaced out instead of waking together.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int) -> None:
+        self.rate_per_second = rate_per_second
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        if self.rate_per_second <= 0:
+            return 0.0
+        now = time.monotonic()
+        elapsed = max(now - self.updated_at, 0.0)
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_second)
+        self.tokens -= 1.0
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate_per_second
+
+    async def acquire(self) -> float:
+        wait_seconds = self.reserve()
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+        return wait_seconds
+
+
+def host_class_for_url(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    if host.endswith(_AMAZON_IMAGE_HOST_SUFFIXES):
+        return AMAZON_IMAGES
+    if host == "amazon.com" or host.endswith(".amazon.com"):
+        return AMAZON_PAGES
+    return EXTERNAL
+
+
+def _host_class_settings(host_class: str) -> tuple[int, float, int]:
+    prefix, max_connections, rate, burst = _HOST_CLASS_DEFAULTS.get(
+        host_class, _HOST_CLASS_DEFAULTS[EXTERNAL]
+    )
+    return (
+        read_int_env(f"{prefix}_MAX_CONNECTIONS", max_connections, minimum=1, maximum=256),
+        read_float_env(f"{prefix}_RATE_PER_SECOND", rate, minimum=0.0, maximum=1000.0),
+        read_int_env(f"{prefix}_BURST", burst, minimum=1, maximum=1000),
+    )
+
+
+def _build_client(host_class: str, proxy: str | None) -> httpx.AsyncClient:
+    max_connections, _, _ = _host_class_settings(host_class)
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=30.0,
+    )
+    transport = _transport_overrides.get(host_class)
+    if transport is not None:
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=30.0,
+            follow_redirects=True,
+        )
+    return httpx.AsyncClient(
+        limits=limits,
+        proxy=proxy,
+        timeout=30.0,
+        follow_redirects=True,
+    )
+
+
+def get_client(host_class: str, *, proxy: str | None = None) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    clients = _clients_by_loop.setdefault(loop, {})
+    key = (host_class, proxy)
+    client = clients.get(key)
+    if client is None or client.is_closed:
+        client = _build_client(host_class, proxy)
+        clients[key] = client
+    return client
+
+
+def get_bucket(host_class: str) -> TokenBucket:
+    bucket = _buckets.get(host_class)
+    if bucket is None:
+        _, rate, burst = _host_class_settings(host_class)
+        bucket = TokenBucket(rate, burst)
+        _buckets[host_class] = bucket
+    return bucket
+
+
+async def throttle(host_class: str) -> float:
+    return await get_bucket(host_class).acquire()
+
+
+def set_transport_override(host_class: str, transport: httpx.AsyncBaseTransport | None) -> None:
+    # Used to point a host class at a local fake server (tests, benchmarks).
+    if transport is None:
+        _transport_overrides.pop(host_class, None)
+    else:
+        _transport_overrides[host_class] = transport
+    for clients in _clients_by_loop.values():
+        for key in [k for k in clients if k[0] == host_class]:
+            clients.pop(key, None)
+
+
+def reset_rate_limits() -> None:
+    _buckets.clear()
+
+
+async def aclose_clients() -> None:
+    loop = asyncio.get_running_loop()
+    clients = _clients_by_loop.pop(loop, {})
+    for client in clients.values():
+        await client.aclose()
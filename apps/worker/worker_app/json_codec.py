@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import functools
+import json
+from typing import Any
+
+from .config import get_optional_env
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is the fallback.
+    orjson = None  # type: ignore[assignment]
+
+
+# JSON encode/decode for everything the worker sends to or reads from the
+# database. Stage outputs are large nested dicts, so use orjson when it is
+# installed (`pip install orjson`); JSON_CODEC=json forces the stdlib.
+
+
+@functools.cache
+def backend() -> str:
+    requested = (get_optional_env("JSON_CODEC", "auto") or "auto").strip().lower()
+    if requested == "json" or orjson is None:
+        return "json"
+    return "orjson"
+
+
+def dumps(value: Any, *, sort_keys: bool = False) -> bytes:
+    if backend() == "orjson":
+        # Non-str keys are stringified like json.dumps does.
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(value, option=option)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys).encode("utf-8")
+
+
+def dumps_str(value: Any) -> str:
+    return dumps(value).decode("utf-8")
+
+
+def loads(data: bytes | bytearray | str) -> Any:
+    if backend() == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
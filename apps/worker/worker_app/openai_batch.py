@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import uuid
+import weakref
+from contextvars import ContextVar
+from typing import Any
+
+import httpx
+
+from .config import get_optional_env, read_int_env
+from .http_clients import OPENAI, get_client
+from .openai_client import RETRYABLE_OPENAI_STATUSES, OpenAIHTTPError, backoff_seconds, openai_api_base_url
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+JOB_PRIORITIES = (INTERACTIVE, BULK)
+
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Set by run_pipeline_for_job for the job being processed; stage tasks
+# inherit it, so openai_chat_json knows which execution tier to use.
+llm_tier: ContextVar[str] = ContextVar("llm_tier", default=INTERACTIVE)
+
+
+class OpenAIBatchError(RuntimeError):
+    pass
+
+
+def batch_mode_enabled() -> bool:
+    return (get_optional_env("OPENAI_BATCH_MODE", "auto") or "auto").strip().lower() != "off"
+
+
+def job_priority(job: dict[str, Any] | None) -> str:
+    raw = str((job or {}).get("priority") or INTERACTIVE).strip().lower()
+    return raw if raw in JOB_PRIORITIES else INTERACTIVE
+
+
+def tier_for_job(job: dict[str, Any] | None) -> str:
+    return "batch" if job_priority(job) == BULK and batch_mode_enabled() else INTERACTIVE
+
+
+def build_batch_jsonl(entries: list[tuple[str, dict[str, Any]]]) -> bytes:
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": payload,
+            }
+        )
+        for custom_id, payload in entries
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(raw: str) -> dict[str, dict[str, Any]]:
+    out: dict[str, dict[str, Any]] = {}
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        custom_id = row.get("custom_id") if isinstance(row, dict) else None
+        if isinstance(custom_id, str):
+            out[custom_id] = row
+    return out
+
+
+class BatchCollector:
+    """Collects chat completions from bulk jobs into OpenAI Batch API jobs.
+
+    Requests queued within `window_seconds` (or until `max_requests`) are
+    uploaded as one JSONL file and submitted as a batch; the collector then
+    polls the batch and resolves each caller's future from the output file
+    by custom_id. Callers simply await `submit`, so stage code is the same
+    for both tiers. A batch is cancelled once every waiter on it is gone.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        *,
+        window_seconds: float,
+        max_requests: int,
+        poll_seconds: float,
+        completion_window: str = "24h",
+    ) -> None:
+        self.api_key = api_key
+        self.window_seconds = window_seconds
+        self.max_requests = max(max_requests, 1)
+        self.poll_seconds = poll_seconds
+        self.completion_window = completion_window
+        self.batches_submitted = 0
+        self._pending: list[tuple[str, dict[str, Any], asyncio.Future[dict[str, Any]]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    async def submit(self, payload: dict[str, Any]) -> dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[dict[str, Any]] = loop.create_future()
+        self._pending.append((uuid.uuid4().hex, payload, future))
+        if len(self._pending) >= self.max_requests:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        entries, self._pending = self._pending, []
+        if not entries:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        def abandon_if_unwanted(_: asyncio.Future[dict[str, Any]]) -> None:
+            if not task.done() and all(f.cancelled() for _, _, f in entries):
+                task.cancel()
+
+        for _, _, future in entries:
+            future.add_done_callback(abandon_if_unwanted)
+
+    def _headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def _request(self, method: str, path: str, **kwargs: Any) -> Any:
+        resp = await get_client(OPENAI).request(
+            method,
+            f"{openai_api_base_url()}{path}",
+            headers=self._headers(),
+            timeout=60.0,
+            **kwargs,
+        )
+        if resp.status_code >= 400:
+            raise OpenAIHTTPError(resp.status_code, (resp.text or "")[:300])
+        return resp
+
+    async def _get(self, path: str) -> Any:
+        """GET `path`, retrying 429/5xx and transport errors with backoff.
+
+        Polls and downloads are safe to resend, and a poll loop can run for
+        up to the 24 h completion window, so one blip must not fail the batch.
+        """
+        max_retries = read_int_env("OPENAI_BATCH_MAX_RETRIES", 8, minimum=0, maximum=100)
+        attempt = 0
+        while True:
+            try:
+                return await self._request("GET", path)
+            except (OpenAIHTTPError, httpx.TransportError) as e:
+                transient = not isinstance(e, OpenAIHTTPError) or e.status_code in RETRYABLE_OPENAI_STATUSES
+                attempt += 1
+                if not transient or attempt > max_retries:
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt, None))
+
+    async def _cancel(self, batch_id: str) -> None:
+        # Best effort: an abandoned batch would otherwise run (and bill) to the end.
+        try:
+            await self._request("POST", f"/batches/{batch_id}/cancel")
+        except Exception as e:
+            print(f"worker: batch {batch_id} cancel failed: {e}", file=sys.stderr, flush=True)
+
+    async def _download(self, file_id: str | None) -> dict[str, dict[str, Any]]:
+        if not file_id:
+            return {}
+        resp = await self._get(f"/files/{file_id}/content")
+        return parse_batch_output(resp.text)
+
+    async def _run_batch(
+        self,
+        entries: list[tuple[str, dict[str, Any], asyncio.Future[dict[str, Any]]]],
+    ) -> None:
+        live = [(cid, payload, f) for cid, payload, f in entries if not f.done()]
+        if not live:
+            return
+        batch_id: str | None = None
+        try:
+            uploaded = await self._request(
+                "POST",
+                "/files",
+                data={"purpose": "batch"},
+                files={
+                    "file": (
+                        "batch.jsonl",
+                        build_batch_jsonl([(cid, payload) for cid, payload, _ in live]),
+                        "application/jsonl",
+                    )
+                },
+            )
+            created = await self._request(
+                "POST",
+                "/batches",
+                json={
+                    "input_file_id": uploaded.json()["id"],
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": self.completion_window,
+                },
+            )
+            batch = created.json()
+            batch_id = str(batch["id"])
+            self.batches_submitted += 1
+            while str(batch.get("status")) not in TERMINAL_BATCH_STATUSES:
+                await asyncio.sleep(self.poll_seconds)
+                batch = (await self._get(f"/batches/{batch_id}")).json()
+
+            # Expired batches still deliver whatever finished in time.
+            results = await self._download(batch.get("output_file_id"))
+            errors = await self._download(batch.get("error_file_id"))
+        except asyncio.CancelledError:
+            if batch_id:
+                await self._cancel(batch_id)
+            raise
+        except Exception as e:
+            if batch_id:
+                await self._cancel(batch_id)
+            for _, _, future in live:
+                if not future.done():
+                    future.set_exception(OpenAIBatchError(f"OpenAI batch submission failed: {e}"))
+            return
+
+        for custom_id, _, future in live:
+            if future.done():
+                continue
+            row = results.get(custom_id) or errors.get(custom_id)
+            response = row.get("response") if isinstance(row, dict) else None
+            if isinstance(response, dict) and response.get("status_code") == 200:
+                future.set_result(response.get("body") or {})
+            elif isinstance(response, dict):
+                body = response.get("body")
+                future.set_exception(
+                    OpenAIHTTPError(int(response.get("status_code") or 500), json.dumps(body)[:300])
+                )
+            else:
+                error = row.get("error") if isinstance(row, dict) else None
+                future.set_exception(
+                    OpenAIBatchError(
+                        f"OpenAI batch {batch_id} ended {batch.get('status')} without a result"
+                        + (f": {error}" if error else ".")
+                    )
+                )
+
+
+_collectors: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, BatchCollector]
+] = weakref.WeakKeyDictionary()
+
+
+def get_collector(api_key: str) -> BatchCollector:
+    loop = asyncio.get_running_loop()
+    collectors = _collectors.setdefault(loop, {})
+    collector = collectors.get(api_key)
+    if collector is None:
+        collector = BatchCollector(
+            api_key,
+            window_seconds=float(read_int_env("OPENAI_BATCH_WINDOW_SECONDS", 30, minimum=0, maximum=3600)),
+            max_requests=read_int_env("OPENAI_BATCH_MAX_REQUESTS", 500, minimum=1, maximum=50000),
+            poll_seconds=float(read_int_env("OPENAI_BATCH_POLL_SECONDS", 60, minimum=1, maximum=3600)),
+        )
+        collectors[api_key] = collector
+    return collector
+
+
+async def chat_completion_via_batch(payload: dict[str, Any], *, api_key: str) -> dict[str, Any]:
+    return await get_collector(api_key).submit(payload)
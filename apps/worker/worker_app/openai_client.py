@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import httpx
+
+from .config import get_optional_env, read_int_env
+from .http_clients import OPENAI, get_client
+from .resilience import CircuitBreaker
+
+
+RETRYABLE_OPENAI_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough prompt-size accounting used to reserve TPM before a call; the actual
+# usage reported by the API replaces the estimate afterwards.
+IMAGE_TOKENS_LOW_DETAIL = 85
+IMAGE_TOKENS_HIGH_DETAIL = 765
+DEFAULT_COMPLETION_TOKENS = 600
+
+
+class OpenAIHTTPError(RuntimeError):
+    def __init__(self, status_code: int, snippet: str) -> None:
+        super().__init__(f"OpenAI HTTP {status_code}: {snippet}")
+        self.status_code = status_code
+
+
+class OpenAICircuitOpenError(RuntimeError):
+    pass
+
+
+def openai_api_base_url() -> str:
+    base_url = get_optional_env("OPENAI_API_BASE_URL", "https://api.openai.com/v1") or "https://api.openai.com/v1"
+    return base_url.rstrip("/")
+
+
+def estimate_request_tokens(messages: list[dict[str, Any]]) -> int:
+    chars = 0
+    image_tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if not isinstance(part, dict):
+                continue
+            if part.get("type") == "text":
+                chars += len(str(part.get("text") or ""))
+            elif part.get("type") == "image_url":
+                image = part.get("image_url")
+                detail = image.get("detail") if isinstance(image, dict) else None
+                image_tokens += IMAGE_TOKENS_LOW_DETAIL if detail == "low" else IMAGE_TOKENS_HIGH_DETAIL
+    return chars // 4 + image_tokens + DEFAULT_COMPLETION_TOKENS
+
+
+class QuotaWindow:
+    """Sliding 60 s window of requests and tokens for one model.
+
+    `acquire` queues callers (FIFO) until both the request and token budgets
+    have room, rather than letting them run into a 429. A limit of 0 means
+    unlimited.
+    """
+
+    window_seconds = 60.0
+
+    def __init__(self, rpm_limit: int, tpm_limit: int) -> None:
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.waited_seconds = 0.0
+        self._entries: deque[list[float]] = deque()  # [timestamp, tokens]
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._entries and now - self._entries[0][0] >= self.window_seconds:
+            self._entries.popleft()
+
+    def _wait_needed(self, now: float, tokens: int) -> float:
+        self._prune(now)
+        waits = [0.0]
+        if self.rpm_limit > 0 and len(self._entries) >= self.rpm_limit:
+            oldest = self._entries[len(self._entries) - self.rpm_limit]
+            waits.append(oldest[0] + self.window_seconds - now)
+        if self.tpm_limit > 0:
+            used = sum(int(e[1]) for e in self._entries)
+            # A single request larger than the whole budget still goes through
+            # once the window is empty.
+            excess = used + min(tokens, self.tpm_limit) - self.tpm_limit
+            if excess > 0:
+                freed = 0
+                for ts, entry_tokens in self._entries:
+                    freed += int(entry_tokens)
+                    if freed >= excess:
+                        waits.append(ts + self.window_seconds - now)
+                        break
+        return max(waits)
+
+    async def acquire(self, tokens: int) -> list[float]:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait_seconds = self._wait_needed(now, tokens)
+                if wait_seconds <= 0:
+                    entry = [now, float(tokens)]
+                    self._entries.append(entry)
+                    return entry
+                self.waited_seconds += wait_seconds
+                await asyncio.sleep(wait_seconds)
+
+    def settle(self, entry: list[float], actual_tokens: int | None) -> None:
+        if actual_tokens is not None and actual_tokens >= 0:
+            entry[1] = float(actual_tokens)
+
+    def snapshot(self) -> dict[str, Any]:
+        self._prune(time.monotonic())
+        return {
+            "rpm_limit": self.rpm_limit,
+            "tpm_limit": self.tpm_limit,
+            "requests_in_window": len(self._entries),
+            "tokens_in_window": int(sum(e[1] for e in self._entries)),
+            "queued_seconds_total": round(self.waited_seconds, 3),
+        }
+
+
+class _ModelLimits:
+    def __init__(self, concurrency: int, rpm_limit: int, tpm_limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.quota = QuotaWindow(rpm_limit, tpm_limit)
+
+
+_limits_by_loop: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, _ModelLimits]
+] = weakref.WeakKeyDictionary()
+
+
+def _model_env_suffix(model: str) -> str:
+    return "".join(ch if ch.isalnum() else "_" for ch in model).upper()
+
+
+def _read_model_int(name: str, model: str, default: int, *, minimum: int, maximum: int) -> int:
+    # OPENAI_RPM_LIMIT__GPT_4O_MINI overrides OPENAI_RPM_LIMIT for that model.
+    base = read_int_env(name, default, minimum=minimum, maximum=maximum)
+    return read_int_env(f"{name}__{_model_env_suffix(model)}", base, minimum=minimum, maximum=maximum)
+
+
+def get_model_limits(model: str) -> _ModelLimits:
+    loop = asyncio.get_running_loop()
+    by_model = _limits_by_loop.setdefault(loop, {})
+    limits = by_model.get(model)
+    if limits is None:
+        limits = _ModelLimits(
+            _read_model_int("OPENAI_MAX_CONCURRENT_PER_MODEL", model, 8, minimum=1, maximum=256),
+            _read_model_int("OPENAI_RPM_LIMIT", model, 0, minimum=0, maximum=1_000_000),
+            _read_model_int("OPENAI_TPM_LIMIT", model, 0, minimum=0, maximum=100_000_000),
+        )
+        by_model[model] = limits
+    return limits
+
+
+def limits_snapshot() -> dict[str, Any]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return {}
+    return {model: limits.quota.snapshot() for model, limits in _limits_by_loop.get(loop, {}).items()}
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_model_breaker(model: str) -> CircuitBreaker:
+    # Process-wide, not per loop: an outage seen by one job should short-cut
+    # every other job's LLM calls too.
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            f"openai:{model}",
+            failure_threshold=_read_model_int("OPENAI_CIRCUIT_FAILURE_THRESHOLD", model, 5, minimum=1, maximum=100),
+            window_seconds=_read_model_int("OPENAI_CIRCUIT_WINDOW_SECONDS", model, 120, minimum=5, maximum=3600),
+            cooldown_seconds=_read_model_int("OPENAI_CIRCUIT_COOLDOWN_SECONDS", model, 30, minimum=1, maximum=3600),
+        )
+        _breakers[model] = breaker
+    return breaker
+
+
+def circuit_snapshot(model: str) -> dict[str, Any]:
+    return get_model_breaker(model).snapshot()
+
+
+def _counts_against_circuit(exc: BaseException) -> bool:
+    # Only provider-side trouble opens the circuit; a malformed request or a
+    # bad key is our bug and would fail the same way on every probe.
+    if isinstance(exc, OpenAIHTTPError):
+        return exc.status_code in RETRYABLE_OPENAI_STATUSES
+    return isinstance(exc, httpx.TransportError)
+
+
+def parse_retry_after(headers: httpx.Headers) -> float | None:
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(float(raw_ms) / 1000.0, 0.0)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(float(raw), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _is_retryable(resp: httpx.Response) -> bool:
+    if resp.status_code not in RETRYABLE_OPENAI_STATUSES:
+        return False
+    if resp.status_code == 429 and "insufficient_quota" in (resp.text or ""):
+        # Billing problem, not congestion; retrying only delays the fallback.
+        return False
+    return True
+
+
+def backoff_seconds(attempt: int, retry_after: float | None) -> float:
+    max_wait = float(read_int_env("OPENAI_RETRY_MAX_WAIT_SECONDS", 30, minimum=1, maximum=300))
+    if retry_after is not None:
+        return min(retry_after, max_wait)
+    base = read_int_env("OPENAI_RETRY_BASE_MS", 500, minimum=50, maximum=10000) / 1000.0
+    return min(random.uniform(0, base * (2 ** (attempt - 1))), max_wait)
+
+
+async def chat_completion(
+    payload: dict[str, Any],
+    *,
+    api_key: str,
+    timeout_seconds: float = 60.0,
+) -> dict[str, Any]:
+    """POST /chat/completions through the shared pool with per-model limits.
+
+    Waits for a concurrency slot and RPM/TPM room for the model, then retries
+    429/5xx and connection failures with jittered backoff (honoring
+    Retry-After) up to OPENAI_MAX_RETRIES times, all within timeout_seconds.
+    Returns the decoded body.
+
+    While the model's circuit is open this raises OpenAICircuitOpenError
+    immediately so stages fall back to heuristics without waiting out a
+    timeout; one half-open probe is let through per cooldown.
+    """
+    model = str(payload.get("model") or "")
+    breaker = get_model_breaker(model)
+    if not breaker.allow():
+        raise OpenAICircuitOpenError(f"OpenAI circuit open for model {model}; skipped call.")
+    try:
+        data = await _chat_completion_with_retries(payload, model, api_key, timeout_seconds)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if _counts_against_circuit(e):
+            reason = f"http_{e.status_code}" if isinstance(e, OpenAIHTTPError) else type(e).__name__
+            breaker.record_failure(reason)
+        elif isinstance(e, OpenAIHTTPError):
+            # OpenAI answered; the request itself was the problem.
+            breaker.record_success()
+        else:
+            # Never heard from OpenAI (our own timeout, an unreadable body):
+            # no verdict, but let the next call probe.
+            breaker.release_probe()
+        raise
+    breaker.record_success()
+    return data
+
+
+async def _chat_completion_with_retries(
+    payload: dict[str, Any],
+    model: str,
+    api_key: str,
+    timeout_seconds: float,
+) -> dict[str, Any]:
+    limits = get_model_limits(model)
+    max_retries = read_int_env("OPENAI_MAX_RETRIES", 3, minimum=0, maximum=10)
+    estimated_tokens = estimate_request_tokens(payload.get("messages") or [])
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    client = get_client(OPENAI)
+    url = f"{openai_api_base_url()}/chat/completions"
+
+    # timeout_seconds bounds the whole call: queueing for a slot, every
+    # attempt and the backoff between them.
+    deadline = time.monotonic() + timeout_seconds
+    attempt = 0
+    while True:
+        attempt += 1
+        async with limits.semaphore:
+            entry = await limits.quota.acquire(estimated_tokens)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                limits.quota.settle(entry, 0)
+                raise TimeoutError(f"OpenAI call for {model} ran out of its {timeout_seconds:.0f}s budget.")
+            try:
+                resp = await client.post(url, headers=headers, json=payload, timeout=remaining)
+            except (httpx.ConnectError, httpx.RemoteProtocolError, httpx.PoolTimeout) as e:
+                limits.quota.settle(entry, 0)
+                if attempt > max_retries:
+                    raise
+                retry_after = None
+                resp = None
+                failure: Exception = e
+
+        if resp is not None:
+            if resp.status_code < 400:
+                data = resp.json()
+                usage = data.get("usage") if isinstance(data, dict) else None
+                total = usage.get("total_tokens") if isinstance(usage, dict) else None
+                limits.quota.settle(entry, int(total) if isinstance(total, int) else None)
+                return data
+            failure = OpenAIHTTPError(resp.status_code, (resp.text or "")[:300])
+            if attempt > max_retries or not _is_retryable(resp):
+                raise failure
+            retry_after = parse_retry_after(resp.headers)
+
+        delay = backoff_seconds(attempt, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise failure  # no time left for another attempt
+        # Sleep outside the semaphore so queued calls for the model can use it.
+        await asyncio.sleep(delay)
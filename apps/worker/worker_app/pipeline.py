@@ -1,18 +1,27 @@
 from __future__ import annotations
 
 import asyncio
-import hashlib
 import html
 import json
 import re
+import sys
+import time
 from datetime import datetime, timezone
-from pathlib import Path
+from collections.abc import Awaitable, Callable
 from typing import Any
 
 import httpx
 
-from .config import get_optional_env
-from .supabase_rest import insert_many, insert_one, select_many, select_one, update_many
+from . import apify, openai_batch, openai_client, vision_images
+from .analytics_buffer import get_analytics_buffer
+from .config import get_optional_env, read_int_env
+from .http_clients import AMAZON_PAGES, get_client, host_class_for_url, throttle
+from .prompt_registry import PROMPTS_DIR, get_prompt_registry
+from .proxy_pool import get_proxy_pool, redact_proxy_url
+from .resilience import CircuitBreaker, NegativeCache
+from .stage_artifacts import artifacts_enabled, slim_stage_output, split_stage_output
+from .stage_graph import ABORT_JOB, JobBudget, StageContext, StageOutcome, StageSpec, run_stage_graph
+from .storage import insert_many, is_missing_function, rpc, select_many, select_one, update_many
 
 
 STAGES: list[tuple[int, str]] = [
@@ -24,7 +33,6 @@ STAGES: list[tuple[int, str]] = [
     (5, "verdict"),
 ]
 
-PROMPTS_DIR = Path(__file__).resolve().parents[3] / "prompts"
 RETRYABLE_HTTP_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
 
 
@@ -54,21 +62,6 @@ def duration_ms(started_at: str | None, completed_at: str | None) -> int | None:
     return max(int(delta), 0)
 
 
-def read_int_env(name: str, default: int, *, minimum: int = 1, maximum: int = 600) -> int:
-    raw = get_optional_env(name)
-    if raw is None:
-        return default
-    try:
-        value = int(raw)
-    except ValueError:
-        return default
-    if value < minimum:
-        return minimum
-    if value > maximum:
-        return maximum
-    return value
-
-
 def should_retry_apify_result(result: dict[str, Any]) -> bool:
     http_status = result.get("http_status")
     if isinstance(http_status, int) and http_status in RETRYABLE_HTTP_STATUSES:
@@ -105,10 +98,8 @@ async def record_analytics_event(
         row["job_id"] = job_id
     if stage_number is not None:
         row["stage_number"] = stage_number
-    try:
-        await insert_one("analytics_events", row)
-    except Exception:
-        return
+    # Written behind, in batches; never on the stage's critical path.
+    get_analytics_buffer().add(row)
 
 
 def clamp01(value: float) -> float:
@@ -155,12 +146,10 @@ def normalize_ws(raw: str) -> str:
 
 
 def load_prompt(prompt_rel_path: str) -> str:
-    path = PROMPTS_DIR / prompt_rel_path
-    return path.read_text(encoding="utf-8")
-
-
-def sha256_hex(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    entry = get_prompt_registry().get(prompt_rel_path)
+    if entry is None:
+        raise FileNotFoundError(f"Prompt not found: {PROMPTS_DIR / prompt_rel_path}")
+    return entry.content
 
 
 def normalize_sha256(value: Any) -> str | None:
@@ -206,21 +195,29 @@ def load_prompt_with_integrity(
     job: dict[str, Any] | None,
     prompt_rel_path: str,
 ) -> tuple[str, dict[str, Any]]:
-    prompt = load_prompt(prompt_rel_path)
-    actual_hash = sha256_hex(prompt)
+    # Content and hash come precomputed from the in-memory registry.
+    entry = get_prompt_registry().get(prompt_rel_path)
+    if entry is None:
+        raise FileNotFoundError(f"Prompt not found: {PROMPTS_DIR / prompt_rel_path}")
     expected_hash = get_expected_prompt_hash(job, prompt_rel_path)
-    if expected_hash and actual_hash != expected_hash:
+    if expected_hash and entry.content_hash != expected_hash:
         raise PromptIntegrityError(
-            f"Prompt hash mismatch for {prompt_rel_path}: expected {expected_hash}, got {actual_hash}"
+            f"Prompt hash mismatch for {prompt_rel_path}: expected {expected_hash}, got {entry.content_hash}"
         )
-    return prompt, {
-        "path": prompt_rel_path,
-        "hash_sha256": actual_hash,
+    return entry.content, {
+        **entry.integrity(),
         "expected_hash_sha256": expected_hash,
         "validated": bool(expected_hash),
     }
 
 
+def stage_prompt_version(output: dict[str, Any]) -> dict[str, Any]:
+    # job_stages.prompt_version_id is only known for DB-backed prompts.
+    integrity = output.get("prompt_integrity")
+    version_id = integrity.get("prompt_version_id") if isinstance(integrity, dict) else None
+    return {"prompt_version_id": version_id} if version_id else {}
+
+
 def _expect(condition: bool, message: str, errors: list[str]) -> None:
     if not condition:
         errors.append(message)
@@ -372,23 +369,15 @@ async def openai_chat_json(
         ],
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-
-    async with httpx.AsyncClient(timeout=timeout_seconds) as client:
-        resp = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload,
+    if openai_batch.llm_tier.get() == "batch":
+        # Bulk jobs wait for the Batch API instead of using synchronous quota.
+        data = await openai_batch.chat_completion_via_batch(payload, api_key=api_key)
+    else:
+        data = await openai_client.chat_completion(
+            payload,
+            api_key=api_key,
+            timeout_seconds=timeout_seconds,
         )
-
-    if resp.status_code >= 400:
-        snippet = (resp.text or "")[:300]
-        raise RuntimeError(f"OpenAI HTTP {resp.status_code}: {snippet}")
-
-    data = resp.json()
     content = (
         data.get("choices", [{}])[0]
         .get("message", {})
@@ -511,274 +500,52 @@ def parse_amazon_listing_html(asin: str, page_html: str, url: str) -> dict[str,
     }
 
 
-def _normalize_apify_image_urls(raw_item: dict[str, Any]) -> list[str]:
-    out: list[str] = []
-    candidates = [
-        raw_item.get("image_urls"),
-        raw_item.get("images"),
-        raw_item.get("gallery"),
-        raw_item.get("galleryImages"),
-    ]
-    for value in candidates:
-        if isinstance(value, list):
-            for v in value:
-                if isinstance(v, str) and v and v not in out:
-                    out.append(v)
-                elif isinstance(v, dict):
-                    for key in ("url", "src", "hiRes", "large"):
-                        u = v.get(key)
-                        if isinstance(u, str) and u and u not in out:
-                            out.append(u)
-                            break
-
-    # Try common single-image fields too.
-    for key in ("main_image_url", "mainImage", "image", "imageUrl"):
-        u = raw_item.get(key)
-        if isinstance(u, str) and u and u not in out:
-            out.insert(0, u)
-            break
-
-    return out[:15]
-
-
 async def fetch_amazon_listing_via_apify(
     asin: str,
     apify_api_key: str,
     actor_id: str,
 ) -> dict[str, Any]:
-    url = f"https://www.amazon.com/dp/{asin}"
-    runs_endpoint = f"https://api.apify.com/v2/acts/{actor_id}/runs"
-
-    # Official Apify actor format; we use a minimal input that extracts only
-    # what our pipeline needs and keeps payload small.
-    page_function = """
-async function pageFunction(context) {
-  const { request } = context;
-  const clean = (v) => (v || '').replace(/\\s+/g, ' ').trim();
-  const titleNode = document.querySelector('#productTitle');
-  const title = clean(titleNode ? titleNode.textContent : '');
-
-  const bullets = Array.from(
-    document.querySelectorAll('#feature-bullets li span.a-list-item')
-  ).map((el) => clean(el.textContent || '')).filter(Boolean).slice(0, 10);
-
-  const landingImage = document.querySelector('#landingImage');
-  const mainImage = landingImage ? landingImage.getAttribute('src') : null;
-
-  const imageUrls = [];
-  for (const el of Array.from(document.querySelectorAll('[data-old-hires]'))) {
-    const v = clean(el.getAttribute('data-old-hires') || '');
-    if (v && !imageUrls.includes(v)) imageUrls.push(v);
-    if (imageUrls.length >= 15) break;
-  }
-  if (mainImage && !imageUrls.includes(mainImage)) imageUrls.unshift(mainImage);
-
-  return {
-    url: request.url,
-    asin: (request.url.match(/\\/dp\\/([A-Z0-9]{10})/i) || [null, null])[1],
-    title,
-    bullets,
-    main_image_url: mainImage,
-    image_urls: imageUrls.slice(0, 15),
-  };
-}
-""".strip()
-
-    payload: dict[str, Any] = {
-        "startUrls": [{"url": url}],
-        "maxPagesPerCrawl": 1,
-        "maxRequestsPerCrawl": 1,
-        "proxyConfiguration": {"useApifyProxy": True},
-        "pageFunction": page_function,
-    }
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            start_resp = await client.post(
-                runs_endpoint,
-                params={"token": apify_api_key},
-                json=payload,
-            )
-    except Exception as e:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "error": f"Apify start run failed: {e}",
-        }
-
-    if start_resp.status_code not in {200, 201}:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "http_status": start_resp.status_code,
-            "provider": "apify_actor",
-            "error": f"Apify actor start failed with HTTP {start_resp.status_code}.",
-        }
-
-    start_data = start_resp.json() if start_resp.content else {}
-    run_data = start_data.get("data") if isinstance(start_data, dict) else None
-    run_id = run_data.get("id") if isinstance(run_data, dict) else None
-    if not isinstance(run_id, str) or not run_id:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "error": "Apify start response missing run id.",
-        }
-
-    status = "RUNNING"
-    default_dataset_id: str | None = None
-    status_message: str | None = None
-    run_timeout_seconds = float(read_int_env("APIFY_RUN_TIMEOUT_SECONDS", 180, minimum=30, maximum=900))
-    poll_interval_seconds = float(read_int_env("APIFY_POLL_INTERVAL_SECONDS", 2, minimum=1, maximum=30))
-    deadline = datetime.now(timezone.utc).timestamp() + run_timeout_seconds
-
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            while datetime.now(timezone.utc).timestamp() < deadline:
-                run_resp = await client.get(
-                    f"https://api.apify.com/v2/actor-runs/{run_id}",
-                    params={"token": apify_api_key},
-                )
-                if run_resp.status_code >= 400:
-                    return {
-                        "asin": asin,
-                        "url": url,
-                        "ok": False,
-                        "provider": "apify_actor",
-                        "apify_run_id": run_id,
-                        "http_status": run_resp.status_code,
-                        "error": f"Apify run polling returned HTTP {run_resp.status_code}.",
-                    }
-                run_payload = run_resp.json() if run_resp.content else {}
-                run_obj = run_payload.get("data") if isinstance(run_payload, dict) else None
-                if isinstance(run_obj, dict):
-                    status = str(run_obj.get("status") or status)
-                    status_message = (
-                        str(run_obj.get("statusMessage"))
-                        if run_obj.get("statusMessage") is not None
-                        else None
-                    )
-                    d_id = run_obj.get("defaultDatasetId")
-                    if isinstance(d_id, str) and d_id:
-                        default_dataset_id = d_id
-
-                if status in {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}:
-                    break
-                await asyncio.sleep(poll_interval_seconds)
-    except Exception as e:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "error": f"Apify run polling failed: {e}",
-        }
-
-    if status != "SUCCEEDED":
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "apify_run_id": run_id,
-            "apify_status": status,
-            "error": (
-                f"Apify run did not succeed (status={status})."
-                + (f" {status_message}" if status_message else "")
-            ),
-        }
-
-    if not default_dataset_id:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "apify_run_id": run_id,
-            "error": "Apify run succeeded but default dataset id is missing.",
-        }
-
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            items_resp = await client.get(
-                f"https://api.apify.com/v2/datasets/{default_dataset_id}/items",
-                params={
-                    "token": apify_api_key,
-                    "clean": "true",
-                    "format": "json",
-                },
-            )
-    except Exception as e:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "apify_run_id": run_id,
-            "error": f"Apify dataset fetch failed: {e}",
-        }
-
-    if items_resp.status_code != 200:
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "apify_run_id": run_id,
-            "http_status": items_resp.status_code,
-            "error": f"Apify dataset items failed with HTTP {items_resp.status_code}.",
-        }
-
-    try:
-        body = items_resp.json()
-    except json.JSONDecodeError:
-        body = []
-
-    if not isinstance(body, list) or not body:
+    batcher = apify.get_batcher(apify_api_key, actor_id)
+    if batcher is not None:
+        return await batcher.fetch(asin)
+
+    url = apify.amazon_product_url(asin)
+    run = await apify.run_actor(actor_id, apify_api_key, [url])
+    if not run.get("ok"):
+        out: dict[str, Any] = {"asin": asin, "url": url, "ok": False, "provider": "apify_actor"}
+        if run.get("run_id"):
+            out["apify_run_id"] = run["run_id"]
+        for key in ("http_status", "apify_status", "error"):
+            if key in run:
+                out[key] = run[key]
+        out.update(apify.run_metrics(run))
+        return out
+
+    items = run.get("items") or []
+    if not items:
         return {
             "asin": asin,
             "url": url,
             "ok": False,
             "provider": "apify_actor",
             "error": "Apify actor returned no dataset items.",
+            **apify.run_metrics(run),
         }
+    return {
+        **apify.listing_from_item(asin, url, items[0], run.get("run_id")),
+        **apify.run_metrics(run),
+    }
 
-    item = body[0]
-    if not isinstance(item, dict):
-        return {
-            "asin": asin,
-            "url": url,
-            "ok": False,
-            "provider": "apify_actor",
-            "error": "Apify actor output was not an object.",
-        }
 
-    title = item.get("title")
-    bullets = item.get("bullets")
-    image_urls = _normalize_apify_image_urls(item)
-    main_image_url = item.get("main_image_url") if isinstance(item.get("main_image_url"), str) else None
-    if not main_image_url and image_urls:
-        main_image_url = image_urls[0]
+_apify_latency_ewma_ms: float | None = None
 
-    ok = bool(title) and bool(main_image_url)
-    out: dict[str, Any] = {
-        "asin": asin,
-        "url": str(item.get("url") or url),
-        "ok": ok,
-        "provider": "apify_actor",
-        "apify_run_id": run_id,
-        "title": str(title) if title else None,
-        "bullets": [str(x) for x in bullets[:10]] if isinstance(bullets, list) else [],
-        "main_image_url": main_image_url,
-        "image_urls": image_urls,
-    }
-    if not ok:
-        out["error"] = "Apify actor returned incomplete listing payload."
-    return out
+
+def _observe_apify_latency(elapsed_ms: float) -> None:
+    global _apify_latency_ewma_ms
+    if _apify_latency_ewma_ms is None:
+        _apify_latency_ewma_ms = elapsed_ms
+    else:
+        _apify_latency_ewma_ms = 0.8 * _apify_latency_ewma_ms + 0.2 * elapsed_ms
 
 
 async def fetch_amazon_listing_via_apify_reliable(
@@ -791,6 +558,7 @@ async def fetch_amazon_listing_via_apify_reliable(
 
     attempts: list[dict[str, Any]] = []
     last_result: dict[str, Any] | None = None
+    started = time.monotonic()
 
     for attempt in range(1, max_attempts + 1):
         result = await fetch_amazon_listing_via_apify(asin, apify_api_key, actor_id)
@@ -800,10 +568,12 @@ async def fetch_amazon_listing_via_apify_reliable(
                 "ok": bool(result.get("ok")),
                 "http_status": result.get("http_status"),
                 "apify_status": result.get("apify_status"),
+                "apify_requests": result.get("apify_requests"),
                 "error": result.get("error"),
             }
         )
         if result.get("ok"):
+            _observe_apify_latency((time.monotonic() - started) * 1000.0)
             result["apify_attempt_count"] = attempt
             result["apify_attempts"] = attempts
             return result
@@ -830,8 +600,13 @@ async def fetch_amazon_listing_via_apify_reliable(
     return fallback
 
 
-async def fetch_amazon_listing(asin: str) -> dict[str, Any]:
-    url = f"https://www.amazon.com/dp/{asin}"
+def amazon_direct_product_url(asin: str) -> str:
+    base_url = get_optional_env("AMAZON_DIRECT_BASE_URL", "https://www.amazon.com") or "https://www.amazon.com"
+    return f"{base_url.rstrip('/')}/dp/{asin}"
+
+
+async def fetch_amazon_listing(asin: str, *, proxy: str | None = None) -> dict[str, Any]:
+    url = amazon_direct_product_url(asin)
     headers = {
         "User-Agent": (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -841,12 +616,24 @@ async def fetch_amazon_listing(asin: str) -> dict[str, Any]:
         "Accept-Language": "en-US,en;q=0.9",
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     }
-    async with httpx.AsyncClient(
-        timeout=25.0,
-        follow_redirects=True,
-        headers=headers,
-    ) as client:
-        resp = await client.get(url)
+    client = get_client(AMAZON_PAGES, proxy=proxy)
+    await throttle(AMAZON_PAGES)
+    try:
+        resp = await client.get(url, headers=headers, timeout=25.0)
+    except httpx.TransportError as e:
+        if not proxy:
+            raise
+        # A dead proxy is a pool problem, not a listing problem; report it so
+        # the caller can rotate to another egress.
+        return {
+            "asin": asin,
+            "url": url,
+            "http_status": None,
+            "ok": False,
+            "blocked": False,
+            "proxy_error": True,
+            "error": f"Proxy request failed: {e.__class__.__name__}",
+        }
 
     page_html = resp.text or ""
     blocked = looks_like_captcha(page_html)
@@ -872,24 +659,112 @@ async def fetch_amazon_listing(asin: str) -> dict[str, Any]:
     return result
 
 
+_direct_fetch_breaker: CircuitBreaker | None = None
+_direct_fetch_negative_cache: NegativeCache[dict[str, Any]] | None = None
+
+
+def get_direct_fetch_breaker() -> CircuitBreaker:
+    global _direct_fetch_breaker
+    if _direct_fetch_breaker is None:
+        _direct_fetch_breaker = CircuitBreaker(
+            "amazon_direct_html",
+            failure_threshold=read_int_env("AMAZON_CIRCUIT_FAILURE_THRESHOLD", 5, minimum=1, maximum=100),
+            window_seconds=float(read_int_env("AMAZON_CIRCUIT_WINDOW_SECONDS", 60, minimum=5, maximum=3600)),
+            cooldown_seconds=float(read_int_env("AMAZON_CIRCUIT_COOLDOWN_SECONDS", 120, minimum=5, maximum=3600)),
+        )
+    return _direct_fetch_breaker
+
+
+def get_direct_fetch_negative_cache() -> NegativeCache[dict[str, Any]]:
+    global _direct_fetch_negative_cache
+    if _direct_fetch_negative_cache is None:
+        _direct_fetch_negative_cache = NegativeCache(
+            float(read_int_env("AMAZON_NEGATIVE_CACHE_TTL_SECONDS", 120, minimum=0, maximum=3600))
+        )
+    return _direct_fetch_negative_cache
+
+
+def _record_direct_fetch_health(breaker: CircuitBreaker, result: dict[str, Any]) -> None:
+    http_status = result.get("http_status")
+    if result.get("blocked"):
+        breaker.record_failure("captcha")
+    elif isinstance(http_status, int) and http_status >= 500:
+        breaker.record_failure(f"http_{http_status}")
+    elif isinstance(http_status, int):
+        # Any non-5xx page (including 404) means Amazon is serving us.
+        breaker.record_success()
+
+
+def _proxy_outcome(result: dict[str, Any]) -> str:
+    if result.get("ok"):
+        return "ok"
+    if result.get("blocked"):
+        return "captcha"
+    return "error"
+
+
 async def fetch_amazon_listing_direct_reliable(asin: str) -> dict[str, Any]:
     max_attempts = read_int_env("DIRECT_FETCH_MAX_ATTEMPTS", 2, minimum=1, maximum=4)
     retry_base_ms = read_int_env("DIRECT_FETCH_RETRY_BASE_MS", 800, minimum=200, maximum=4000)
+    max_rotations = read_int_env("AMAZON_PROXY_MAX_ROTATIONS", 2, minimum=0, maximum=10)
+    pool = get_proxy_pool()
+    breaker = get_direct_fetch_breaker()
+    negative_cache = get_direct_fetch_negative_cache()
     attempts: list[dict[str, Any]] = []
     last_result: dict[str, Any] | None = None
+    tried_proxies: set[str] = set()
+    rotations = 0
+    attempt = 0
 
-    for attempt in range(1, max_attempts + 1):
-        result = await fetch_amazon_listing(asin)
-        attempts.append(
-            {
-                "attempt": attempt,
-                "ok": bool(result.get("ok")),
-                "http_status": result.get("http_status"),
-                "blocked": result.get("blocked"),
-                "error": result.get("error"),
-            }
-        )
+    cached_failure = negative_cache.get(asin)
+    if cached_failure is not None:
+        return {
+            **cached_failure,
+            "asin": asin,
+            "ok": False,
+            "provider": "direct_html",
+            "negative_cache_hit": True,
+            "direct_attempt_count": 0,
+            "direct_attempts": [],
+        }
+
+    while True:
+        if not breaker.allow():
+            if not attempts:
+                return {
+                    "asin": asin,
+                    "ok": False,
+                    "provider": "direct_html",
+                    "circuit_open": True,
+                    "error": "Direct Amazon fetch skipped: circuit breaker is open after repeated blocks.",
+                    "direct_attempt_count": 0,
+                    "direct_attempts": [],
+                }
+            break
+        attempt += 1
+        proxy: str | None = None
+        if pool is not None:
+            proxy = pool.pick(exclude=tried_proxies) or pool.pick()
+        started = time.monotonic()
+        result = await fetch_amazon_listing(asin, proxy=proxy)
+        latency_ms = (time.monotonic() - started) * 1000.0
+        _record_direct_fetch_health(breaker, result)
+        if pool is not None and proxy:
+            pool.record(proxy, _proxy_outcome(result), latency_ms)
+            tried_proxies.add(proxy)
+        attempt_row: dict[str, Any] = {
+            "attempt": attempt,
+            "ok": bool(result.get("ok")),
+            "http_status": result.get("http_status"),
+            "blocked": result.get("blocked"),
+            "error": result.get("error"),
+        }
+        if proxy:
+            attempt_row["proxy"] = redact_proxy_url(proxy)
+            attempt_row["latency_ms"] = int(latency_ms)
+        attempts.append(attempt_row)
         if result.get("ok"):
+            negative_cache.discard(asin)
             result["direct_attempt_count"] = attempt
             result["direct_attempts"] = attempts
             return result
@@ -897,13 +772,25 @@ async def fetch_amazon_listing_direct_reliable(asin: str) -> dict[str, Any]:
         last_result = result
         http_status = result.get("http_status")
         blocked = bool(result.get("blocked"))
+
+        # Blocks and dead proxies are tied to the egress IP: retrying is only
+        # useful through a different proxy, and then needs no backoff.
+        if blocked or result.get("proxy_error"):
+            can_rotate = (
+                pool is not None
+                and rotations < max_rotations
+                and len(tried_proxies) < len(pool)
+            )
+            if not can_rotate:
+                break
+            rotations += 1
+            continue
+
         retryable = isinstance(http_status, int) and http_status in RETRYABLE_HTTP_STATUSES
-        if blocked:
-            retryable = False
-        if attempt >= max_attempts or not retryable:
+        if attempt - rotations >= max_attempts or not retryable:
             break
 
-        backoff_seconds = (retry_base_ms / 1000.0) * (2 ** (attempt - 1))
+        backoff_seconds = (retry_base_ms / 1000.0) * (2 ** (attempt - rotations - 1))
         await asyncio.sleep(min(backoff_seconds, 8.0))
 
     fallback: dict[str, Any] = {
@@ -918,6 +805,15 @@ async def fetch_amazon_listing_direct_reliable(asin: str) -> dict[str, Any]:
         fallback.update(last_result)
         fallback["direct_attempt_count"] = len(attempts)
         fallback["direct_attempts"] = attempts
+        if not last_result.get("proxy_error"):
+            negative_cache.put(
+                asin,
+                {
+                    "http_status": last_result.get("http_status"),
+                    "blocked": bool(last_result.get("blocked")),
+                    "error": last_result.get("error"),
+                },
+            )
     return fallback
 
 
@@ -981,40 +877,50 @@ def guess_image_dimensions(data: bytes) -> tuple[int, int] | None:
     return None
 
 
-async def download_bytes_limited(url: str, max_bytes: int = 2_000_000) -> dict[str, Any]:
+async def download_bytes_limited(
+    url: str,
+    max_bytes: int = 2_000_000,
+    *,
+    keep_data: bool = False,
+) -> dict[str, Any]:
     headers = {"User-Agent": "Mozilla/5.0", "Accept": "*/*"}
     out: dict[str, Any] = {"url": url}
-    async with httpx.AsyncClient(timeout=25.0, follow_redirects=True, headers=headers) as client:
-        async with client.stream("GET", url) as resp:
-            out["http_status"] = resp.status_code
-            if resp.status_code != 200:
-                out["ok"] = False
-                out["error"] = f"HTTP {resp.status_code} downloading image."
-                return out
-
-            content_type = resp.headers.get("content-type")
-            content_length = resp.headers.get("content-length")
-            out["content_type"] = content_type
-            out["content_length"] = int(content_length) if content_length and content_length.isdigit() else None
-
-            chunks: list[bytes] = []
-            total = 0
-            truncated = False
-            async for chunk in resp.aiter_bytes():
-                if not chunk:
-                    continue
-                if total + len(chunk) > max_bytes:
-                    chunks.append(chunk[: max_bytes - total])
-                    total = max_bytes
-                    truncated = True
-                    break
-                chunks.append(chunk)
-                total += len(chunk)
-            data = b"".join(chunks)
+    host_class = host_class_for_url(url)
+    client = get_client(host_class)
+    await throttle(host_class)
+    async with client.stream("GET", url, headers=headers, timeout=25.0) as resp:
+        out["http_status"] = resp.status_code
+        if resp.status_code != 200:
+            out["ok"] = False
+            out["error"] = f"HTTP {resp.status_code} downloading image."
+            return out
+
+        content_type = resp.headers.get("content-type")
+        content_length = resp.headers.get("content-length")
+        out["content_type"] = content_type
+        out["content_length"] = int(content_length) if content_length and content_length.isdigit() else None
+
+        chunks: list[bytes] = []
+        total = 0
+        truncated = False
+        async for chunk in resp.aiter_bytes():
+            if not chunk:
+                continue
+            if total + len(chunk) > max_bytes:
+                chunks.append(chunk[: max_bytes - total])
+                total = max_bytes
+                truncated = True
+                break
+            chunks.append(chunk)
+            total += len(chunk)
+        data = b"".join(chunks)
 
     out["ok"] = True
     out["bytes_downloaded"] = len(data)
     out["truncated"] = truncated
+    if keep_data:
+        # Consumed (and removed) by vision_images.image_part.
+        out["data"] = data
     dims = guess_image_dimensions(data)
     if dims:
         out["width"], out["height"] = dims
@@ -1086,10 +992,133 @@ def text_score(title: str | None, bullets: list[str]) -> dict[str, Any]:
     }
 
 
+async def download_main_image(listing: dict[str, Any]) -> dict[str, Any]:
+    # Only ask for the raw bytes when we will inline them.
+    download_kwargs: dict[str, Any] = (
+        {"keep_data": True} if vision_images.vision_image_mode() == "inline" else {}
+    )
+    return await download_bytes_limited(str(listing.get("main_image_url")), **download_kwargs)
+
+
+def pick_gallery_urls(listing: dict[str, Any], limit: int = 4) -> list[str]:
+    # Many Amazon "image_urls" are alternate sizes of the same image.
+    seen: set[str] = set()
+    picked: list[str] = []
+    for u in listing.get("image_urls") or []:
+        if not isinstance(u, str):
+            continue
+        base = u.split("?", 1)[0]
+        if base in seen:
+            continue
+        seen.add(base)
+        picked.append(u)
+        if len(picked) >= limit:
+            break
+    return picked
+
+
+async def download_gallery_sample(listing: dict[str, Any]) -> list[dict[str, Any]]:
+    picked = pick_gallery_urls(listing)
+    if not picked:
+        return []
+    if vision_images.vision_image_mode() == "inline":
+        return await asyncio.gather(
+            *(
+                download_bytes_limited(u, max_bytes=vision_images.inline_source_max_bytes(), keep_data=True)
+                for u in picked
+            )
+        )
+    return await asyncio.gather(*(download_bytes_limited(u, max_bytes=200_000) for u in picked))
+
+
+def listing_bullets(listing: dict[str, Any]) -> list[Any]:
+    bullets = listing.get("bullets") or []
+    return bullets if isinstance(bullets, list) else []
+
+
+def listing_text_metrics(listing: dict[str, Any]) -> dict[str, Any]:
+    title = listing.get("title")
+    return text_score(str(title) if title else None, [str(x) for x in listing_bullets(listing)][:10])
+
+
+class ListingPrefetch:
+    """Per-ASIN work started as soon as that ASIN's listing lands in Stage 0.
+
+    Stage 0 calls `listing_ready` for each side as its fetch finishes, which
+    starts the main image download and gallery sampling and computes text
+    metrics for that side. Stages 1-3 ask for the per-side results here
+    instead of starting the same work after both listings are in; only the
+    pairwise comparisons wait for both sides. A listing that was not
+    prefetched (or a different listing object) is fetched on demand.
+    """
+
+    def __init__(self) -> None:
+        self._listings: dict[str, dict[str, Any]] = {}
+        self._tasks: dict[tuple[str, str], asyncio.Task[Any]] = {}
+        self._text_metrics: dict[str, dict[str, Any]] = {}
+        self.hits = 0
+
+    def listing_ready(self, side: str, listing: dict[str, Any]) -> None:
+        if not listing.get("ok"):
+            return
+        self._listings[side] = listing
+        if listing.get("main_image_url"):
+            self._tasks[(side, "main_image")] = asyncio.create_task(download_main_image(listing))
+        self._tasks[(side, "gallery")] = asyncio.create_task(download_gallery_sample(listing))
+        self._text_metrics[side] = listing_text_metrics(listing)
+
+    def _prefetched(self, side: str, listing: dict[str, Any]) -> bool:
+        return self._listings.get(side) is listing
+
+    async def main_image(self, side: str, listing: dict[str, Any]) -> dict[str, Any]:
+        task = self._tasks.get((side, "main_image"))
+        if task is not None and self._prefetched(side, listing):
+            self.hits += 1
+            return await task
+        return await download_main_image(listing)
+
+    async def gallery(self, side: str, listing: dict[str, Any]) -> list[dict[str, Any]]:
+        task = self._tasks.get((side, "gallery"))
+        if task is not None and self._prefetched(side, listing):
+            self.hits += 1
+            return await task
+        return await download_gallery_sample(listing)
+
+    def text_metrics(self, side: str, listing: dict[str, Any]) -> dict[str, Any]:
+        if side in self._text_metrics and self._prefetched(side, listing):
+            self.hits += 1
+            return self._text_metrics[side]
+        return listing_text_metrics(listing)
+
+    def close(self) -> None:
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # consumed, so an unused failure isn't logged
+
+
+ProvisionalPublisher = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+async def publish_provisional(
+    on_provisional: ProvisionalPublisher | None,
+    output: dict[str, Any],
+) -> None:
+    """Write a stage's heuristic result while its LLM call is still running."""
+    if on_provisional is None:
+        return
+    try:
+        await on_provisional({**output, "provisional": True})
+    except Exception as e:
+        # Best effort: the final output replaces it either way.
+        print(f"worker: provisional output not written: {e}", file=sys.stderr, flush=True)
+
+
 async def ensure_stage_rows(job_id: str) -> None:
     rows = await select_many(
         "job_stages",
-        {"select": "id,stage_number", "job_id": f"eq.{job_id}"},
+        {"select": "stage_number", "job_id": f"eq.{job_id}"},
     )
     existing = {int(r["stage_number"]) for r in rows if "stage_number" in r}
     missing = [(n, name) for n, name in STAGES if n not in existing]
@@ -1106,6 +1135,7 @@ async def ensure_stage_rows(job_id: str) -> None:
             }
             for n, name in missing
         ],
+        returning=None,
     )
 
 
@@ -1114,6 +1144,7 @@ async def set_job_status(job_id: str, status: str) -> None:
         "jobs",
         {"id": f"eq.{job_id}"},
         {"status": status, "updated_at": utc_now_iso()},
+        returning=None,
     )
 
 
@@ -1125,16 +1156,216 @@ async def mark_stage(job_id: str, stage_number: int, patch: dict[str, Any]) -> N
             "stage_number": f"eq.{stage_number}",
         },
         patch,
+        returning=None,
     )
 
 
-async def stage0_listing_fetch(job: dict[str, Any]) -> dict[str, Any]:
+TRANSITION_RPC_RECHECK_SECONDS = 300.0
+_transition_rpc_missing_at: float | None = None
+
+
+async def transition_stage(
+    job_id: str,
+    stage_number: int | None,
+    patch: dict[str, Any] | None = None,
+    *,
+    user_id: str = "",
+    job_status: str | None = None,
+    event: dict[str, Any] | None = None,
+) -> None:
+    """Apply one stage transition with a single `transition_stage` RPC call.
+
+    The RPC (supabase/migrations/0006_transition_stage.sql) updates the stage
+    row, bumps jobs.updated_at/status and appends the analytics event in one
+    transaction. Until the migration is applied (PostgREST answers 404, direct
+    Postgres raises undefined_function) the same writes go out separately,
+    re-checking every few minutes.
+    """
+    global _transition_rpc_missing_at
+    if (
+        _transition_rpc_missing_at is None
+        or time.monotonic() - _transition_rpc_missing_at >= TRANSITION_RPC_RECHECK_SECONDS
+    ):
+        try:
+            result = await rpc(
+                "transition_stage",
+                {
+                    "p_job_id": job_id,
+                    "p_stage_number": stage_number,
+                    "p_stage_patch": patch or {},
+                    "p_job_status": job_status,
+                    "p_event": event,
+                },
+            )
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            _transition_rpc_missing_at = time.monotonic()
+        else:
+            _transition_rpc_missing_at = None
+            if isinstance(result, dict) and result.get("reason") == "unauthorized":
+                raise RuntimeError("transition_stage RPC rejected the worker's credentials.")
+            return
+
+    if stage_number is not None and patch:
+        await mark_stage(job_id, stage_number, patch)
+    if job_status:
+        await set_job_status(job_id, job_status)
+    if event and user_id:
+        await record_analytics_event(
+            user_id=user_id,
+            job_id=job_id,
+            event_name=str(event["event_name"]),
+            stage_number=event.get("stage_number"),
+            properties=event.get("properties"),
+        )
+
+
+_background_tasks: set[asyncio.Task[Any]] = set()
+
+
+def _spawn_background(coro: Any) -> asyncio.Task[Any]:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _drain_cancelled(tasks: set[asyncio.Task[Any]]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def fetch_listing_hedged(
+    asin: str,
+    apify_api_key: str,
+    actor_id: str,
+    *,
+    hedge_delay_ms: int = 0,
+) -> dict[str, Any]:
+    """Race Apify against the direct HTML fetch; first complete listing wins.
+
+    The direct fetch starts after `hedge_delay_ms`. The loser is cancelled
+    (which aborts its Apify run) in the background so the winner isn't held
+    up by cleanup.
+    """
+    started = time.monotonic()
+    direct_run_ms: list[float] = []
+
+    async def direct_after_delay() -> dict[str, Any]:
+        if hedge_delay_ms:
+            await asyncio.sleep(hedge_delay_ms / 1000.0)
+        direct_started = time.monotonic()
+        try:
+            return await fetch_amazon_listing_direct_reliable(asin)
+        finally:
+            direct_run_ms.append((time.monotonic() - direct_started) * 1000.0)
+
+    names: dict[asyncio.Task[Any], str] = {
+        asyncio.create_task(fetch_amazon_listing_via_apify_reliable(asin, apify_api_key, actor_id)): "apify_actor",
+        asyncio.create_task(direct_after_delay()): "direct_html",
+    }
+    results: dict[str, dict[str, Any]] = {}
+    finished_ms: dict[str, float] = {}
+    winner: str | None = None
+    pending: set[asyncio.Task[Any]] = set(names)
+
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = names[task]
+                finished_ms[name] = (time.monotonic() - started) * 1000.0
+                try:
+                    results[name] = task.result()
+                except Exception as e:
+                    results[name] = {"asin": asin, "ok": False, "provider": name, "error": str(e)}
+                if winner is None and results[name].get("ok"):
+                    winner = name
+    except asyncio.CancelledError:
+        await _drain_cancelled(pending)
+        raise
+
+    cancelled = sorted(names[t] for t in pending)
+    if pending:
+        _spawn_background(_drain_cancelled(pending))
+
+    total_ms = (time.monotonic() - started) * 1000.0
+    apify = results.get("apify_actor", {})
+    direct = results.get("direct_html", {})
+
+    # Savings versus the sequential path (Apify first, direct only after
+    # Apify fails). When Apify was cancelled its duration is unknown, so we
+    # estimate it from the process-wide Apify latency average.
+    latency_saved_ms: float | None = None
+    saved_basis: str | None = None
+    if winner == "direct_html" and "apify_actor" in cancelled:
+        if _apify_latency_ewma_ms is not None:
+            latency_saved_ms = max(_apify_latency_ewma_ms - total_ms, 0.0)
+            saved_basis = "apify_latency_ewma"
+    elif winner == "direct_html" and "apify_actor" in finished_ms and direct_run_ms:
+        latency_saved_ms = max(finished_ms["apify_actor"] + direct_run_ms[0] - total_ms, 0.0)
+        saved_basis = "observed"
+    elif winner == "apify_actor":
+        latency_saved_ms = 0.0
+        saved_basis = "observed"
+
+    hedge: dict[str, Any] = {
+        "mode": "hedged",
+        "hedge_delay_ms": hedge_delay_ms,
+        "winner": winner,
+        "winner_latency_ms": int(finished_ms[winner]) if winner else None,
+        "total_ms": int(total_ms),
+        "cancelled": cancelled,
+        "latency_saved_ms": int(latency_saved_ms) if latency_saved_ms is not None else None,
+        "latency_saved_basis": saved_basis,
+    }
+
+    if winner == "apify_actor":
+        out = dict(apify)
+        out["provider"] = "apify_actor"
+    elif winner == "direct_html":
+        out = dict(direct)
+        out["provider"] = "direct_html_hedged"
+        if apify:
+            out["apify_error"] = apify.get("error")
+            out["apify_attempt_count"] = apify.get("apify_attempt_count")
+            out["apify_attempts"] = apify.get("apify_attempts")
+    else:
+        out = dict(direct or apify)
+        out["provider"] = "direct_html_fallback"
+        out["apify_error"] = apify.get("error")
+        out["apify_http_status"] = apify.get("http_status")
+        out["apify_attempt_count"] = apify.get("apify_attempt_count")
+        out["apify_attempts"] = apify.get("apify_attempts")
+    out["hedge"] = hedge
+    return out
+
+
+class _ListingFetchFailed(Exception):
+    pass
+
+
+async def stage0_listing_fetch(
+    job: dict[str, Any],
+    *,
+    prefetch: ListingPrefetch | None = None,
+) -> dict[str, Any]:
     asin_a = str(job["asin_a"])
     asin_b = str(job["asin_b"])
     apify_api_key = get_optional_env("APIFY_API_KEY")
     actor_id = get_optional_env("APIFY_ACTOR_ID", "apify~web-scraper") or "apify~web-scraper"
+    fetch_mode = (get_optional_env("STAGE0_FETCH_MODE", "sequential") or "sequential").strip().lower()
+    if fetch_mode not in {"sequential", "hedged"}:
+        fetch_mode = "sequential"
+    hedge_delay_ms = read_int_env("STAGE0_HEDGE_DELAY_MS", 0, minimum=0, maximum=60000)
 
     async def fetch_with_provider(asin: str) -> dict[str, Any]:
+        if apify_api_key and fetch_mode == "hedged":
+            return await fetch_listing_hedged(
+                asin, apify_api_key, actor_id, hedge_delay_ms=hedge_delay_ms
+            )
         if apify_api_key:
             via_apify = await fetch_amazon_listing_via_apify_reliable(
                 asin, apify_api_key, actor_id
@@ -1153,8 +1384,41 @@ async def stage0_listing_fetch(job: dict[str, Any]) -> dict[str, Any]:
         direct["provider"] = "direct_html"
         return direct
 
-    a, b = await asyncio.gather(fetch_with_provider(asin_a), fetch_with_provider(asin_b))
+    started = time.monotonic()
+    ready_ms: dict[str, int] = {}
+    listings: dict[str, dict[str, Any]] = {}
+
+    async def fetch_side(side: str, asin: str) -> None:
+        listing = await fetch_with_provider(asin)
+        ready_ms[side] = int((time.monotonic() - started) * 1000.0)
+        listings[side] = listing
+        if not listing.get("ok"):
+            # Stage 0 needs both sides; stop the other fetch (and its Apify run).
+            raise _ListingFetchFailed(side)
+        if prefetch is not None:
+            prefetch.listing_ready(side, listing)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(fetch_side("asin_a", asin_a))
+            tg.create_task(fetch_side("asin_b", asin_b))
+    except BaseExceptionGroup as eg:
+        unexpected = [e for e in eg.exceptions if not isinstance(e, _ListingFetchFailed)]
+        if unexpected:
+            raise unexpected[0] from eg
+
+    def cancelled_side(asin: str) -> dict[str, Any]:
+        return {
+            "asin": asin,
+            "ok": False,
+            "provider": "cancelled",
+            "error": "Cancelled: the other ASIN's listing fetch failed.",
+        }
+
+    a = listings.get("asin_a") or cancelled_side(asin_a)
+    b = listings.get("asin_b") or cancelled_side(asin_b)
     ok = bool(a.get("ok")) and bool(b.get("ok"))
+    proxy_pool = get_proxy_pool()
 
     providers = sorted(
         {
@@ -1167,9 +1431,14 @@ async def stage0_listing_fetch(job: dict[str, Any]) -> dict[str, Any]:
         "ok": ok,
         "provider": "+".join(providers),
         "apify_actor_id": actor_id if apify_api_key else None,
+        "fetch_mode": fetch_mode if apify_api_key else "direct_only",
+        "listing_ready_ms": ready_ms,
         "reliability": {
             "apify_max_attempts": read_int_env("APIFY_MAX_ATTEMPTS", 2, minimum=1, maximum=5),
             "direct_max_attempts": read_int_env("DIRECT_FETCH_MAX_ATTEMPTS", 2, minimum=1, maximum=4),
+            "proxy_pool": proxy_pool.snapshot() if proxy_pool is not None else None,
+            "direct_circuit": get_direct_fetch_breaker().snapshot(),
+            "direct_negative_cache_entries": len(get_direct_fetch_negative_cache()),
         },
         "asin_a": a,
         "asin_b": b,
@@ -1183,6 +1452,9 @@ async def stage0_listing_fetch(job: dict[str, Any]) -> dict[str, Any]:
 async def stage1_main_image_ctr(
     stage0: dict[str, Any],
     job: dict[str, Any] | None = None,
+    *,
+    prefetch: ListingPrefetch | None = None,
+    on_provisional: ProvisionalPublisher | None = None,
 ) -> dict[str, Any]:
     a = stage0["asin_a"]
     b = stage0["asin_b"]
@@ -1196,18 +1468,31 @@ async def stage1_main_image_ctr(
             "reason": "Missing main_image_url from stage 0.",
         }
 
-    meta_a, meta_b = await asyncio.gather(
-        download_bytes_limited(str(url_a)),
-        download_bytes_limited(str(url_b)),
-    )
+    prefetch = prefetch or ListingPrefetch()
+    meta_a, meta_b = await asyncio.gather(prefetch.main_image("asin_a", a), prefetch.main_image("asin_b", b))
     heur_score_a = image_score(meta_a)
     heur_score_b = image_score(meta_b)
+    target_px = vision_images.main_image_target_px()
+    (part_a, transport_a), (part_b, transport_b) = await asyncio.gather(
+        vision_images.image_part(meta_a, target_px=target_px),
+        vision_images.image_part(meta_b, target_px=target_px),
+    )
+
+    heuristic = {
+        "stage_name": "main_image_ctr",
+        "provider": "heuristics",
+        "asin_a": {"image": meta_a, "score": round(heur_score_a, 3)},
+        "asin_b": {"image": meta_b, "score": round(heur_score_b, 3)},
+        "ctr_winner": pick_with_margin(heur_score_a, heur_score_b),
+        "confidence": round(abs(heur_score_a - heur_score_b), 3),
+    }
 
     openai_key = get_optional_env("OPENAI_API_KEY")
     if openai_key:
+        model = get_optional_env("OPENAI_VISION_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
+        await publish_provisional(on_provisional, heuristic)
         try:
             prompt, prompt_integrity = load_prompt_with_integrity(job, "vision-ctr/v1.0.md")
-            model = get_optional_env("OPENAI_VISION_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
             llm = await openai_chat_json(
                 system_prompt=prompt,
                 model=model,
@@ -1222,9 +1507,9 @@ async def stage1_main_image_ctr(
                         ),
                     },
                     {"type": "text", "text": "ASIN A main image"},
-                    {"type": "image_url", "image_url": {"url": str(url_a)}},
+                    part_a,
                     {"type": "text", "text": "ASIN B main image"},
-                    {"type": "image_url", "image_url": {"url": str(url_b)}},
+                    part_b,
                 ],
             )
 
@@ -1254,6 +1539,7 @@ async def stage1_main_image_ctr(
                 "confidence": round(clamp01(safe_float(llm.get("confidence"), abs(score_a - score_b))), 3),
                 "evidence": llm.get("evidence") if isinstance(llm.get("evidence"), list) else [],
                 "prompt_integrity": prompt_integrity,
+                "image_transport": vision_images.transport_summary([transport_a, transport_b]),
                 "notes": [
                     "Vision-scored by OpenAI using prompts/vision-ctr/v1.0.md.",
                     "Heuristic image metadata retained for debugging and fallback context.",
@@ -1267,6 +1553,7 @@ async def stage1_main_image_ctr(
                 "stage_name": "main_image_ctr",
                 "provider": "heuristics_fallback",
                 "fallback_reason": str(e),
+                "openai_circuit": openai_client.circuit_snapshot(model),
                 "asin_a": {"image": meta_a, "score": round(heur_score_a, 3)},
                 "asin_b": {"image": meta_b, "score": round(heur_score_b, 3)},
                 "ctr_winner": pick_with_margin(heur_score_a, heur_score_b),
@@ -1277,12 +1564,7 @@ async def stage1_main_image_ctr(
             }
 
     return {
-        "stage_name": "main_image_ctr",
-        "provider": "heuristics",
-        "asin_a": {"image": meta_a, "score": round(heur_score_a, 3)},
-        "asin_b": {"image": meta_b, "score": round(heur_score_b, 3)},
-        "ctr_winner": pick_with_margin(heur_score_a, heur_score_b),
-        "confidence": round(abs(heur_score_a - heur_score_b), 3),
+        **heuristic,
         "notes": [
             "Heuristic proxy for CTR based on image resolution + aspect ratio.",
             "Set OPENAI_API_KEY to use vision model scoring.",
@@ -1293,41 +1575,54 @@ async def stage1_main_image_ctr(
 async def stage2_gallery_cvr(
     stage0: dict[str, Any],
     job: dict[str, Any] | None = None,
+    *,
+    prefetch: ListingPrefetch | None = None,
+    on_provisional: ProvisionalPublisher | None = None,
 ) -> dict[str, Any]:
     a = stage0["asin_a"]
     b = stage0["asin_b"]
     urls_a = [u for u in (a.get("image_urls") or []) if isinstance(u, str)]
     urls_b = [u for u in (b.get("image_urls") or []) if isinstance(u, str)]
 
-    # Limit downloads; many Amazon "image_urls" are alternate sizes.
-    async def analyze_first(urls: list[str]) -> list[dict[str, Any]]:
-        seen: set[str] = set()
-        picked: list[str] = []
-        for u in urls:
-            base = u.split("?", 1)[0]
-            if base in seen:
-                continue
-            seen.add(base)
-            picked.append(u)
-            if len(picked) >= 4:
-                break
-        if not picked:
-            return []
-        return await asyncio.gather(*(download_bytes_limited(u, max_bytes=200_000) for u in picked))
-
-    imgs_a, imgs_b = await asyncio.gather(analyze_first(urls_a), analyze_first(urls_b))
+    prefetch = prefetch or ListingPrefetch()
+    imgs_a, imgs_b = await asyncio.gather(prefetch.gallery("asin_a", a), prefetch.gallery("asin_b", b))
     score_a_heur = gallery_score(imgs_a)
     score_b_heur = gallery_score(imgs_b)
 
-    # Use the same de-duplicated sampled URLs for vision evaluation.
+    # Use the same de-duplicated sampled images for vision evaluation.
+    target_px = vision_images.gallery_image_target_px()
+    parts_a = await asyncio.gather(
+        *(vision_images.image_part(i, target_px=target_px) for i in imgs_a if isinstance(i.get("url"), str))
+    )
+    parts_b = await asyncio.gather(
+        *(vision_images.image_part(i, target_px=target_px) for i in imgs_b if isinstance(i.get("url"), str))
+    )
     sampled_urls_a = [str(i.get("url")) for i in imgs_a if isinstance(i.get("url"), str)]
     sampled_urls_b = [str(i.get("url")) for i in imgs_b if isinstance(i.get("url"), str)]
 
+    heuristic = {
+        "stage_name": "gallery_cvr",
+        "provider": "heuristics",
+        "asin_a": {
+            "gallery_urls_found": len(urls_a),
+            "sampled_images": imgs_a,
+            "score": round(score_a_heur, 3),
+        },
+        "asin_b": {
+            "gallery_urls_found": len(urls_b),
+            "sampled_images": imgs_b,
+            "score": round(score_b_heur, 3),
+        },
+        "cvr_winner": pick_with_margin(score_a_heur, score_b_heur),
+        "confidence": round(abs(score_a_heur - score_b_heur), 3),
+    }
+
     openai_key = get_optional_env("OPENAI_API_KEY")
     if openai_key and sampled_urls_a and sampled_urls_b:
+        model = get_optional_env("OPENAI_VISION_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
+        await publish_provisional(on_provisional, heuristic)
         try:
             prompt, prompt_integrity = load_prompt_with_integrity(job, "vision-pdp/v1.0.md")
-            model = get_optional_env("OPENAI_VISION_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
 
             content: list[dict[str, Any]] = [
                 {
@@ -1340,12 +1635,12 @@ async def stage2_gallery_cvr(
                     ),
                 }
             ]
-            for idx, u in enumerate(sampled_urls_a, start=1):
+            for idx, (part, _) in enumerate(parts_a, start=1):
                 content.append({"type": "text", "text": f"ASIN A image {idx}"})
-                content.append({"type": "image_url", "image_url": {"url": u}})
-            for idx, u in enumerate(sampled_urls_b, start=1):
+                content.append(part)
+            for idx, (part, _) in enumerate(parts_b, start=1):
                 content.append({"type": "text", "text": f"ASIN B image {idx}"})
-                content.append({"type": "image_url", "image_url": {"url": u}})
+                content.append(part)
 
             llm = await openai_chat_json(
                 system_prompt=prompt,
@@ -1382,6 +1677,7 @@ async def stage2_gallery_cvr(
                 "confidence": round(clamp01(safe_float(llm.get("confidence"), abs(score_a - score_b))), 3),
                 "evidence": llm.get("evidence") if isinstance(llm.get("evidence"), list) else [],
                 "prompt_integrity": prompt_integrity,
+                "image_transport": vision_images.transport_summary([t for _, t in parts_a + parts_b]),
                 "notes": [
                     "Vision-scored by OpenAI using prompts/vision-pdp/v1.0.md.",
                 ],
@@ -1393,6 +1689,7 @@ async def stage2_gallery_cvr(
                 "stage_name": "gallery_cvr",
                 "provider": "heuristics_fallback",
                 "fallback_reason": str(e),
+                "openai_circuit": openai_client.circuit_snapshot(model),
                 "asin_a": {
                     "gallery_urls_found": len(urls_a),
                     "sampled_images": imgs_a,
@@ -1411,20 +1708,7 @@ async def stage2_gallery_cvr(
             }
 
     return {
-        "stage_name": "gallery_cvr",
-        "provider": "heuristics",
-        "asin_a": {
-            "gallery_urls_found": len(urls_a),
-            "sampled_images": imgs_a,
-            "score": round(score_a_heur, 3),
-        },
-        "asin_b": {
-            "gallery_urls_found": len(urls_b),
-            "sampled_images": imgs_b,
-            "score": round(score_b_heur, 3),
-        },
-        "cvr_winner": pick_with_margin(score_a_heur, score_b_heur),
-        "confidence": round(abs(score_a_heur - score_b_heur), 3),
+        **heuristic,
         "notes": [
             "Heuristic proxy for CVR based on gallery count + sampled resolution.",
             "Set OPENAI_API_KEY to use vision model scoring.",
@@ -1435,21 +1719,20 @@ async def stage2_gallery_cvr(
 async def stage3_text_alignment(
     stage0: dict[str, Any],
     job: dict[str, Any] | None = None,
+    *,
+    prefetch: ListingPrefetch | None = None,
+    on_provisional: ProvisionalPublisher | None = None,
 ) -> dict[str, Any]:
     a = stage0["asin_a"]
     b = stage0["asin_b"]
     title_a = a.get("title")
     title_b = b.get("title")
-    bullets_a = a.get("bullets") or []
-    bullets_b = b.get("bullets") or []
-
-    if not isinstance(bullets_a, list):
-        bullets_a = []
-    if not isinstance(bullets_b, list):
-        bullets_b = []
+    bullets_a = listing_bullets(a)
+    bullets_b = listing_bullets(b)
 
-    metrics_a = text_score(str(title_a) if title_a else None, [str(x) for x in bullets_a][:10])
-    metrics_b = text_score(str(title_b) if title_b else None, [str(x) for x in bullets_b][:10])
+    prefetch = prefetch or ListingPrefetch()
+    metrics_a = prefetch.text_metrics("asin_a", a)
+    metrics_b = prefetch.text_metrics("asin_b", b)
     score_a_heur = float(metrics_a["score"])
     score_b_heur = float(metrics_b["score"])
     winner_heur = pick_with_margin(score_a_heur, score_b_heur)
@@ -1459,11 +1742,22 @@ async def stage3_text_alignment(
     kw_b = set(safe_words((title_b or "") + " " + " ".join([str(x) for x in bullets_b])))
     overlap = sorted(list(kw_a.intersection(kw_b)))[:20]
 
+    heuristic = {
+        "stage_name": "text_alignment",
+        "provider": "heuristics",
+        "asin_a": {"metrics": metrics_a, "title": title_a, "bullets": bullets_a[:5]},
+        "asin_b": {"metrics": metrics_b, "title": title_b, "bullets": bullets_b[:5]},
+        "text_winner": winner_heur,
+        "confidence": round(abs(score_a_heur - score_b_heur), 3),
+        "keyword_overlap": overlap,
+    }
+
     openai_key = get_optional_env("OPENAI_API_KEY")
     if openai_key:
+        model = get_optional_env("OPENAI_TEXT_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
+        await publish_provisional(on_provisional, heuristic)
         try:
             prompt, prompt_integrity = load_prompt_with_integrity(job, "text-alignment/v1.0.md")
-            model = get_optional_env("OPENAI_TEXT_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
             llm = await openai_chat_json(
                 system_prompt=prompt,
                 model=model,
@@ -1521,6 +1815,7 @@ async def stage3_text_alignment(
                 "stage_name": "text_alignment",
                 "provider": "heuristics_fallback",
                 "fallback_reason": str(e),
+                "openai_circuit": openai_client.circuit_snapshot(model),
                 "asin_a": {"metrics": metrics_a, "title": title_a, "bullets": bullets_a[:5]},
                 "asin_b": {"metrics": metrics_b, "title": title_b, "bullets": bullets_b[:5]},
                 "text_winner": winner_heur,
@@ -1532,13 +1827,7 @@ async def stage3_text_alignment(
             }
 
     return {
-        "stage_name": "text_alignment",
-        "provider": "heuristics",
-        "asin_a": {"metrics": metrics_a, "title": title_a, "bullets": bullets_a[:5]},
-        "asin_b": {"metrics": metrics_b, "title": title_b, "bullets": bullets_b[:5]},
-        "text_winner": winner_heur,
-        "confidence": round(abs(score_a_heur - score_b_heur), 3),
-        "keyword_overlap": overlap,
+        **heuristic,
         "notes": [
             "Heuristic scoring based on title length + bullet count + bullet scannability.",
             "Set OPENAI_API_KEY to use LLM text scoring.",
@@ -1587,9 +1876,9 @@ async def stage4_avatars(
 
     openai_key = get_optional_env("OPENAI_API_KEY")
     if openai_key:
+        model = get_optional_env("OPENAI_TEXT_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
         try:
             prompt, prompt_integrity = load_prompt_with_integrity(job, "avatar-explanation/v1.0.md")
-            model = get_optional_env("OPENAI_TEXT_MODEL", "gpt-4o-mini") or "gpt-4o-mini"
             llm = await openai_chat_json(
                 system_prompt=prompt,
                 model=model,
@@ -1667,6 +1956,7 @@ async def stage4_avatars(
                 "provider": "heuristics_fallback",
                 "avatars": avatars,
                 "fallback_reason": str(e),
+                "openai_circuit": openai_client.circuit_snapshot(model),
                 "notes": [
                     "OpenAI avatar generation failed; used heuristic personas.",
                 ],
@@ -1688,8 +1978,15 @@ async def stage5_verdict(
     stage1: dict[str, Any],
     stage2: dict[str, Any],
     stage3: dict[str, Any],
-    stage4: dict[str, Any],
+    stage4: dict[str, Any] | None = None,
 ) -> dict[str, Any]:
+    """Weighted verdict from Stages 1-3.
+
+    Stage 4 only contributes `avatars_summary`, so the verdict can be
+    published before it finishes (`stage4=None`); `attach_avatars_summary`
+    fills it in afterwards.
+    """
+
     def get_score(stage: dict[str, Any], key: str) -> float:
         if not isinstance(stage, dict):
             return 0.0
@@ -1732,10 +2029,10 @@ async def stage5_verdict(
         "stage1": stage1.get("provider"),
         "stage2": stage2.get("provider"),
         "stage3": stage3.get("provider"),
-        "stage4": stage4.get("provider"),
+        "stage4": stage4.get("provider") if stage4 is not None else None,
     }
 
-    return {
+    verdict = {
         "stage_name": "verdict",
         "provider": "heuristics",
         "job_id": str(job.get("id")),
@@ -1748,32 +2045,200 @@ async def stage5_verdict(
         "winner": winner,
         "confidence": round(abs(total_a - total_b), 3),
         "provider_summary": provider_summary,
-        "avatars_summary": [a.get("name") for a in (stage4.get("avatars") or [])][:3],
+        "avatars_summary": [],
         "prioritized_fixes": sorted(fixes, key=lambda x: x["priority"])[:5],
         "notes": [
             "Final score is deterministic: 40% main image, 30% gallery, 30% text.",
             "When model providers are unavailable, stages auto-fallback to heuristic scoring.",
         ],
     }
+    if stage4 is None:
+        verdict["avatars_pending"] = True
+        return verdict
+    return attach_avatars_summary(verdict, stage4)
+
+
+def attach_avatars_summary(verdict: dict[str, Any], stage4: dict[str, Any]) -> dict[str, Any]:
+    out = {k: v for k, v in verdict.items() if k != "avatars_pending"}
+    out["provider_summary"] = {**(verdict.get("provider_summary") or {}), "stage4": stage4.get("provider")}
+    out["avatars_summary"] = [a.get("name") for a in (stage4.get("avatars") or [])][:3]
+    return out
+
+
+def _stage_timeout(stage_number: int, default_seconds: int, *, llm: bool = True) -> float:
+    if llm and openai_batch.llm_tier.get() == "batch":
+        # Bulk jobs' LLM calls wait on the Batch API, whose completion window
+        # is 24 h; the interactive limits would cancel nearly every batch.
+        return float(read_int_env("STAGE_TIMEOUT_BULK_SECONDS", 90000, minimum=60, maximum=7 * 86400))
+    return float(
+        read_int_env(f"STAGE{stage_number}_TIMEOUT_SECONDS", default_seconds, minimum=1, maximum=3600)
+    )
+
+
+def verdict_ms(timing: dict[str, Any]) -> int | None:
+    stage5 = timing.get("stages", {}).get("5")
+    return stage5["start_ms"] + stage5["duration_ms"] if stage5 else None
+
+
+def _provisional_writer(ctx: StageContext, stage_number: int) -> ProvisionalPublisher | None:
+    write = ctx.shared.get("write_provisional")
+    if write is None:
+        return None
+
+    async def publish(output: dict[str, Any]) -> None:
+        await write(stage_number, output)
+
+    return publish
+
+
+def job_deadline_seconds(tier: str) -> float:
+    if tier == "batch":
+        # Two Batch API rounds in sequence: Stages 1-3, then Stages 4 and 5.
+        return float(read_int_env("JOB_DEADLINE_BULK_SECONDS", 180000, minimum=60, maximum=14 * 86400))
+    return float(read_int_env("JOB_DEADLINE_SECONDS", 1200, minimum=60, maximum=86400))
+
+
+def job_budget() -> JobBudget:
+    return JobBudget(job_deadline_seconds(openai_batch.llm_tier.get()))
+
+
+def default_stage_graph() -> list[StageSpec]:
+    # Budget shares along the longest chain (0 -> 1..3 -> 4 or 5) stay within 1.
+    # Built per job, after llm_tier is set, so bulk jobs get their own limits:
+    # their LLM stages are bounded by the bulk timeout and the time left only.
+    bulk = openai_batch.llm_tier.get() == "batch"
+    return [
+        StageSpec(
+            number=0,
+            name="listing_fetch",
+            run=lambda ctx: stage0_listing_fetch(ctx.job, prefetch=ctx.shared.get("prefetch")),
+            timeout_seconds=_stage_timeout(0, 900, llm=False),
+            budget_share=0.5,
+            on_failure=ABORT_JOB,
+            failed_when=lambda out: not out.get("ok"),
+            default_provider="unknown",
+            error_fields={"ok": False},
+        ),
+        StageSpec(
+            number=1,
+            name="main_image_ctr",
+            run=lambda ctx: stage1_main_image_ctr(
+                ctx.outputs[0],
+                ctx.job,
+                prefetch=ctx.shared.get("prefetch"),
+                on_provisional=_provisional_writer(ctx, 1),
+            ),
+            depends_on=(0,),
+            timeout_seconds=_stage_timeout(1, 300),
+            budget_share=None if bulk else 0.3,
+        ),
+        StageSpec(
+            number=2,
+            name="gallery_cvr",
+            run=lambda ctx: stage2_gallery_cvr(
+                ctx.outputs[0],
+                ctx.job,
+                prefetch=ctx.shared.get("prefetch"),
+                on_provisional=_provisional_writer(ctx, 2),
+            ),
+            depends_on=(0,),
+            timeout_seconds=_stage_timeout(2, 300),
+            budget_share=None if bulk else 0.3,
+        ),
+        StageSpec(
+            number=3,
+            name="text_alignment",
+            run=lambda ctx: stage3_text_alignment(
+                ctx.outputs[0],
+                ctx.job,
+                prefetch=ctx.shared.get("prefetch"),
+                on_provisional=_provisional_writer(ctx, 3),
+            ),
+            depends_on=(0,),
+            timeout_seconds=_stage_timeout(3, 300),
+            budget_share=None if bulk else 0.3,
+        ),
+        StageSpec(
+            number=4,
+            name="avatars",
+            run=lambda ctx: stage4_avatars(
+                ctx.outputs.get(1, {}),
+                ctx.outputs.get(2, {}),
+                ctx.outputs.get(3, {}),
+                ctx.job,
+            ),
+            depends_on=(1, 2, 3),
+            timeout_seconds=_stage_timeout(4, 300),
+            budget_share=None if bulk else 0.15,
+        ),
+        StageSpec(
+            number=5,
+            name="verdict",
+            # Published as soon as Stages 1-3 finish; the avatar summary is
+            # attached once Stage 4 is done (see run_pipeline_for_job).
+            run=lambda ctx: stage5_verdict(
+                ctx.job,
+                ctx.outputs.get(1, {}),
+                ctx.outputs.get(2, {}),
+                ctx.outputs.get(3, {}),
+                ctx.outputs.get(4),
+            ),
+            depends_on=(1, 2, 3),
+            timeout_seconds=_stage_timeout(5, 120),
+            budget_share=None if bulk else 0.05,
+            on_failure=ABORT_JOB,
+        ),
+    ]
+
+
+_plugin_stages: list[StageSpec] = []
+
+
+def register_stage(spec: StageSpec) -> None:
+    """Add a stage to every job's graph.
+
+    Stage numbers stay contiguous so STAGES (job_stages rows, schema checks,
+    event names) keeps working: a plug-in takes the next free number.
+    """
+    if spec.number != len(STAGES):
+        raise ValueError(f"Plug-in stage must use the next stage number ({len(STAGES)}).")
+    STAGES.append((spec.number, spec.name))
+    _plugin_stages.append(spec)
+
+
+def pipeline_stage_graph() -> list[StageSpec]:
+    return default_stage_graph() + list(_plugin_stages)
+
+
+# The job columns stages (and plugin stages, via ctx.job) can rely on.
+JOB_COLUMNS = "id,user_id,status,asin_a,asin_b,priority,prompt_versions_pinned"
 
 
 async def run_pipeline_for_job(job_id: str) -> dict[str, Any]:
-    job = await select_one("jobs", {"select": "*", "id": f"eq.{job_id}"})
+    job = await select_one("jobs", {"select": JOB_COLUMNS, "id": f"eq.{job_id}"})
     if not job:
         return {"job_id": job_id, "status": "not_found"}
 
     user_id = str(job.get("user_id") or "")
+    # Each job runs in its own task (or is set again by the next job), so the
+    # tier does not leak between jobs; stage tasks inherit it.
+    openai_batch.llm_tier.set(openai_batch.tier_for_job(job))
+
+    def job_event(event_name: str, properties: dict[str, Any]) -> dict[str, Any] | None:
+        if not user_id:
+            return None
+        return {"event_name": event_name, "properties": properties}
 
-    async def emit_stage_event(
+    def stage_event(
         *,
         stage_number: int,
         status: str,
         output: dict[str, Any],
         started_at: str | None,
         completed_at: str | None,
-    ) -> None:
+    ) -> dict[str, Any] | None:
         if not user_id:
-            return
+            return None
         stage_name = STAGES[stage_number][1] if stage_number < len(STAGES) else f"stage_{stage_number}"
         provider = str(output.get("provider") or output.get("provider_used") or "unknown")
         props: dict[str, Any] = {
@@ -1786,267 +2251,161 @@ async def run_pipeline_for_job(job_id: str) -> dict[str, Any]:
             props["duration_ms"] = took_ms
         if status == "failed":
             props["error"] = str(output.get("error") or "unknown")
-        await record_analytics_event(
-            user_id=user_id,
-            job_id=job_id,
-            event_name=f"stage_{status}",
-            stage_number=stage_number,
-            properties=props,
-        )
+        return {"event_name": f"stage_{status}", "stage_number": stage_number, "properties": props}
 
-    if user_id:
-        await record_analytics_event(
-            user_id=user_id,
-            job_id=job_id,
-            event_name="pipeline_started",
-            properties={
+    await ensure_stage_rows(job_id)
+    await transition_stage(
+        job_id,
+        None,
+        user_id=user_id,
+        job_status="processing",
+        event=job_event(
+            "pipeline_started",
+            {
                 "asin_a": str(job.get("asin_a") or ""),
                 "asin_b": str(job.get("asin_b") or ""),
+                "priority": openai_batch.job_priority(job),
             },
-        )
-
-    await ensure_stage_rows(job_id)
-    await set_job_status(job_id, "processing")
-
-    stage_outputs: dict[int, dict[str, Any]] = {}
+        ),
+    )
+    # No I/O unless the registry is older than PROMPT_REGISTRY_REFRESH_SECONDS.
+    await get_prompt_registry().ensure_fresh()
+
+    async def write_provisional(stage_number: int, output: dict[str, Any]) -> None:
+        # The row stays in_progress; the job page shows the heuristic scores
+        # until the final output replaces them. Debug detail comes with it.
+        if artifacts_enabled():
+            output = split_stage_output(output)[0]
+        await mark_stage(job_id, stage_number, {"output": output})
+
+    budget = job_budget()
+    prefetch = ListingPrefetch()
+    ctx = StageContext(
+        job_id=job_id,
+        job=job,
+        shared={"prefetch": prefetch, "write_provisional": write_provisional},
+    )
 
-    # Stage 0
-    stage0_started_at = utc_now_iso()
-    await mark_stage(job_id, 0, {"status": "in_progress", "started_at": stage0_started_at})
-    try:
-        s0 = await stage0_listing_fetch(job)
-        validate_stage_output(0, s0)
-        stage_outputs[0] = s0
-        if not s0.get("ok"):
-            stage0_completed_at = utc_now_iso()
-            await mark_stage(
-                job_id,
-                0,
-                {"status": "failed", "completed_at": stage0_completed_at, "output": s0},
-            )
-            await emit_stage_event(
-                stage_number=0,
-                status="failed",
-                output=s0,
-                started_at=stage0_started_at,
-                completed_at=stage0_completed_at,
-            )
-            await set_job_status(job_id, "failed")
-            if user_id:
-                await record_analytics_event(
-                    user_id=user_id,
-                    job_id=job_id,
-                    event_name="pipeline_failed",
-                    properties={"failed_stage": 0},
-                )
-            return {"job_id": job_id, "status": "failed"}
-        stage0_completed_at = utc_now_iso()
-        await mark_stage(
-            job_id,
-            0,
-            {
-                "status": "completed",
-                "completed_at": stage0_completed_at,
-                "output": s0,
-                "provider_used": str(s0.get("provider") or "unknown"),
+    def with_deadline(out: dict[str, Any], stage_seconds: float) -> dict[str, Any]:
+        return {
+            **out,
+            "deadline": {
+                "stage_budget_ms": int(stage_seconds * 1000.0),
+                "job_deadline_ms": int(budget.total_seconds * 1000.0),
+                "job_remaining_ms": int(budget.remaining() * 1000.0),
             },
-        )
-        await emit_stage_event(
-            stage_number=0,
-            status="completed",
-            output=s0,
-            started_at=stage0_started_at,
-            completed_at=stage0_completed_at,
-        )
-    except Exception as e:
-        out = {"stage_name": "listing_fetch", "ok": False, "error": str(e)}
-        stage0_completed_at = utc_now_iso()
-        await mark_stage(
+        }
+
+    async def finish_stage(
+        n: int,
+        status: str,
+        out: dict[str, Any],
+        started_at: str,
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        completed_at = utc_now_iso()
+        persisted = await slim_stage_output(out)
+        await transition_stage(
             job_id,
-            0,
-            {"status": "failed", "completed_at": stage0_completed_at, "output": out},
-        )
-        await emit_stage_event(
-            stage_number=0,
-            status="failed",
-            output=out,
-            started_at=stage0_started_at,
-            completed_at=stage0_completed_at,
+            n,
+            {"status": status, "completed_at": completed_at, "output": persisted, **(extra or {})},
+            user_id=user_id,
+            event=stage_event(
+                stage_number=n, status=status, output=out, started_at=started_at, completed_at=completed_at
+            ),
         )
-        await set_job_status(job_id, "failed")
-        if user_id:
-            await record_analytics_event(
-                user_id=user_id,
-                job_id=job_id,
-                event_name="pipeline_failed",
-                properties={"failed_stage": 0, "error": str(e)},
-            )
-        return {"job_id": job_id, "status": "failed"}
 
-    # Stages 1-3 in parallel (best-effort)
-    async def run_stage(n: int, coro) -> None:
+    async def execute(spec: StageSpec) -> StageOutcome:
+        n = spec.number
+        stage_seconds = budget.stage_seconds(spec)
         started_at = utc_now_iso()
-        await mark_stage(job_id, n, {"status": "in_progress", "started_at": started_at})
+        await transition_stage(job_id, n, {"status": "in_progress", "started_at": started_at}, user_id=user_id)
         try:
-            out = await coro
+            async with asyncio.timeout(stage_seconds):
+                out = await spec.run(ctx)
             validate_stage_output(n, out)
-            stage_outputs[n] = out
-            # If a stage returns its own "status", respect it; else mark completed.
-            status = out.get("status") if isinstance(out, dict) else None
-            final_status = status if status in {"skipped"} else "completed"
-            completed_at = utc_now_iso()
-            await mark_stage(
-                job_id,
-                n,
-                {
-                    "status": final_status,
-                    "completed_at": completed_at,
-                    "output": out,
-                    "provider_used": str(out.get("provider") or "heuristics"),
-                },
+        except asyncio.CancelledError:
+            # A job-fatal stage failed elsewhere; leave a terminal row behind.
+            out = with_deadline(
+                {"stage_name": spec.name, **spec.error_fields, "error": "Cancelled: the job already failed."},
+                stage_seconds,
             )
-            await emit_stage_event(
-                stage_number=n,
-                status=final_status,
-                output=out,
-                started_at=started_at,
-                completed_at=completed_at,
+            ctx.outputs[n] = out
+            await transition_stage(
+                job_id, n, {"status": "failed", "completed_at": utc_now_iso(), "output": out}, user_id=user_id
             )
+            raise
         except Exception as e:
-            out = {"stage_name": STAGES[n][1] if n < len(STAGES) else f"stage_{n}", "error": str(e)}
-            stage_outputs[n] = out
-            completed_at = utc_now_iso()
-            await mark_stage(
-                job_id,
-                n,
-                {"status": "failed", "completed_at": completed_at, "output": out},
-            )
-            await emit_stage_event(
-                stage_number=n,
-                status="failed",
-                output=out,
-                started_at=started_at,
-                completed_at=completed_at,
-            )
-
-    await asyncio.gather(
-        run_stage(1, stage1_main_image_ctr(stage_outputs[0], job)),
-        run_stage(2, stage2_gallery_cvr(stage_outputs[0], job)),
-        run_stage(3, stage3_text_alignment(stage_outputs[0], job)),
-    )
-
-    # Stage 4
-    stage4_started_at = utc_now_iso()
-    await mark_stage(job_id, 4, {"status": "in_progress", "started_at": stage4_started_at})
-    try:
-        s4 = await stage4_avatars(
-            stage_outputs.get(1, {}),
-            stage_outputs.get(2, {}),
-            stage_outputs.get(3, {}),
-            job,
-        )
-        validate_stage_output(4, s4)
-        stage_outputs[4] = s4
-        stage4_completed_at = utc_now_iso()
-        await mark_stage(
-            job_id,
-            4,
-            {
-                "status": "completed",
-                "completed_at": stage4_completed_at,
-                "output": s4,
-                "provider_used": str(s4.get("provider") or "heuristics"),
-            },
-        )
-        await emit_stage_event(
-            stage_number=4,
-            status="completed",
-            output=s4,
-            started_at=stage4_started_at,
-            completed_at=stage4_completed_at,
-        )
-    except Exception as e:
-        out = {"stage_name": "avatars", "error": str(e)}
-        stage_outputs[4] = out
-        stage4_completed_at = utc_now_iso()
-        await mark_stage(
-            job_id,
-            4,
-            {"status": "failed", "completed_at": stage4_completed_at, "output": out},
-        )
-        await emit_stage_event(
-            stage_number=4,
-            status="failed",
-            output=out,
-            started_at=stage4_started_at,
-            completed_at=stage4_completed_at,
+            if isinstance(e, TimeoutError):
+                limit = "job deadline" if budget.remaining() <= 0 else "stage budget"
+                error = f"Stage exceeded its {limit} ({stage_seconds:.0f}s)."
+            else:
+                error = str(e)
+            out = with_deadline({"stage_name": spec.name, **spec.error_fields, "error": error}, stage_seconds)
+            ctx.outputs[n] = out
+            await finish_stage(n, "failed", out, started_at)
+            return StageOutcome(status="failed", error=error)
+
+        out = with_deadline(out, stage_seconds)
+        ctx.outputs[n] = out
+        if spec.failed_when is not None and spec.failed_when(out):
+            await finish_stage(n, "failed", out, started_at)
+            return StageOutcome(status="failed")
+
+        # If a stage returns its own "status", respect it; else mark completed.
+        final_status = "skipped" if out.get("status") == "skipped" else "completed"
+        await finish_stage(
+            n,
+            final_status,
+            out,
+            started_at,
+            {"provider_used": str(out.get("provider") or spec.default_provider), **stage_prompt_version(out)},
         )
+        return StageOutcome(status=final_status)
 
-    # Stage 5
-    stage5_started_at = utc_now_iso()
-    await mark_stage(job_id, 5, {"status": "in_progress", "started_at": stage5_started_at})
+    specs = pipeline_stage_graph()
     try:
-        s5 = await stage5_verdict(
-            job,
-            stage_outputs.get(1, {}),
-            stage_outputs.get(2, {}),
-            stage_outputs.get(3, {}),
-            stage_outputs.get(4, {}),
-        )
-        validate_stage_output(5, s5)
-        stage_outputs[5] = s5
-        stage5_completed_at = utc_now_iso()
-        await mark_stage(
+        graph_run = await run_stage_graph(specs, execute)
+    finally:
+        prefetch.close()
+    timing = graph_run.summary(specs)
+
+    if graph_run.failed_stage is not None:
+        props: dict[str, Any] = {"failed_stage": graph_run.failed_stage, "critical_path": timing["critical_path"]}
+        error = graph_run.outcomes[graph_run.failed_stage].error
+        if error:
+            props["error"] = error
+        await transition_stage(
             job_id,
-            5,
+            None,
+            user_id=user_id,
+            job_status="failed",
+            event=job_event("pipeline_failed", props),
+        )
+        return {"job_id": job_id, "status": "failed", "timing": timing}
+
+    s5 = ctx.outputs.get(5, {})
+    verdict_patch: dict[str, Any] | None = None
+    if s5.get("avatars_pending"):
+        s5 = attach_avatars_summary(s5, ctx.outputs.get(4, {}))
+        ctx.outputs[5] = s5
+        verdict_patch = {"output": await slim_stage_output(s5)}
+
+    await transition_stage(
+        job_id,
+        5 if verdict_patch else None,
+        verdict_patch,
+        user_id=user_id,
+        job_status="completed",
+        event=job_event(
+            "pipeline_completed",
             {
-                "status": "completed",
-                "completed_at": stage5_completed_at,
-                "output": s5,
-                "provider_used": str(s5.get("provider") or "heuristics"),
+                "winner": str(s5.get("winner") or ""),
+                "confidence": safe_float(s5.get("confidence"), 0.0),
+                "critical_path": timing["critical_path"],
+                "total_ms": timing["total_ms"],
+                "verdict_ms": verdict_ms(timing),
             },
-        )
-        await emit_stage_event(
-            stage_number=5,
-            status="completed",
-            output=s5,
-            started_at=stage5_started_at,
-            completed_at=stage5_completed_at,
-        )
-        await set_job_status(job_id, "completed")
-        if user_id:
-            await record_analytics_event(
-                user_id=user_id,
-                job_id=job_id,
-                event_name="pipeline_completed",
-                properties={
-                    "winner": str(s5.get("winner") or ""),
-                    "confidence": safe_float(s5.get("confidence"), 0.0),
-                },
-            )
-    except Exception as e:
-        out = {"stage_name": "verdict", "error": str(e)}
-        stage5_completed_at = utc_now_iso()
-        await mark_stage(
-            job_id,
-            5,
-            {"status": "failed", "completed_at": stage5_completed_at, "output": out},
-        )
-        await emit_stage_event(
-            stage_number=5,
-            status="failed",
-            output=out,
-            started_at=stage5_started_at,
-            completed_at=stage5_completed_at,
-        )
-        await set_job_status(job_id, "failed")
-        if user_id:
-            await record_analytics_event(
-                user_id=user_id,
-                job_id=job_id,
-                event_name="pipeline_failed",
-                properties={"failed_stage": 5, "error": str(e)},
-            )
-        return {"job_id": job_id, "status": "failed"}
-
-    return {"job_id": job_id, "status": "completed"}
+        ),
+    )
+    return {"job_id": job_id, "status": "completed", "timing": timing}
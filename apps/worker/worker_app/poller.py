@@ -5,24 +5,13 @@ import sys
 from typing import Any
 from datetime import datetime, timedelta, timezone
 
-from .config import get_optional_env, load_env
+from .analytics_buffer import close_analytics_buffer
+from .config import load_env, read_int_env
+from .db_health import db_health_snapshot, get_db_breaker
+from .http_clients import aclose_clients
 from .pipeline import run_pipeline_for_job, utc_now_iso
-from .supabase_rest import delete_many, select_many, update_many
-
-
-def read_int_env(name: str, default: int, *, minimum: int, maximum: int) -> int:
-    raw = get_optional_env(name)
-    if raw is None:
-        return default
-    try:
-        value = int(raw)
-    except ValueError:
-        return default
-    if value < minimum:
-        return minimum
-    if value > maximum:
-        return maximum
-    return value
+from .prompt_registry import get_prompt_registry
+from .storage import close_storage, delete_many, select_many, update_many
 
 
 async def _recover_stale_jobs(
@@ -36,7 +25,7 @@ async def _recover_stale_jobs(
     jobs = await select_many(
         "jobs",
         {
-            "select": "id,status,updated_at",
+            "select": "id",
             "status": f"eq.{status}",
             "updated_at": f"lt.{cutoff.isoformat()}",
             "order": "updated_at.asc",
@@ -54,6 +43,7 @@ async def _recover_stale_jobs(
             "jobs",
             {"id": f"eq.{job_id}", "status": f"eq.{status}"},
             {"status": "queued", "updated_at": utc_now_iso()},
+            returning="id",
         )
         if not updated:
             continue
@@ -68,6 +58,7 @@ async def _recover_stale_jobs(
                     "started_at": None,
                     "completed_at": None,
                 },
+                returning=None,
             )
 
     return recovered
@@ -122,10 +113,12 @@ async def run_cleanup_sweep() -> dict[str, int]:
     deleted_vision_cache = await delete_many(
         "vision_cache",
         {"created_at": f"lt.{vision_cutoff.isoformat()}"},
+        returning="id",
     )
     deleted_analytics_events = await delete_many(
         "analytics_events",
         {"created_at": f"lt.{analytics_cutoff.isoformat()}"},
+        returning="id",
     )
     return {
         "vision_cache_deleted": len(deleted_vision_cache),
@@ -141,7 +134,7 @@ async def _claim_job_with_status(
     order: str = "created_at.asc",
 ) -> str | None:
     filters: dict[str, str] = {
-        "select": "id,status,created_at,asin_a,asin_b",
+        "select": "id",
         "status": f"eq.{status}",
         "order": order,
         "limit": "1",
@@ -161,6 +154,7 @@ async def _claim_job_with_status(
         "jobs",
         {"id": f"eq.{job_id}", "status": f"eq.{status}"},
         {"status": "processing", "updated_at": utc_now_iso()},
+        returning="id",
     )
     if not updated:
         return None
@@ -168,8 +162,9 @@ async def _claim_job_with_status(
 
 
 async def claim_next_job() -> str | None:
-    # Prefer jobs created by the current API flow.
-    job_id = await _claim_job_with_status("queued")
+    # Prefer jobs created by the current API flow. Bulk jobs are claimed
+    # separately (claim_next_bulk_job) so they never delay interactive ones.
+    job_id = await _claim_job_with_status("queued", {"priority": "neq.bulk"})
     if job_id:
         return job_id
 
@@ -188,6 +183,37 @@ async def claim_next_job() -> str | None:
     return None
 
 
+async def claim_next_bulk_job() -> str | None:
+    return await _claim_job_with_status("queued", {"priority": "eq.bulk"})
+
+
+async def _heartbeat_job(job_id: str, interval_seconds: int) -> None:
+    # Bulk jobs can wait hours on the Batch API; keep updated_at fresh so the
+    # recovery sweep does not treat them as stale and requeue them.
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await update_many(
+                "jobs",
+                {"id": f"eq.{job_id}", "status": "eq.processing"},
+                {"updated_at": utc_now_iso()},
+                returning=None,
+            )
+        except Exception as e:
+            print(f"worker: heartbeat error for job {job_id}: {e}", file=sys.stderr, flush=True)
+
+
+async def run_bulk_job(job_id: str) -> dict[str, Any]:
+    interval = read_int_env("WORKER_BULK_HEARTBEAT_SECONDS", 60, minimum=5, maximum=600)
+    heartbeat = asyncio.create_task(_heartbeat_job(job_id, interval))
+    try:
+        result: dict[str, Any] = await run_pipeline_for_job(job_id)
+    finally:
+        heartbeat.cancel()
+    print(f"worker: finished bulk job {job_id} -> {result.get('status')}", flush=True)
+    return result
+
+
 async def main_loop() -> int:
     load_env()
     print("worker: poller started (DB-backed; no Redis required)", flush=True)
@@ -209,7 +235,25 @@ async def main_loop() -> int:
     except Exception as e:
         print(f"worker: startup recovery error: {e}", file=sys.stderr, flush=True)
 
+    registry = get_prompt_registry()
+    await registry.refresh()
+    print(
+        f"worker: prompt registry loaded ({len(registry.entries)} prompts"
+        + (f"; db unavailable: {registry.db_error}" if registry.db_error else "")
+        + ")",
+        flush=True,
+    )
+
+    max_bulk_jobs = read_int_env("WORKER_MAX_BULK_JOBS", 4, minimum=0, maximum=1000)
+    bulk_tasks: set[asyncio.Task[dict[str, Any]]] = set()
+
+    def bulk_done(task: asyncio.Task[dict[str, Any]]) -> None:
+        bulk_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"worker: bulk job error: {task.exception()}", file=sys.stderr, flush=True)
+
     next_cleanup_at = datetime.now(timezone.utc)
+    claims_paused = False
     while True:
         try:
             if datetime.now(timezone.utc) >= next_cleanup_at:
@@ -226,8 +270,30 @@ async def main_loop() -> int:
                     print(f"worker: cleanup sweep error: {e}", file=sys.stderr, flush=True)
                 next_cleanup_at = datetime.now(timezone.utc) + timedelta(seconds=cleanup_interval_seconds)
 
+            if not get_db_breaker().allow():
+                # The DB is failing; don't pick up work we may not be able to
+                # record. Running jobs keep retrying their own writes.
+                if not claims_paused:
+                    print(f"worker: pausing claims, database unhealthy: {db_health_snapshot()}", flush=True)
+                    claims_paused = True
+                await asyncio.sleep(2.0)
+                continue
+            if claims_paused:
+                print("worker: database recovered, resuming claims", flush=True)
+                claims_paused = False
+
             job_id = await claim_next_job()
             if not job_id:
+                if len(bulk_tasks) < max_bulk_jobs:
+                    bulk_job_id = await claim_next_bulk_job()
+                    if bulk_job_id:
+                        # Bulk jobs mostly wait on the Batch API; run them in
+                        # the background so interactive jobs keep flowing.
+                        print(f"worker: claimed bulk job {bulk_job_id}", flush=True)
+                        task = asyncio.create_task(run_bulk_job(bulk_job_id))
+                        bulk_tasks.add(task)
+                        task.add_done_callback(bulk_done)
+                        continue
                 await asyncio.sleep(2.0)
                 continue
             print(f"worker: claimed job {job_id}", flush=True)
@@ -240,8 +306,17 @@ async def main_loop() -> int:
             await asyncio.sleep(2.0)
 
 
+async def run_poller() -> int:
+    try:
+        return await main_loop()
+    finally:
+        await close_analytics_buffer()
+        await close_storage()
+        await aclose_clients()
+
+
 def main() -> None:
-    raise SystemExit(asyncio.run(main_loop()))
+    raise SystemExit(asyncio.run(run_poller()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import weakref
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from .config import get_env, read_int_env
+from .json_codec import dumps_str, loads
+
+
+# Direct Postgres implementation of the supabase_rest functions. Callers keep
+# passing PostgREST-style filters ({"status": "eq.queued", "order": ...}); they
+# are translated to parameterized SQL here, so the two backends are drop-in
+# replacements for each other (see storage.py). Rows come back through
+# json_agg, i.e. in the same JSON shape PostgREST returns.
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_RESERVED_PARAMS = {"select", "order", "limit", "offset"}
+_COMPARISONS = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+_IS_VALUES = {"null": "NULL", "true": "TRUE", "false": "FALSE"}
+SCHEMA = "public"
+
+
+def _ident(name: str) -> str:
+    if not _IDENT_RE.fullmatch(name):
+        raise ValueError(f"Unsupported identifier: {name!r}")
+    return f'"{name}"'
+
+
+def _table(name: str) -> str:
+    return f"{_ident(SCHEMA)}.{_ident(name)}"
+
+
+def _parse_in_list(raw: str) -> list[str]:
+    if not (raw.startswith("(") and raw.endswith(")")):
+        raise ValueError(f"Unsupported in-filter value: {raw!r}")
+    items = [item.strip() for item in raw[1:-1].split(",")]
+    return [item[1:-1] if len(item) >= 2 and item[0] == item[-1] == '"' else item for item in items if item]
+
+
+def _where(params: dict[str, str], args: list[Any]) -> str:
+    clauses: list[str] = []
+    for column, raw in params.items():
+        if column in _RESERVED_PARAMS:
+            continue
+        op, sep, value = str(raw).partition(".")
+        if not sep:
+            raise ValueError(f"Unsupported filter for {column}: {raw!r}")
+        col = _ident(column)
+        if op in _COMPARISONS:
+            args.append(value)
+            clauses.append(f"{col} {_COMPARISONS[op]} ${len(args)}")
+        elif op == "is" and value in _IS_VALUES:
+            clauses.append(f"{col} IS {_IS_VALUES[value]}")
+        elif op == "in":
+            args.append(_parse_in_list(value))
+            clauses.append(f"{col} = ANY(${len(args)})")
+        else:
+            raise ValueError(f"Unsupported filter operator for {column}: {raw!r}")
+    return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def _columns(select: str | None) -> str:
+    if not select or select.strip() == "*":
+        return "*"
+    return ", ".join(_ident(c.strip()) for c in select.split(",") if c.strip())
+
+
+def _order(order: str | None) -> str:
+    if not order:
+        return ""
+    terms: list[str] = []
+    for term in order.split(","):
+        column, *modifiers = term.strip().split(".")
+        sql = _ident(column)
+        for modifier in modifiers:
+            if modifier in ("asc", "desc"):
+                sql += f" {modifier.upper()}"
+            elif modifier in ("nullsfirst", "nullslast"):
+                sql += " NULLS FIRST" if modifier == "nullsfirst" else " NULLS LAST"
+            else:
+                raise ValueError(f"Unsupported order modifier: {modifier!r}")
+        terms.append(sql)
+    return f" ORDER BY {', '.join(terms)}"
+
+
+def _as_json_array(inner: str) -> str:
+    return f"SELECT coalesce(json_agg(t), '[]'::json)::text FROM ({inner}) t"
+
+
+def _returning_json_array(statement: str, returning: str | None) -> str:
+    if returning is None:
+        return statement  # return=minimal: nothing to send back
+    return (
+        f"WITH t AS ({statement} RETURNING {_columns(returning)}) "
+        "SELECT coalesce(json_agg(t), '[]'::json)::text FROM t"
+    )
+
+
+def build_select(table: str, params: dict[str, str]) -> tuple[str, list[Any]]:
+    args: list[Any] = []
+    sql = f"SELECT {_columns(params.get('select'))} FROM {_table(table)}"
+    sql += _where(params, args)
+    sql += _order(params.get("order"))
+    if "limit" in params:
+        sql += f" LIMIT {int(params['limit'])}"
+    if "offset" in params:
+        sql += f" OFFSET {int(params['offset'])}"
+    return _as_json_array(sql), args
+
+
+def build_insert(
+    table: str, rows: list[dict[str, Any]], returning: str | None = "*", ignore_duplicates: bool = False
+) -> tuple[str, list[Any]]:
+    # Like PostgREST bulk inserts: the column list is the union of the rows'
+    # keys and a row missing a key gets the column default.
+    columns: list[str] = []
+    for row in rows:
+        columns.extend(c for c in row if c not in columns)
+    args: list[Any] = []
+    values: list[str] = []
+    for row in rows:
+        cells: list[str] = []
+        for column in columns:
+            if column in row:
+                args.append(row[column])
+                cells.append(f"${len(args)}")
+            else:
+                cells.append("DEFAULT")
+        values.append(f"({', '.join(cells)})")
+    column_sql = ", ".join(_ident(c) for c in columns)
+    statement = f"INSERT INTO {_table(table)} ({column_sql}) VALUES {', '.join(values)}"
+    if ignore_duplicates:
+        statement += " ON CONFLICT DO NOTHING"
+    return _returning_json_array(statement, returning), args
+
+
+def build_update(
+    table: str, match_params: dict[str, str], patch: dict[str, Any], returning: str | None = "*"
+) -> tuple[str, list[Any]]:
+    if not patch:
+        raise ValueError("Empty update patch.")
+    args: list[Any] = []
+    assignments: list[str] = []
+    for column, value in patch.items():
+        args.append(value)
+        assignments.append(f"{_ident(column)} = ${len(args)}")
+    where = _where(match_params, args)
+    if not where:
+        raise ValueError("Refusing to update without filters.")
+    return _returning_json_array(f"UPDATE {_table(table)} SET {', '.join(assignments)}{where}", returning), args
+
+
+def build_delete(
+    table: str, match_params: dict[str, str], returning: str | None = "*"
+) -> tuple[str, list[Any]]:
+    args: list[Any] = []
+    where = _where(match_params, args)
+    if not where:
+        raise ValueError("Refusing to delete without filters.")
+    return _returning_json_array(f"DELETE FROM {_table(table)}{where}", returning), args
+
+
+def build_rpc(function_name: str, params: dict[str, Any]) -> tuple[str, list[Any]]:
+    args: list[Any] = []
+    named: list[str] = []
+    for name, value in params.items():
+        args.append(value)
+        named.append(f"{_ident(name)} => ${len(args)}")
+    return f"SELECT to_jsonb({_table(function_name)}({', '.join(named)}))::text", args
+
+
+def encode_param(value: Any, type_name: str) -> Any:
+    """Convert a PostgREST-style value to what asyncpg expects for `type_name`.
+
+    Filter values arrive as strings and patches as JSON-ready Python values;
+    the parameter types come from the prepared statement, so the server picks
+    them from the column (or function argument) being compared or assigned.
+    """
+    if value is None:
+        return None
+    if type_name.startswith("_"):
+        return [encode_param(v, type_name[1:]) for v in value]
+    if type_name in ("json", "jsonb"):
+        return dumps_str(value)
+    if type_name in ("timestamptz", "timestamp"):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+    if type_name == "date":
+        return date.fromisoformat(value) if isinstance(value, str) else value
+    if type_name in ("int2", "int4", "int8"):
+        return int(value)
+    if type_name in ("float4", "float8"):
+        return float(value)
+    if type_name == "numeric":
+        return Decimal(str(value))
+    if type_name == "bool":
+        return value.lower() == "true" if isinstance(value, str) else bool(value)
+    if type_name in ("text", "varchar", "bpchar", "uuid"):
+        return str(value)
+    return value
+
+
+_pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any] = weakref.WeakKeyDictionary()
+_pool_locks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = weakref.WeakKeyDictionary()
+
+
+async def get_pool() -> Any:
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is not None:
+        return pool
+    lock = _pool_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        pool = _pools.get(loop)
+        if pool is None:
+            try:
+                import asyncpg
+            except ImportError as e:  # pragma: no cover - depends on the deploy image
+                raise RuntimeError("WORKER_STORAGE_BACKEND=postgres requires `pip install asyncpg`.") from e
+            pool = await asyncpg.create_pool(
+                get_env("DATABASE_URL"),
+                min_size=read_int_env("DATABASE_POOL_MIN_SIZE", 1, minimum=0, maximum=100),
+                max_size=read_int_env("DATABASE_POOL_MAX_SIZE", 10, minimum=1, maximum=100),
+                # asyncpg prepares each distinct statement once per connection
+                # and keeps it in this LRU cache.
+                statement_cache_size=read_int_env("DATABASE_STATEMENT_CACHE_SIZE", 256, minimum=0, maximum=10000),
+                command_timeout=30.0,
+            )
+            _pools[loop] = pool
+    return pool
+
+
+# Parameter types per SQL text, learned from the first prepare. They only
+# depend on the statement, so later calls go straight to conn.fetchval, which
+# reuses the connection's cached prepared statement.
+_param_types: dict[str, list[str]] = {}
+
+
+async def _fetch_json(sql: str, args: list[Any], *, service_role: bool = False) -> Any:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        types = _param_types.get(sql)
+        if types is None:
+            stmt = await conn.prepare(sql)
+            types = _param_types[sql] = [t.name for t in stmt.get_parameters()]
+        encoded = [encode_param(v, t) for v, t in zip(args, types)]
+        if service_role:
+            async with conn.transaction():
+                # RPCs check auth.role() like they do behind PostgREST.
+                await conn.execute(
+                    "SELECT set_config('request.jwt.claims', $1, true)", dumps_str({"role": "service_role"})
+                )
+                raw = await conn.fetchval(sql, *encoded)
+        else:
+            raw = await conn.fetchval(sql, *encoded)
+    return loads(raw) if isinstance(raw, str) else raw
+
+
+async def insert_one(table: str, row: dict[str, Any], *, returning: str | None = "*") -> dict[str, Any]:
+    rows = await insert_many(table, [row], returning=returning)
+    return rows[0] if rows else {}
+
+
+async def insert_many(
+    table: str,
+    rows: list[dict[str, Any]],
+    *,
+    returning: str | None = "*",
+    ignore_duplicates: bool = False,
+) -> list[dict[str, Any]]:
+    if not rows:
+        return []
+    return await _fetch_json(*build_insert(table, rows, returning, ignore_duplicates)) or []
+
+
+async def select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+    return await _fetch_json(*build_select(table, params))
+
+
+async def select_one(table: str, params: dict[str, str]) -> dict[str, Any] | None:
+    rows = await select_many(table, params)
+    if not rows:
+        return None
+    return rows[0]
+
+
+async def update_many(
+    table: str,
+    match_params: dict[str, str],
+    patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
+) -> list[dict[str, Any]]:
+    return await _fetch_json(*build_update(table, match_params, patch, returning)) or []
+
+
+async def update_one(
+    table: str,
+    match_params: dict[str, str],
+    patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
+) -> dict[str, Any] | None:
+    rows = await update_many(table, match_params, patch, returning=returning)
+    if not rows:
+        return None
+    return rows[0]
+
+
+async def delete_many(
+    table: str, match_params: dict[str, str], *, returning: str | None = "*"
+) -> list[dict[str, Any]]:
+    return await _fetch_json(*build_delete(table, match_params, returning)) or []
+
+
+async def rpc(function_name: str, params: dict[str, Any]) -> Any:
+    sql, args = build_rpc(function_name, params)
+    return await _fetch_json(sql, args, service_role=True)
+
+
+async def close_pool() -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    pool = _pools.pop(loop, None)
+    if pool is not None:
+        await pool.close()
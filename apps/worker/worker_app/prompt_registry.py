@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .config import load_env, read_int_env
+from .storage import insert_many, select_many
+
+
+PROMPTS_DIR = Path(__file__).resolve().parents[3] / "prompts"
+
+
+def sha256_hex(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class PromptEntry:
+    rel_path: str  # "vision-ctr/v1.0.md", the key stages ask for
+    type: str
+    version: str
+    content: str
+    content_hash: str
+    prompt_version_id: str | None  # prompt_versions.id; None for file-only prompts
+    source: str  # "db" | "file"
+
+    def integrity(self) -> dict[str, Any]:
+        return {
+            "path": self.rel_path,
+            "hash_sha256": self.content_hash,
+            "prompt_version_id": self.prompt_version_id,
+            "source": self.source,
+        }
+
+
+def rel_path_for(prompt_type: str, version: str) -> str:
+    return f"{prompt_type}/{version}.md"
+
+
+def load_file_entries(prompts_dir: Path) -> dict[str, PromptEntry]:
+    entries: dict[str, PromptEntry] = {}
+    if not prompts_dir.is_dir():
+        return entries
+    for path in sorted(prompts_dir.glob("*/*.md")):
+        content = path.read_text(encoding="utf-8")
+        prompt_type, version = path.parent.name, path.stem
+        entries[rel_path_for(prompt_type, version)] = PromptEntry(
+            rel_path=rel_path_for(prompt_type, version),
+            type=prompt_type,
+            version=version,
+            content=content,
+            content_hash=sha256_hex(content),
+            prompt_version_id=None,
+            source="file",
+        )
+    return entries
+
+
+def _files_signature(prompts_dir: Path) -> tuple[tuple[str, int, int], ...]:
+    # Cheap change detection for hot reload: names, sizes and mtimes only.
+    if not prompts_dir.is_dir():
+        return ()
+    out = []
+    for path in sorted(prompts_dir.glob("*/*.md")):
+        st = path.stat()
+        out.append((str(path), st.st_size, st.st_mtime_ns))
+    return tuple(out)
+
+
+class PromptRegistry:
+    """In-memory prompt content and hashes, keyed by "<type>/<version>.md".
+
+    Active rows of `prompt_versions` override the files under PROMPTS_DIR.
+    Lookups never do I/O; `refresh` (called at most once per
+    PROMPT_REGISTRY_REFRESH_SECONDS via `ensure_fresh`) reloads both sources.
+    A DB row whose content does not match its content_hash is ignored.
+    """
+
+    def __init__(self, prompts_dir: Path = PROMPTS_DIR) -> None:
+        self.prompts_dir = prompts_dir
+        self.entries: dict[str, PromptEntry] = {}
+        self.loaded_at: float | None = None
+        self.db_error: str | None = None
+        self.rejected_rows: list[str] = []
+        self._files_signature: tuple[tuple[str, int, int], ...] | None = None
+        self._file_entries: dict[str, PromptEntry] = {}
+        self._lock: asyncio.Lock | None = None
+
+    def _install(self, db_entries: dict[str, PromptEntry]) -> None:
+        self.entries = {**self._file_entries, **db_entries}
+        self.loaded_at = time.monotonic()
+
+    def load_files(self) -> None:
+        signature = _files_signature(self.prompts_dir)
+        if signature != self._files_signature:
+            self._file_entries = load_file_entries(self.prompts_dir)
+            self._files_signature = signature
+
+    async def load_db(self) -> dict[str, PromptEntry]:
+        rows = await select_many(
+            "prompt_versions",
+            {
+                "select": "id,type,version,content,content_hash",
+                "is_active": "eq.true",
+                "order": "created_at.asc",
+            },
+        )
+        entries: dict[str, PromptEntry] = {}
+        rejected: list[str] = []
+        for row in rows:
+            prompt_type, version, content = row.get("type"), row.get("version"), row.get("content")
+            if not isinstance(prompt_type, str) or not isinstance(version, str) or not isinstance(content, str):
+                continue
+            rel_path = rel_path_for(prompt_type, version)
+            content_hash = sha256_hex(content)
+            if str(row.get("content_hash") or "").strip().lower() != content_hash:
+                rejected.append(rel_path)
+                continue
+            entries[rel_path] = PromptEntry(
+                rel_path=rel_path,
+                type=prompt_type,
+                version=version,
+                content=content,
+                content_hash=content_hash,
+                prompt_version_id=str(row["id"]) if row.get("id") else None,
+                source="db",
+            )
+        self.rejected_rows = rejected
+        return entries
+
+    async def refresh(self) -> None:
+        self.load_files()
+        try:
+            db_entries = await self.load_db()
+            self.db_error = None
+        except Exception as e:
+            # Keep serving what we have (files, or the last good DB load).
+            self.db_error = str(e)
+            db_entries = {k: v for k, v in self.entries.items() if v.source == "db"}
+        self._install(db_entries)
+
+    async def ensure_fresh(self) -> None:
+        refresh_seconds = read_int_env("PROMPT_REGISTRY_REFRESH_SECONDS", 300, minimum=0, maximum=86400)
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < refresh_seconds:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < refresh_seconds:
+                return
+            await self.refresh()
+
+    def get(self, rel_path: str) -> PromptEntry | None:
+        if self.loaded_at is None:
+            # Not loaded yet (tests, one-off scripts): files only, synchronously.
+            self.load_files()
+            self._install({})
+        entry = self.entries.get(rel_path)
+        if entry is None and self.prompts_dir.joinpath(rel_path).is_file():
+            # A file added since the last refresh.
+            self.load_files()
+            self._install({k: v for k, v in self.entries.items() if v.source == "db"})
+            entry = self.entries.get(rel_path)
+        return entry
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "prompts": {k: {"hash": v.content_hash[:12], "source": v.source} for k, v in self.entries.items()},
+            "db_error": self.db_error,
+            "rejected_rows": self.rejected_rows,
+        }
+
+
+_registry = PromptRegistry()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    return _registry
+
+
+async def sync_files_to_db(prompts_dir: Path = PROMPTS_DIR) -> list[str]:
+    """Insert prompt files missing from prompt_versions (as active rows)."""
+    existing = await select_many("prompt_versions", {"select": "type,version"})
+    have = {(str(r.get("type")), str(r.get("version"))) for r in existing}
+    rows = [
+        {
+            "type": e.type,
+            "version": e.version,
+            "content": e.content,
+            "content_hash": e.content_hash,
+            "is_active": True,
+        }
+        for e in load_file_entries(prompts_dir).values()
+        if (e.type, e.version) not in have
+    ]
+    if rows:
+        await insert_many("prompt_versions", rows, returning=None)
+    return [rel_path_for(r["type"], r["version"]) for r in rows]
+
+
+def main() -> None:
+    # python -m worker_app.prompt_registry  -> seed prompt_versions from prompts/
+    load_env()
+    added = asyncio.run(sync_files_to_db())
+    print(f"prompt registry: inserted {len(added)} prompt version(s): {', '.join(added) or '-'}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlsplit, urlunsplit
+
+from .config import get_optional_env
+
+
+# Older outcomes fade so a proxy that was blocked an hour ago gets traffic again.
+OUTCOME_DECAY = 0.9
+CAPTCHA_WEIGHT = 2.0
+LATENCY_REFERENCE_MS = 5000.0
+MIN_HEALTH = 0.02
+
+
+def redact_proxy_url(url: str | None) -> str | None:
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if not parts.username and not parts.password:
+        return url
+    host = parts.hostname or ""
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    return urlunsplit((parts.scheme, host, parts.path, parts.query, parts.fragment))
+
+
+@dataclass
+class ProxyStats:
+    url: str
+    successes: float = 0.0
+    captchas: float = 0.0
+    failures: float = 0.0
+    latency_ewma_ms: float | None = None
+    total_requests: int = 0
+
+    def health(self) -> float:
+        success_rate = (self.successes + 1.0) / (
+            self.successes + CAPTCHA_WEIGHT * self.captchas + self.failures + 2.0
+        )
+        latency_factor = 1.0
+        if self.latency_ewma_ms is not None:
+            latency_factor = 1.0 / (1.0 + self.latency_ewma_ms / LATENCY_REFERENCE_MS)
+        return max(success_rate * latency_factor, MIN_HEALTH)
+
+    def record(self, outcome: str, latency_ms: float | None) -> None:
+        self.successes *= OUTCOME_DECAY
+        self.captchas *= OUTCOME_DECAY
+        self.failures *= OUTCOME_DECAY
+        if outcome == "ok":
+            self.successes += 1.0
+        elif outcome == "captcha":
+            self.captchas += 1.0
+        else:
+            self.failures += 1.0
+        self.total_requests += 1
+        if latency_ms is not None:
+            if self.latency_ewma_ms is None:
+                self.latency_ewma_ms = latency_ms
+            else:
+                self.latency_ewma_ms = 0.8 * self.latency_ewma_ms + 0.2 * latency_ms
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "proxy": redact_proxy_url(self.url),
+            "health": round(self.health(), 3),
+            "successes": round(self.successes, 2),
+            "captchas": round(self.captchas, 2),
+            "failures": round(self.failures, 2),
+            "latency_ewma_ms": round(self.latency_ewma_ms) if self.latency_ewma_ms is not None else None,
+            "total_requests": self.total_requests,
+        }
+
+
+class ProxyPool:
+    def __init__(self, urls: list[str]) -> None:
+        self.stats: dict[str, ProxyStats] = {}
+        for url in urls:
+            if url and url not in self.stats:
+                self.stats[url] = ProxyStats(url=url)
+
+    def __len__(self) -> int:
+        return len(self.stats)
+
+    def pick(self, exclude: set[str] | None = None) -> str | None:
+        candidates = [s for url, s in self.stats.items() if not exclude or url not in exclude]
+        if not candidates:
+            return None
+        weights = [s.health() for s in candidates]
+        return random.choices(candidates, weights=weights, k=1)[0].url
+
+    def record(self, url: str, outcome: str, latency_ms: float | None = None) -> None:
+        stats = self.stats.get(url)
+        if stats is not None:
+            stats.record(outcome, latency_ms)
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [s.snapshot() for s in self.stats.values()]
+
+
+_pool: ProxyPool | None = None
+_pool_config: str | None = None
+
+
+def parse_proxy_urls(raw: str | None) -> list[str]:
+    if not raw:
+        return []
+    return [part.strip() for part in raw.replace("\n", ",").split(",") if part.strip()]
+
+
+def get_proxy_pool() -> ProxyPool | None:
+    """Process-wide pool built from AMAZON_PROXY_URLS; None when unset."""
+    global _pool, _pool_config
+    raw = get_optional_env("AMAZON_PROXY_URLS") or ""
+    if _pool is None or raw != _pool_config:
+        urls = parse_proxy_urls(raw)
+        _pool = ProxyPool(urls) if urls else None
+        _pool_config = raw
+    return _pool
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any, Generic, TypeVar
+
+
+V = TypeVar("V")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Process-local breaker shared by every job in the worker.
+
+    Opens after `failure_threshold` failures inside `window_seconds` with no
+    success in between, rejects calls for `cooldown_seconds`, then lets a
+    single half-open probe through. A successful probe closes the circuit; a
+    failed one re-opens it for another cooldown.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int,
+        window_seconds: float,
+        cooldown_seconds: float,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = CLOSED
+        self.opened_at: float | None = None
+        self.open_count = 0
+        self.rejected_count = 0
+        self.last_failure_reason: str | None = None
+        self._failures: deque[float] = deque()
+        self._probe_started_at: float | None = None
+
+    def _prune(self, now: float) -> None:
+        while self._failures and now - self._failures[0] > self.window_seconds:
+            self._failures.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.open_count += 1
+        self._probe_started_at = None
+        self._failures.clear()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == OPEN:
+            if self.opened_at is not None and now - self.opened_at < self.cooldown_seconds:
+                self.rejected_count += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_started_at = None
+        if self.state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back (cancelled
+            # caller) stops blocking after another cooldown.
+            if self._probe_started_at is not None and now - self._probe_started_at < self.cooldown_seconds:
+                self.rejected_count += 1
+                return False
+            self._probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.opened_at = None
+        self._probe_started_at = None
+        self._failures.clear()
+
+    def release_probe(self) -> None:
+        """The call never got an answer (e.g. a local timeout): free the
+        half-open probe slot without closing or re-opening the circuit."""
+        if self.state == HALF_OPEN:
+            self._probe_started_at = None
+
+    def record_failure(self, reason: str | None = None) -> None:
+        now = time.monotonic()
+        self.last_failure_reason = reason
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._failures.append(now)
+        self._prune(now)
+        if len(self._failures) >= self.failure_threshold:
+            self._open(now)
+
+    def snapshot(self) -> dict[str, Any]:
+        now = time.monotonic()
+        self._prune(now)
+        cooldown_remaining: float | None = None
+        if self.state == OPEN and self.opened_at is not None:
+            cooldown_remaining = max(self.cooldown_seconds - (now - self.opened_at), 0.0)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "recent_failures": len(self._failures),
+            "failure_threshold": self.failure_threshold,
+            "cooldown_remaining_seconds": (
+                round(cooldown_remaining, 1) if cooldown_remaining is not None else None
+            ),
+            "open_count": self.open_count,
+            "rejected_count": self.rejected_count,
+            "last_failure_reason": self.last_failure_reason,
+        }
+
+
+class NegativeCache(Generic[V]):
+    """Short-TTL memory of recent failures, keyed by e.g. ASIN."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[float, V]] = {}
+
+    def get(self, key: str) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def put(self, key: str, value: V) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        if len(self._entries) >= self.max_entries:
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+                self._entries.pop(k, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+from collections import OrderedDict
+from typing import Any
+
+from .config import get_optional_env
+from .json_codec import dumps
+from .storage import insert_many
+
+
+# Stage outputs are written in two parts: a compact summary in
+# job_stages.output (scores, winners, confidence, what the job page renders)
+# and the debugging detail in public.stage_artifacts, keyed by the SHA-256 of
+# its canonical JSON so identical detail is stored once. The summary points at
+# it with `debug_artifact`; the API serves it from
+# GET /jobs/{job_id}/stages/{stage_number}/debug.
+TABLE = "stage_artifacts"
+
+# Keys moved out of the summary wherever they appear in the output.
+DEBUG_FIELDS = frozenset(
+    {
+        "apify_attempts",
+        "direct_attempts",
+        "sampled_images",
+        "notes",
+        "openai_circuit",
+        "image_transport",
+    }
+)
+
+# The job page shows up to 8 evidence items; longer lists keep that many in
+# the summary and the full list in the artifact.
+SUMMARY_EVIDENCE_ITEMS = 8
+
+MAX_KNOWN_HASHES = 4096
+
+
+def artifacts_enabled() -> bool:
+    return (get_optional_env("STAGE_DEBUG_ARTIFACTS", "on") or "on").strip().lower() != "off"
+
+
+def split_stage_output(output: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Split `output` into (summary, debug); debug mirrors the output's nesting."""
+    summary: dict[str, Any] = {}
+    debug: dict[str, Any] = {}
+    for key, value in output.items():
+        if key in DEBUG_FIELDS:
+            debug[key] = value
+        elif key == "evidence" and isinstance(value, list) and len(value) > SUMMARY_EVIDENCE_ITEMS:
+            summary[key] = value[:SUMMARY_EVIDENCE_ITEMS]
+            debug[key] = value
+        elif isinstance(value, dict):
+            summary[key], nested = split_stage_output(value)
+            if nested:
+                debug[key] = nested
+        else:
+            summary[key] = value
+    return summary, debug
+
+
+def content_hash(debug: dict[str, Any]) -> tuple[str, bytes]:
+    encoded = dumps(debug, sort_keys=True)
+    return hashlib.sha256(encoded).hexdigest(), encoded
+
+
+# Hashes this process already stored; rows are immutable and never deleted,
+# so a repeat (e.g. the same fallback notes on every job) skips the upload.
+_known_hashes: OrderedDict[str, None] = OrderedDict()
+
+
+async def store_debug_artifact(debug: dict[str, Any]) -> str:
+    digest, encoded = content_hash(debug)
+    if digest in _known_hashes:
+        _known_hashes.move_to_end(digest)
+        return digest
+    await insert_many(
+        TABLE,
+        [{"content_hash": digest, "content": debug, "size_bytes": len(encoded)}],
+        returning=None,
+        ignore_duplicates=True,
+    )
+    _known_hashes[digest] = None
+    while len(_known_hashes) > MAX_KNOWN_HASHES:
+        _known_hashes.popitem(last=False)
+    return digest
+
+
+async def slim_stage_output(output: dict[str, Any]) -> dict[str, Any]:
+    """The output to persist: the summary plus a `debug_artifact` reference.
+
+    Falls back to the full output if the artifact can't be stored (e.g. the
+    stage_artifacts migration isn't applied yet), so no detail is lost.
+    """
+    if not artifacts_enabled():
+        return output
+    summary, debug = split_stage_output(output)
+    if not debug:
+        return output
+    try:
+        digest = await store_debug_artifact(debug)
+    except Exception as e:
+        print(f"worker: debug artifact not stored, keeping it inline: {e}", file=sys.stderr, flush=True)
+        return output
+    return {**summary, "debug_artifact": digest}
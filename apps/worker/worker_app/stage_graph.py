@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+CONTINUE = "continue"
+ABORT_JOB = "abort_job"
+
+
+@dataclass
+class StageContext:
+    job_id: str
+    job: dict[str, Any]
+    outputs: dict[int, dict[str, Any]] = field(default_factory=dict)
+    # Per-job objects several stages use (e.g. the Stage 0 listing prefetch).
+    shared: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    """One node of a job's pipeline.
+
+    `run` receives the shared StageContext; the outputs of every stage in
+    `depends_on` are guaranteed to be in `ctx.outputs` when it starts.
+    `failed_when` flags an output that completed but should count as a
+    failure (Stage 0 without listings). With `on_failure=ABORT_JOB` a failure
+    cancels the rest of the graph and fails the job. `budget_share` caps the
+    stage at that fraction of the job deadline (see JobBudget).
+    """
+
+    number: int
+    name: str
+    run: Callable[[StageContext], Awaitable[dict[str, Any]]]
+    depends_on: tuple[int, ...] = ()
+    timeout_seconds: float | None = None
+    on_failure: str = CONTINUE
+    failed_when: Callable[[dict[str, Any]], bool] | None = None
+    default_provider: str = "heuristics"
+    error_fields: dict[str, Any] = field(default_factory=dict)
+    budget_share: float | None = None
+
+
+@dataclass
+class JobBudget:
+    """Wall-clock deadline for one job, split into per-stage budgets.
+
+    A stage gets the smallest of its own timeout, its share of the job
+    deadline and the time left before the deadline, but never less than
+    `min_stage_seconds` so a cheap final stage can still write its result.
+    """
+
+    total_seconds: float
+    min_stage_seconds: float = 1.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def remaining(self) -> float:
+        return max(self.total_seconds - (time.monotonic() - self.started_at), 0.0)
+
+    def stage_seconds(self, spec: StageSpec) -> float:
+        limits = [self.remaining()]
+        if spec.timeout_seconds is not None:
+            limits.append(spec.timeout_seconds)
+        if spec.budget_share is not None:
+            limits.append(spec.budget_share * self.total_seconds)
+        return max(min(limits), self.min_stage_seconds)
+
+
+@dataclass
+class StageOutcome:
+    status: str  # completed | skipped | failed | cancelled
+    error: str | None = None
+
+
+@dataclass
+class GraphRun:
+    outcomes: dict[int, StageOutcome]
+    timings: dict[int, tuple[float, float]]  # monotonic (start, end)
+    started_at: float
+    aborted_by: int | None = None
+
+    @property
+    def failed_stage(self) -> int | None:
+        return self.aborted_by
+
+    def critical_path(self, specs: list[StageSpec]) -> list[int]:
+        """Walk back from the last stage to finish through its latest-finishing dependency."""
+        if not self.timings:
+            return []
+        by_number = {s.number: s for s in specs}
+        node = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [node]
+        while True:
+            deps = [d for d in by_number[node].depends_on if d in self.timings]
+            if not deps:
+                break
+            node = max(deps, key=lambda d: self.timings[d][1])
+            path.append(node)
+        return list(reversed(path))
+
+    def summary(self, specs: list[StageSpec]) -> dict[str, Any]:
+        def ms(seconds: float) -> int:
+            return max(int(seconds * 1000.0), 0)
+
+        end = max((t[1] for t in self.timings.values()), default=self.started_at)
+        return {
+            "critical_path": self.critical_path(specs),
+            "total_ms": ms(end - self.started_at),
+            "stages": {
+                str(n): {
+                    "status": self.outcomes[n].status if n in self.outcomes else "cancelled",
+                    "start_ms": ms(start - self.started_at),
+                    "duration_ms": ms(stop - start),
+                }
+                for n, (start, stop) in sorted(self.timings.items())
+            },
+        }
+
+
+def validate_graph(specs: list[StageSpec]) -> None:
+    numbers = [s.number for s in specs]
+    if len(set(numbers)) != len(numbers):
+        raise ValueError("Stage numbers must be unique.")
+    known = set(numbers)
+    for spec in specs:
+        missing = [d for d in spec.depends_on if d not in known]
+        if missing:
+            raise ValueError(f"Stage {spec.number} depends on unknown stages {missing}.")
+    # Kahn's algorithm: every stage must become runnable.
+    remaining = {s.number: set(s.depends_on) for s in specs}
+    while remaining:
+        ready = [n for n, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle among {sorted(remaining)}.")
+        for n in ready:
+            del remaining[n]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+class _GraphAborted(Exception):
+    pass
+
+
+async def run_stage_graph(
+    specs: list[StageSpec],
+    execute: Callable[[StageSpec], Awaitable[StageOutcome]],
+) -> GraphRun:
+    """Start every stage as soon as its own dependencies have finished.
+
+    `execute` does the per-stage work and bookkeeping and must not raise for
+    ordinary stage failures; it reports them through StageOutcome. All stages
+    run in one task group, so a failed ABORT_JOB stage cancels every stage
+    still running or waiting, and none outlives this call.
+    """
+    validate_graph(specs)
+    run = GraphRun(outcomes={}, timings={}, started_at=time.monotonic())
+    finished = {s.number: asyncio.Event() for s in specs}
+
+    async def node(spec: StageSpec) -> None:
+        for dep in spec.depends_on:
+            await finished[dep].wait()
+        start = time.monotonic()
+        try:
+            outcome = await execute(spec)
+        finally:
+            run.timings[spec.number] = (start, time.monotonic())
+        run.outcomes[spec.number] = outcome
+        if outcome.status == "failed" and spec.on_failure == ABORT_JOB:
+            if run.aborted_by is None:
+                run.aborted_by = spec.number
+            raise _GraphAborted()
+        finished[spec.number].set()
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for spec in specs:
+                tg.create_task(node(spec))
+    except BaseExceptionGroup as eg:
+        unexpected = [e for e in eg.exceptions if not isinstance(e, _GraphAborted)]
+        if unexpected:
+            raise unexpected[0] from eg
+    return run
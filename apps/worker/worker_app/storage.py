@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from types import ModuleType
+from typing import Any
+
+import httpx
+
+from . import postgres_store, supabase_rest
+from .config import get_optional_env
+from .db_health import (
+    get_db_breaker,
+    is_transient,
+    max_retries,
+    never_reached_db,
+    retry_delay_seconds,
+    should_retry,
+    table_stats,
+)
+
+
+# Worker persistence entry points. Every backend module exposes the same
+# functions with PostgREST-style filters, and writes take `returning` (a
+# column list, or None to send nothing back):
+#   rest      supabase_rest (PostgREST over HTTPS, the default)
+#   postgres  postgres_store (asyncpg pool straight to DATABASE_URL)
+BACKENDS: dict[str, ModuleType] = {"rest": supabase_rest, "postgres": postgres_store}
+
+
+def backend_name() -> str:
+    name = (get_optional_env("WORKER_STORAGE_BACKEND", "rest") or "rest").strip().lower()
+    if name not in BACKENDS:
+        raise RuntimeError(f"Unknown WORKER_STORAGE_BACKEND: {name!r} (expected one of {sorted(BACKENDS)}).")
+    return name
+
+
+def backend() -> ModuleType:
+    return BACKENDS[backend_name()]
+
+
+def is_missing_function(exc: Exception) -> bool:
+    """True when an rpc() failed because the database function doesn't exist."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 404
+    return getattr(exc, "sqlstate", None) == "42883"  # undefined_function
+
+
+async def _call(path: str, call: Callable[[], Awaitable[Any]], *, idempotent: bool) -> Any:
+    """Run one backend call, retrying transient failures with jittered backoff.
+
+    Reads, updates and deletes are idempotent and retry on any transient
+    error (timeouts, resets, 5xx, 429, a restarting database). Inserts and
+    RPCs are not, so they are only resent when the request never reached the
+    database (connect errors, 429/503). Outcomes feed the DB circuit breaker
+    and the counters for `path` (the table or rpc/<name>), whichever backend
+    is configured.
+    """
+    stats = table_stats(path)
+    breaker = get_db_breaker()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            result = await call()
+        except Exception as e:
+            if attempt < max_retries() and should_retry(e, idempotent=idempotent):
+                attempt += 1
+                await asyncio.sleep(retry_delay_seconds(attempt))
+                continue
+            stats.record((time.monotonic() - started) * 1000.0, retries=attempt, error=e)
+            if is_transient(e):
+                breaker.record_failure(type(e).__name__)
+            else:
+                breaker.record_success()  # the DB answered; the request was wrong
+            raise
+        stats.record((time.monotonic() - started) * 1000.0, retries=attempt, error=None)
+        breaker.record_success()
+        return result
+
+
+async def insert_one(table: str, row: dict[str, Any], *, returning: str | None = "*") -> dict[str, Any]:
+    rows = await insert_many(table, [row], returning=returning)
+    return rows[0] if rows else {}
+
+
+async def insert_many(
+    table: str,
+    rows: list[dict[str, Any]],
+    *,
+    returning: str | None = "*",
+    ignore_duplicates: bool = False,
+) -> list[dict[str, Any]]:
+    if not rows:
+        return []
+    # Skipping rows that already exist makes the insert safe to resend.
+    return await _call(
+        table,
+        lambda: backend().insert_many(table, rows, returning=returning, ignore_duplicates=ignore_duplicates),
+        idempotent=ignore_duplicates,
+    )
+
+
+async def select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+    return await _call(table, lambda: backend().select_many(table, params), idempotent=True)
+
+
+async def select_one(table: str, params: dict[str, str]) -> dict[str, Any] | None:
+    rows = await select_many(table, params)
+    if not rows:
+        return None
+    return rows[0]
+
+
+def _applied_filter(match_params: dict[str, str], patch: dict[str, Any]) -> dict[str, str] | None:
+    """Filters matching the rows `patch` was applied to, or None if it can't be expressed."""
+    params = {column: value for column, value in match_params.items() if column not in patch}
+    for column, value in patch.items():
+        if value is None:
+            params[column] = "is.null"
+        elif isinstance(value, bool):
+            params[column] = f"is.{str(value).lower()}"
+        elif isinstance(value, (str, int, float)):
+            params[column] = f"eq.{value}"
+        else:
+            return None
+    return params
+
+
+async def update_many(
+    table: str,
+    match_params: dict[str, str],
+    patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
+) -> list[dict[str, Any]]:
+    # Patches set absolute values, so resending one is safe -- unless it
+    # rewrites a column it filters on (a claim's status=eq.queued ->
+    # processing): once applied it matches nothing, and a resend after a lost
+    # response would report that the row was never updated.
+    conditional = returning is not None and any(column in patch for column in match_params)
+    try:
+        return await _call(
+            table,
+            lambda: backend().update_many(table, match_params, patch, returning=returning),
+            idempotent=not conditional,
+        )
+    except Exception as e:
+        applied = _applied_filter(match_params, patch)
+        if not conditional or applied is None or not is_transient(e) or never_reached_db(e):
+            raise
+        # The outcome is unknown; the rows now carrying the patched values
+        # (e.g. this claim's updated_at) are the ones this call updated.
+        return await select_many(table, {**applied, "select": returning})
+
+
+async def update_one(
+    table: str,
+    match_params: dict[str, str],
+    patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
+) -> dict[str, Any] | None:
+    rows = await update_many(table, match_params, patch, returning=returning)
+    if not rows:
+        return None
+    return rows[0]
+
+
+async def delete_many(
+    table: str, match_params: dict[str, str], *, returning: str | None = "*"
+) -> list[dict[str, Any]]:
+    return await _call(
+        table, lambda: backend().delete_many(table, match_params, returning=returning), idempotent=True
+    )
+
+
+async def rpc(function_name: str, params: dict[str, Any]) -> Any:
+    return await _call(f"rpc/{function_name}", lambda: backend().rpc(function_name, params), idempotent=False)
+
+
+async def close_storage() -> None:
+    await postgres_store.close_pool()
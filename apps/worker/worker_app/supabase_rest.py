@@ -5,6 +5,8 @@ from typing import Any
 import httpx
 
 from .config import get_env
+from .json_codec import dumps, loads
+from .read_coalescing import get_read_coalescer
 
 
 def _rest_base_url() -> str:
@@ -21,37 +23,84 @@ def _service_headers() -> dict[str, str]:
     }
 
 
-async def insert_one(table: str, row: dict[str, Any]) -> dict[str, Any]:
-    url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
+async def _request(
+    method: str,
+    path: str,
+    *,
+    params: dict[str, str] | None = None,
+    body: Any = None,
+    prefer: str | None = None,
+) -> httpx.Response:
+    # One attempt; retries, the DB breaker and the per-table counters are
+    # applied for both backends in storage.py.
+    headers = _service_headers()
+    if prefer:
+        headers["Prefer"] = prefer
     async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(url, headers=headers, json=row)
+        resp = await client.request(
+            method,
+            f"{_rest_base_url()}/{path}",
+            headers=headers,
+            params=params,
+            content=dumps(body) if body is not None else None,
+        )
     resp.raise_for_status()
-    data = resp.json()
-    if isinstance(data, list):
-        return data[0] if data else {}
-    return data
+    return resp
 
 
-async def insert_many(table: str, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    if not rows:
+# Writes take `returning`: the columns to send back ("*" for the whole row,
+# like PostgREST's `select`), or None for `Prefer: return=minimal`, in which
+# case nothing comes back and the helpers return [] / {} / None.
+def _write_options(
+    params: dict[str, str] | None, returning: str | None
+) -> tuple[dict[str, str] | None, str]:
+    if returning is None:
+        return params, "return=minimal"
+    if returning.strip() != "*":
+        params = {**(params or {}), "select": returning}
+    return params, "return=representation"
+
+
+def _rows(resp: httpx.Response) -> list[dict[str, Any]]:
+    if not resp.content:
         return []
-    url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(url, headers=headers, json=rows)
-    resp.raise_for_status()
-    data = resp.json()
+    data = loads(resp.content)
     return data if isinstance(data, list) else [data]
 
 
+async def insert_one(table: str, row: dict[str, Any], *, returning: str | None = "*") -> dict[str, Any]:
+    rows = await insert_many(table, [row], returning=returning)
+    return rows[0] if rows else {}
+
+
+async def insert_many(
+    table: str,
+    rows: list[dict[str, Any]],
+    *,
+    returning: str | None = "*",
+    ignore_duplicates: bool = False,
+) -> list[dict[str, Any]]:
+    if not rows:
+        return []
+    params, prefer = _write_options(None, returning)
+    if ignore_duplicates:
+        prefer += ",resolution=ignore-duplicates"
+    try:
+        resp = await _request("POST", table, params=params, body=rows, prefer=prefer)
+    finally:
+        get_read_coalescer().invalidate(table)
+    return _rows(resp)
+
+
+async def _get(table: str, params: dict[str, str]) -> bytes:
+    resp = await _request("GET", table, params=params)
+    return resp.content
+
+
 async def select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
-    url = f"{_rest_base_url()}/{table}"
-    headers = _service_headers()
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.get(url, headers=headers, params=params)
-    resp.raise_for_status()
-    data = resp.json()
+    # Identical concurrent reads share one request (see read_coalescing).
+    body = await get_read_coalescer().read(table, params, lambda: _get(table, params))
+    data = loads(body)
     if isinstance(data, list):
         return data
     return [data]
@@ -68,33 +117,44 @@ async def update_many(
     table: str,
     match_params: dict[str, str],
     patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
 ) -> list[dict[str, Any]]:
-    url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.patch(url, headers=headers, params=match_params, json=patch)
-    resp.raise_for_status()
-    data = resp.json()
-    return data if isinstance(data, list) else [data]
+    params, prefer = _write_options(match_params, returning)
+    try:
+        resp = await _request("PATCH", table, params=params, body=patch, prefer=prefer)
+    finally:
+        get_read_coalescer().invalidate(table)
+    return _rows(resp)
 
 
 async def update_one(
     table: str,
     match_params: dict[str, str],
     patch: dict[str, Any],
+    *,
+    returning: str | None = "*",
 ) -> dict[str, Any] | None:
-    rows = await update_many(table, match_params, patch)
+    rows = await update_many(table, match_params, patch, returning=returning)
     if not rows:
         return None
     return rows[0]
 
 
-async def delete_many(table: str, match_params: dict[str, str]) -> list[dict[str, Any]]:
-    url = f"{_rest_base_url()}/{table}"
-    headers = {**_service_headers(), "Prefer": "return=representation"}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.delete(url, headers=headers, params=match_params)
-    resp.raise_for_status()
-    data = resp.json()
-    return data if isinstance(data, list) else [data]
-
+async def delete_many(
+    table: str, match_params: dict[str, str], *, returning: str | None = "*"
+) -> list[dict[str, Any]]:
+    params, prefer = _write_options(match_params, returning)
+    try:
+        resp = await _request("DELETE", table, params=params, prefer=prefer)
+    finally:
+        get_read_coalescer().invalidate(table)
+    return _rows(resp)
+
+
+async def rpc(function_name: str, params: dict[str, Any]) -> Any:
+    try:
+        resp = await _request("POST", f"rpc/{function_name}", body=params, prefer="return=representation")
+    finally:
+        get_read_coalescer().invalidate()
+    return loads(resp.content)
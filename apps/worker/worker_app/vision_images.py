@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+from typing import Any
+
+from .config import get_optional_env, read_int_env
+
+try:
+    from PIL import Image
+except ImportError:  # In requirements.txt; without it small images are inlined as fetched.
+    Image = None
+
+
+# OpenAI scales "low" detail images to 512 px and charges a flat 85 tokens;
+# anything we send larger than that only pays off with "high" detail.
+LOW_DETAIL_MAX_PX = 512
+INLINE_MIME_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+
+def vision_image_mode() -> str:
+    mode = (get_optional_env("VISION_IMAGE_MODE", "url") or "url").strip().lower()
+    return mode if mode in {"url", "inline"} else "url"
+
+
+def inline_source_max_bytes() -> int:
+    # Gallery heuristics only need the image header, but inlining needs the
+    # whole file, so inline mode downloads up to this much per image.
+    return read_int_env("VISION_INLINE_SOURCE_MAX_BYTES", 2_000_000, minimum=100_000, maximum=10_000_000)
+
+
+def main_image_target_px() -> int:
+    return read_int_env("VISION_INLINE_MAIN_MAX_PX", 768, minimum=256, maximum=2048)
+
+
+def gallery_image_target_px() -> int:
+    return read_int_env("VISION_INLINE_GALLERY_MAX_PX", 512, minimum=256, maximum=2048)
+
+
+def sniff_mime(data: bytes) -> str | None:
+    if data.startswith(b"\xFF\xD8"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+def detail_for(width: int | None, height: int | None, target_px: int) -> str:
+    longest = max(width or 0, height or 0) or target_px
+    return "low" if min(longest, target_px) <= LOW_DETAIL_MAX_PX else "high"
+
+
+def downscale(data: bytes, target_px: int) -> tuple[bytes, str, int, int] | None:
+    """Fit the image inside target_px x target_px and re-encode as JPEG."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.thumbnail((target_px, target_px))
+            if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+                # JPEG has no alpha; a plain convert() would turn it black.
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=85, optimize=True)
+            return buf.getvalue(), "image/jpeg", img.width, img.height
+    except Exception:
+        return None
+
+
+async def image_part(meta: dict[str, Any], *, target_px: int) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Build the chat `image_url` part for a downloaded image.
+
+    Always removes the raw bytes from `meta` (it ends up in stage output).
+    In inline mode the bytes we already fetched are sent as a data URL,
+    downscaled when Pillow is available; otherwise, or when the download
+    is unusable, OpenAI is given the original URL to fetch itself.
+    """
+    data = meta.pop("data", None)
+    url = str(meta.get("url") or "")
+    width, height = meta.get("width"), meta.get("height")
+    fallback = {"type": "image_url", "image_url": {"url": url}}
+
+    if vision_image_mode() != "inline":
+        return fallback, {"inline": False}
+    if not isinstance(data, bytes) or not meta.get("ok") or meta.get("truncated"):
+        return fallback, {"inline": False, "reason": "download_unusable"}
+
+    # Pillow decoding and encoding is CPU-bound; keep it off the event loop.
+    scaled = await asyncio.to_thread(downscale, data, target_px)
+    if scaled is not None:
+        payload, mime, width, height = scaled
+    else:
+        mime = sniff_mime(data)
+        max_raw = read_int_env("VISION_INLINE_MAX_RAW_BYTES", 400_000, minimum=10_000, maximum=5_000_000)
+        if mime not in INLINE_MIME_TYPES or len(data) > max_raw:
+            return fallback, {"inline": False, "reason": "too_large_without_pillow"}
+        payload = data
+
+    detail = detail_for(width, height, target_px)
+    encoded = base64.b64encode(payload).decode("ascii")
+    part = {
+        "type": "image_url",
+        "image_url": {"url": f"data:{mime};base64,{encoded}", "detail": detail},
+    }
+    return part, {
+        "inline": True,
+        "downscaled": scaled is not None,
+        "detail": detail,
+        "source_bytes": len(data),
+        "inline_bytes": len(payload),
+    }
+
+
+def transport_summary(infos: list[dict[str, Any]]) -> dict[str, Any]:
+    inlined = [i for i in infos if i.get("inline")]
+    return {
+        "mode": vision_image_mode(),
+        "images": len(infos),
+        "inlined": len(inlined),
+        "downscaled": sum(1 for i in inlined if i.get("downscaled")),
+        "source_bytes": sum(int(i.get("source_bytes") or 0) for i in inlined),
+        "inline_bytes": sum(int(i.get("inline_bytes") or 0) for i in inlined),
+        "details": sorted({str(i["detail"]) for i in inlined if i.get("detail")}),
+    }
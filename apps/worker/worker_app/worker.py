@@ -5,26 +5,57 @@ from uuid import uuid4
 
 from arq.connections import RedisSettings
 
+from . import openai_batch
+from .analytics_buffer import close_analytics_buffer
 from .config import load_env
-from .pipeline import run_pipeline_for_job
+from .http_clients import aclose_clients
+from .pipeline import job_deadline_seconds, run_pipeline_for_job
+from .poller import run_bulk_job
+from .prompt_registry import get_prompt_registry
+from .storage import close_storage, select_one
 
 
 load_env()
 
+# Time past the job deadline for the failed-stage and job-status writes.
+JOB_TIMEOUT_MARGIN_SECONDS = 120
+
+
+def job_timeout_seconds() -> int:
+    # ARQ's own limit (300 s by default) would cancel a job long before its
+    # pipeline deadline, so it is set from the longest deadline in use.
+    tiers = [openai_batch.INTERACTIVE]
+    if openai_batch.batch_mode_enabled():
+        tiers.append("batch")
+    return int(max(job_deadline_seconds(tier) for tier in tiers)) + JOB_TIMEOUT_MARGIN_SECONDS
+
 
 async def run_pipeline(ctx: dict, job_id: str) -> dict:
     # ARQ entrypoint (expects Redis). For local dev without Redis, prefer:
     #   python -m worker_app.poller
+    job = await select_one("jobs", {"select": "priority", "id": f"eq.{job_id}"})
+    if openai_batch.job_priority(job) == openai_batch.BULK:
+        # Like the poller: heartbeat so the recovery sweep leaves it alone.
+        return await run_bulk_job(job_id)
     return await run_pipeline_for_job(job_id)
 
 
 async def startup(ctx: dict) -> None:
     ctx["worker_instance_id"] = str(uuid4())
+    await get_prompt_registry().refresh()
+
+
+async def shutdown(ctx: dict) -> None:
+    await close_analytics_buffer()
+    await close_storage()
+    await aclose_clients()
 
 
 class WorkerSettings:
     functions = [run_pipeline]
     on_startup = startup
+    on_shutdown = shutdown
+    job_timeout = job_timeout_seconds()
 
     redis_settings = RedisSettings.from_dsn(
         os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -0,0 +1,130 @@
+"""Compare stdlib json with the worker/API JSON codec on stage payloads.
+
+    python scripts/bench_json_codec.py [exported_stage_outputs.json ...]
+
+Each extra file may hold one stage output or a list of them (e.g. a
+`select output from job_stages` export). Without files it uses the golden
+fixture plus Stage 0 / Stage 2 outputs shaped like production ones (15 image
+URLs and 10 bullets per listing, Apify attempt logs, sampled image metadata).
+Install orjson to see the fast path; JSON_CODEC=json forces the fallback.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "apps" / "worker"))
+
+from worker_app import json_codec  # noqa: E402
+
+GOLDEN_FIXTURE = REPO_ROOT / "golden_tests" / "fixtures" / "golden_pair_001.json"
+
+
+def _listing(asin: str) -> dict[str, Any]:
+    images = [f"https://m.media-amazon.com/images/I/{asin}-{i:02d}._AC_SL1500_.jpg" for i in range(15)]
+    return {
+        "asin": asin,
+        "ok": True,
+        "provider": "apify_actor",
+        "url": f"https://www.amazon.com/dp/{asin}",
+        "title": "Stainless Steel Insulated Water Bottle with Straw Lid, 32 oz, Leak Proof, BPA Free " * 2,
+        "bullets": [
+            f"Bullet {i}: double-wall vacuum insulation keeps drinks cold for 24 hours and hot for 12 hours, "
+            "with a powder-coated, sweat-free finish that fits most cup holders and backpack pockets."
+            for i in range(10)
+        ],
+        "main_image_url": images[0],
+        "image_urls": images,
+        "apify_attempt_count": 2,
+        "apify_attempts": [
+            {"attempt": 1, "ok": False, "http_status": 502, "apify_status": "FAILED", "apify_requests": 3,
+             "error": "Apify run failed: upstream timeout while loading the product page."},
+            {"attempt": 2, "ok": True, "http_status": 200, "apify_status": "SUCCEEDED", "apify_requests": 2,
+             "error": None},
+        ],
+    }
+
+
+def _sampled(asin: str) -> list[dict[str, Any]]:
+    return [
+        {
+            "url": f"https://m.media-amazon.com/images/I/{asin}-{i:02d}._AC_SL1500_.jpg",
+            "ok": True,
+            "bytes": 180_000 + i * 7_919,
+            "width": 1500,
+            "height": 1500,
+            "content_type": "image/jpeg",
+            "sha256": f"{i:064x}",
+        }
+        for i in range(4)
+    ]
+
+
+def payloads(paths: list[str]) -> dict[str, Any]:
+    out: dict[str, Any] = {}
+    for raw in paths:
+        data = json.loads(Path(raw).read_text(encoding="utf-8"))
+        for i, item in enumerate(data if isinstance(data, list) else [data]):
+            out[f"{Path(raw).name}[{i}]"] = item
+    if out:
+        return out
+
+    golden = json.loads(GOLDEN_FIXTURE.read_text(encoding="utf-8"))
+    out.update({f"golden {name}": stage for name, stage in golden["stages"].items()})
+    out["stage0 listing_fetch"] = {
+        "stage_name": "listing_fetch",
+        "ok": True,
+        "asin_a": _listing("B0TESTA001"),
+        "asin_b": _listing("B0TESTB002"),
+        "listing_ready_ms": {"asin_a": 8123, "asin_b": 9544},
+    }
+    out["stage2 gallery_cvr"] = {
+        "stage_name": "gallery_cvr",
+        "provider": "openai",
+        "asin_a": {"gallery_urls_found": 15, "sampled_images": _sampled("B0TESTA001"), "score": 0.79,
+                   "evidence": ["Lifestyle shots show scale in hand and in a car cup holder."] * 6},
+        "asin_b": {"gallery_urls_found": 9, "sampled_images": _sampled("B0TESTB002"), "score": 0.47,
+                   "evidence": ["Mostly white-background angles; no in-use imagery."] * 6},
+        "cvr_winner": "asin_a",
+        "confidence": 0.32,
+    }
+    return out
+
+
+def _time(fn: Any, arg: Any, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main() -> None:
+    rounds = 2000
+    # What httpx does for json=... and resp.json() without the codec.
+    def stdlib_dumps(v: Any) -> bytes:
+        return json.dumps(v).encode("utf-8")
+
+    print(f"codec backend: {json_codec.backend()}  ({rounds} rounds, microseconds per call)")
+    print(f"{'payload':<26}{'bytes':>8}{'json dumps':>12}{'codec dumps':>13}{'json loads':>12}{'codec loads':>13}")
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for name, value in payloads(sys.argv[1:]).items():
+        encoded = json_codec.dumps(value)
+        row = [
+            _time(stdlib_dumps, value, rounds),
+            _time(json_codec.dumps, value, rounds),
+            _time(json.loads, encoded, rounds),
+            _time(json_codec.loads, encoded, rounds),
+        ]
+        totals = [t + r for t, r in zip(totals, row)]
+        print(f"{name[:25]:<26}{len(encoded):>8}{row[0]:>12.1f}{row[1]:>13.1f}{row[2]:>12.1f}{row[3]:>13.1f}")
+    print(f"{'total':<26}{'':>8}{totals[0]:>12.1f}{totals[1]:>13.1f}{totals[2]:>12.1f}{totals[3]:>13.1f}")
+    print(f"speedup: dumps x{totals[0] / totals[1]:.1f}, loads x{totals[2] / totals[3]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Measure PostgREST bytes per job for the worker's database traffic.
+
+    python scripts/bench_rest_bytes.py [--no-rpc]
+
+Runs the real claim + `run_pipeline_for_job` in heuristics mode (listing
+fetches and image downloads stubbed with production-sized data) against an
+in-memory PostgREST stand-in, and totals the response bytes per table. The
+"whole rows" column is what the same calls cost when every read asks for
+select=* and every write for return=representation -- how the worker talked
+to the database before projections and return=minimal. `--no-rpc` answers
+rpc/transition_stage with 404, i.e. the fallback used before the migration.
+It also prints the size of the stored stage outputs and debug artifacts;
+run with STAGE_DEBUG_ARTIFACTS=off to compare against inline outputs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "apps" / "worker"))
+
+from worker_app import pipeline, poller  # noqa: E402
+from worker_app.analytics_buffer import close_analytics_buffer  # noqa: E402
+from worker_app.json_codec import dumps, loads  # noqa: E402
+
+
+def _matches(row: dict[str, Any], params: dict[str, str]) -> bool:
+    for column, raw in params.items():
+        if column in ("select", "order", "limit", "offset"):
+            continue
+        op, _, value = raw.partition(".")
+        have = row.get(column)
+        if op == "eq" and str(have) != value:
+            return False
+        if op == "neq" and str(have) == value:
+            return False
+        if op == "lt" and not str(have or "") < value:
+            return False
+    return True
+
+
+def _project(rows: list[dict[str, Any]], select: str | None) -> list[dict[str, Any]]:
+    if not select or select.strip() == "*":
+        return rows
+    columns = [c.strip() for c in select.split(",")]
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+class FakePostgrest:
+    def __init__(self, *, rpc: bool) -> None:
+        self.rpc = rpc
+        self.tables: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        # table -> [requests, bytes sent, bytes for whole rows]
+        self.traffic: dict[str, list[int]] = defaultdict(lambda: [0, 0, 0])
+
+    def _respond(self, table: str, status: int, rows: Any, full: Any, *, minimal: bool) -> httpx.Response:
+        body = b"" if minimal else dumps(rows)
+        counts = self.traffic[table]
+        counts[0] += 1
+        counts[1] += len(body)
+        counts[2] += len(dumps(full))
+        return httpx.Response(status, content=body, headers={"Content-Type": "application/json"})
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.split("/rest/v1/", 1)[1]
+        params = dict(request.url.params)
+        minimal = "return=minimal" in request.headers.get("Prefer", "")
+        if path.startswith("rpc/"):
+            return self._rpc(path, loads(request.content))
+        rows = self.tables[path]
+        if request.method == "GET":
+            hits = [r for r in rows if _matches(r, params)][: int(params.get("limit", 10**6))]
+            return self._respond(path, 200, _project(hits, params.get("select")), hits, minimal=False)
+        if request.method == "POST":
+            new = [{"id": str(uuid.uuid4()), "created_at": "2026-01-01T00:00:00+00:00", **r} for r in loads(request.content)]
+            rows.extend(new)
+            return self._respond(path, 201, _project(new, params.get("select")), new, minimal=minimal)
+        hits = [r for r in rows if _matches(r, params)]
+        if request.method == "PATCH":
+            for r in hits:
+                r.update(loads(request.content))
+        else:
+            self.tables[path] = [r for r in rows if r not in hits]
+        return self._respond(path, 200, _project(hits, params.get("select")), hits, minimal=minimal)
+
+    def _rpc(self, path: str, args: dict[str, Any]) -> httpx.Response:
+        if not self.rpc:
+            missing = {"message": "function not found"}
+            return self._respond(path, 404, missing, missing, minimal=False)
+        job_id = args["p_job_id"]
+        if args.get("p_stage_number") is not None and args.get("p_stage_patch"):
+            for r in self.tables["job_stages"]:
+                if r["job_id"] == job_id and r["stage_number"] == args["p_stage_number"]:
+                    r.update(args["p_stage_patch"])
+        for r in self.tables["jobs"]:
+            if r["id"] == job_id and args.get("p_job_status"):
+                r["status"] = args["p_job_status"]
+        result = {"applied": True, "stage_rows": 1}
+        return self._respond(path, 200, result, result, minimal=False)
+
+
+def _listing(asin: str) -> dict[str, Any]:
+    images = [f"https://m.media-amazon.com/images/I/{asin}-{i:02d}._AC_SL1500_.jpg" for i in range(15)]
+    return {
+        "asin": asin,
+        "url": f"https://www.amazon.com/dp/{asin}",
+        "ok": True,
+        "provider": "direct_html",
+        "title": "Stainless Steel Insulated Water Bottle with Straw Lid, 32 oz, Leak Proof, BPA Free",
+        "bullets": [
+            f"Bullet {i}: double-wall vacuum insulation keeps drinks cold for 24 hours and hot for 12 hours."
+            for i in range(10)
+        ],
+        "main_image_url": images[0],
+        "image_urls": images,
+        "apify_attempt_count": 2,
+        "apify_attempts": [
+            {"attempt": 1, "ok": False, "http_status": 502, "apify_status": "FAILED", "apify_requests": 3,
+             "error": "Apify run failed: upstream timeout while loading the product page."},
+            {"attempt": 2, "ok": True, "http_status": 200, "apify_status": "SUCCEEDED", "apify_requests": 2,
+             "error": None},
+        ],
+        "direct_attempts": [
+            {"attempt": 1, "ok": False, "http_status": 503, "error": "Robot check page returned."},
+        ],
+    }
+
+
+async def _fetch_listing(asin: str) -> dict[str, Any]:
+    return _listing(asin)
+
+
+async def _download(url: str, max_bytes: int = 2_000_000, **_: Any) -> dict[str, Any]:
+    return {
+        "url": url,
+        "ok": True,
+        "http_status": 200,
+        "width": 1500,
+        "height": 1500,
+        "content_type": "image/jpeg",
+        "bytes_downloaded": min(max_bytes, 180_000),
+    }
+
+
+async def run(*, rpc: bool) -> FakePostgrest:
+    fake = FakePostgrest(rpc=rpc)
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(fake.handler)
+    httpx.AsyncClient = lambda **kw: real_client(transport=transport, **kw)  # type: ignore[misc,assignment]
+    pipeline.fetch_amazon_listing_direct_reliable = _fetch_listing  # type: ignore[assignment]
+    pipeline.download_bytes_limited = _download  # type: ignore[assignment]
+
+    fake.tables["jobs"].append(
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "status": "queued",
+            "asin_a": "B0TESTA001",
+            "asin_b": "B0TESTB002",
+            "priority": "interactive",
+            "reserved_credits": 0,
+            "prompt_versions_pinned": {},
+            "created_at": "2026-01-01T00:00:00+00:00",
+            "updated_at": "2026-01-01T00:00:00+00:00",
+        }
+    )
+    job_id = await poller.claim_next_job()
+    assert job_id, "claim failed"
+    result = await pipeline.run_pipeline_for_job(job_id)
+    await close_analytics_buffer()
+    httpx.AsyncClient = real_client  # type: ignore[misc]
+    print(f"job {result.get('status')}; transition_stage rpc: {'yes' if rpc else 'missing (fallback writes)'}")
+    return fake
+
+
+def main() -> None:
+    os.environ.update(SUPABASE_URL="https://db.example", SUPABASE_SERVICE_ROLE_KEY="bench")
+    for key in ("OPENAI_API_KEY", "APIFY_API_KEY", "WORKER_STORAGE_BACKEND"):
+        os.environ.pop(key, None)
+    fake = asyncio.run(run(rpc="--no-rpc" not in sys.argv[1:]))
+
+    print(f"{'table':<24}{'requests':>9}{'bytes':>10}{'whole rows':>12}")
+    totals = [0, 0, 0]
+    for table, counts in sorted(fake.traffic.items()):
+        totals = [t + c for t, c in zip(totals, counts)]
+        print(f"{table:<24}{counts[0]:>9}{counts[1]:>10}{counts[2]:>12}")
+    print(f"{'per job':<24}{totals[0]:>9}{totals[1]:>10}{totals[2]:>12}")
+    print(f"saved: {totals[2] - totals[1]} bytes ({1 - totals[1] / max(totals[2], 1):.0%})")
+    # What every Realtime broadcast and stage read carries (see STAGE_DEBUG_ARTIFACTS).
+    outputs = sum(len(dumps(r.get("output"))) for r in fake.tables["job_stages"])
+    artifacts = sum(len(dumps(r.get("content"))) for r in fake.tables["stage_artifacts"])
+    print(f"job_stages.output: {outputs} bytes; stage_artifacts: {artifacts} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+-- Job priority: `bulk` jobs (scheduled re-runs, research batches) run their
+-- LLM calls through the OpenAI Batch API and are claimed after interactive jobs.
+
+alter table public.jobs
+  add column if not exists priority text not null default 'interactive';
+
+do $$
+begin
+  if not exists (
+    select 1
+    from pg_constraint
+    where conname = 'jobs_priority_check'
+      and conrelid = 'public.jobs'::regclass
+  ) then
+    alter table public.jobs
+      add constraint jobs_priority_check check (priority in ('interactive', 'bulk'));
+  end if;
+end $$;
+
+-- Worker claim query: status + priority, oldest first.
+create index if not exists idx_jobs_status_priority_created_at
+  on public.jobs (status, priority, created_at);
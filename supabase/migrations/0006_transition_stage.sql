@@ -0,0 +1,79 @@
+-- One round trip per stage transition: update the job_stages row, bump
+-- jobs.updated_at (and optionally jobs.status), and append an analytics
+-- event, atomically. The worker falls back to separate PostgREST writes
+-- while this function is missing.
+
+create or replace function public.transition_stage(
+  p_job_id uuid,
+  p_stage_number smallint default null,
+  p_stage_patch jsonb default '{}'::jsonb,
+  p_job_status text default null,
+  p_event jsonb default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  job_user_id uuid;
+  stage_count integer := 0;
+begin
+  if coalesce(auth.role(), '') <> 'service_role' then
+    return jsonb_build_object('applied', false, 'reason', 'unauthorized');
+  end if;
+
+  update public.jobs
+  set status = coalesce(p_job_status, status),
+      updated_at = now()
+  where id = p_job_id
+  returning user_id into job_user_id;
+
+  if job_user_id is null then
+    return jsonb_build_object('applied', false, 'reason', 'job_not_found');
+  end if;
+
+  if p_stage_number is not null and coalesce(p_stage_patch, '{}'::jsonb) <> '{}'::jsonb then
+    update public.job_stages
+    set status = coalesce(p_stage_patch->>'status', status),
+        output = case when p_stage_patch ? 'output' then p_stage_patch->'output' else output end,
+        provider_used = case
+          when p_stage_patch ? 'provider_used' then p_stage_patch->>'provider_used'
+          else provider_used
+        end,
+        prompt_version_id = case
+          when p_stage_patch ? 'prompt_version_id' then (p_stage_patch->>'prompt_version_id')::uuid
+          else prompt_version_id
+        end,
+        started_at = case
+          when p_stage_patch ? 'started_at' then (p_stage_patch->>'started_at')::timestamptz
+          else started_at
+        end,
+        completed_at = case
+          when p_stage_patch ? 'completed_at' then (p_stage_patch->>'completed_at')::timestamptz
+          else completed_at
+        end
+    where job_id = p_job_id
+      and stage_number = p_stage_number;
+    get diagnostics stage_count = row_count;
+  end if;
+
+  if p_event is not null then
+    insert into public.analytics_events (user_id, job_id, event_name, stage_number, properties)
+    values (
+      job_user_id,
+      p_job_id,
+      p_event->>'event_name',
+      (p_event->>'stage_number')::smallint,
+      coalesce(p_event->'properties', '{}'::jsonb)
+    );
+  end if;
+
+  return jsonb_build_object('applied', true, 'stage_rows', stage_count);
+end;
+$$;
+
+revoke all on function public.transition_stage(uuid, smallint, jsonb, text, jsonb) from public;
+revoke all on function public.transition_stage(uuid, smallint, jsonb, text, jsonb) from anon;
+revoke all on function public.transition_stage(uuid, smallint, jsonb, text, jsonb) from authenticated;
+grant execute on function public.transition_stage(uuid, smallint, jsonb, text, jsonb) to service_role;
@@ -0,0 +1,15 @@
+-- Debug detail split out of job_stages.output: listing fetch attempts,
+-- sampled image metadata, notes, full evidence lists. Rows are keyed by the
+-- SHA-256 of their canonical JSON, so identical detail is stored once and
+-- shared; a stage points at its row with output->>'debug_artifact'.
+-- No policies: only the service role reads these (the API checks job
+-- ownership first), and the table is not in the realtime publication.
+
+create table if not exists public.stage_artifacts (
+  content_hash text primary key,
+  content jsonb not null,
+  size_bytes integer not null default 0,
+  created_at timestamptz not null default now()
+);
+
+alter table public.stage_artifacts enable row level security;
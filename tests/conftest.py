@@ -6,5 +6,7 @@ from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 WORKER_APP_ROOT = REPO_ROOT / "apps" / "worker"
+API_APP_ROOT = REPO_ROOT / "apps" / "api"
 
 sys.path.insert(0, str(WORKER_APP_ROOT))
+sys.path.insert(0, str(API_APP_ROOT))
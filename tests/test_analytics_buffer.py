@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import analytics_buffer
+from worker_app.analytics_buffer import AnalyticsBuffer
+
+
+class ForeignKeyViolation(Exception):
+    sqlstate = "23503"  # what asyncpg raises for a bad job_id
+
+
+class FakeTable:
+    """analytics_events as either storage backend reports its failures."""
+
+    def __init__(self, backend: str) -> None:
+        self.backend = backend
+        self.rows: list[dict[str, Any]] = []
+        self.calls = 0
+        self.down = False
+
+    async def insert_many(
+        self, table: str, rows: list[dict[str, Any]], *, returning: str | None = "*"
+    ) -> list[dict[str, Any]]:
+        assert table == "analytics_events" and returning is None
+        self.calls += 1
+        if self.down:
+            if self.backend == "postgres":
+                raise ConnectionRefusedError("connection refused")
+            raise httpx.ConnectError("connection refused")
+        if any(r.get("event_name") == "bad" for r in rows):
+            if self.backend == "postgres":
+                raise ForeignKeyViolation("violates foreign key")
+            request = httpx.Request("POST", "https://db.example/rest/v1/analytics_events")
+            raise httpx.HTTPStatusError(
+                "violates foreign key", request=request, response=httpx.Response(409, request=request)
+            )
+        self.rows.extend(rows)
+        return rows
+
+
+@pytest.fixture(params=["rest", "postgres"])
+def table(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> FakeTable:
+    fake = FakeTable(request.param)
+    monkeypatch.setattr(analytics_buffer, "insert_many", fake.insert_many)
+    return fake
+
+
+def _buffer(tmp_path: Path, **kwargs: Any) -> AnalyticsBuffer:
+    options: dict[str, Any] = {
+        "max_batch": 50,
+        "flush_interval_seconds": 60.0,
+        "spool_path": tmp_path / "spool.ndjson",
+        "spool_max_bytes": 1_000_000,
+    }
+    options.update(kwargs)
+    return AnalyticsBuffer(**options)
+
+
+def _event(i: int, name: str = "stage_completed") -> dict[str, Any]:
+    return {"user_id": "u1", "job_id": f"job-{i}", "event_name": name, "properties": {"i": i}}
+
+
+@pytest.mark.asyncio
+async def test_events_from_many_jobs_share_one_insert(table: FakeTable, tmp_path: Path) -> None:
+    buffer = _buffer(tmp_path)
+    for i in range(30):
+        buffer.add(_event(i))
+
+    assert table.calls == 0  # add() never waits on the DB
+    await buffer.close()
+
+    assert table.calls == 1
+    assert len(table.rows) == 30
+
+
+@pytest.mark.asyncio
+async def test_outage_spools_to_disk_and_replays(table: FakeTable, tmp_path: Path) -> None:
+    buffer = _buffer(tmp_path, max_batch=10)
+    table.down = True
+    for i in range(25):
+        buffer.add(_event(i))
+    await buffer.flush()
+
+    spool = tmp_path / "spool.ndjson"
+    assert len(spool.read_text().splitlines()) == 25
+    assert table.rows == []
+
+    table.down = False
+    buffer.add(_event(99))
+    await buffer.close()
+
+    assert sorted(r["properties"]["i"] for r in table.rows) == list(range(25)) + [99]
+    assert not spool.exists()
+    assert buffer.snapshot()["replayed"] == 25
+
+
+@pytest.mark.asyncio
+async def test_rejected_row_does_not_block_the_batch(table: FakeTable, tmp_path: Path) -> None:
+    buffer = _buffer(tmp_path)
+    buffer.add(_event(1))
+    buffer.add(_event(2, name="bad"))
+    buffer.add(_event(3))
+    await buffer.close()
+
+    assert [r["properties"]["i"] for r in table.rows] == [1, 3]
+    assert buffer.snapshot()["dropped"] == 1
+    assert not (tmp_path / "spool.ndjson").exists()
+
+
+@pytest.mark.asyncio
+async def test_spool_survives_a_restart(table: FakeTable, tmp_path: Path) -> None:
+    spool = tmp_path / "spool.ndjson"
+    spool.write_text("\n".join(json.dumps(_event(i)) for i in range(3)) + "\nnot json\n")
+
+    await _buffer(tmp_path).close()
+
+    assert len(table.rows) == 3
+    assert not spool.exists()
+
+
+@pytest.mark.asyncio
+async def test_replay_picks_up_an_interrupted_replay(table: FakeTable, tmp_path: Path) -> None:
+    spool = tmp_path / "spool.ndjson"
+    leftover = tmp_path / "spool.ndjson.replaying"
+    leftover.write_text("".join(json.dumps(_event(i)) + "\n" for i in range(2)))
+    spool.write_text(json.dumps(_event(2)) + "\n")
+
+    await _buffer(tmp_path).close()
+
+    assert sorted(r["properties"]["i"] for r in table.rows) == [0, 1, 2]
+    assert not spool.exists() and not leftover.exists()
+
+
+@pytest.mark.asyncio
+async def test_spool_never_grows_past_its_cap(table: FakeTable, tmp_path: Path) -> None:
+    one_row = len(json.dumps(_event(0)).encode()) + 1
+    buffer = _buffer(tmp_path, spool_max_bytes=int(one_row * 2.5))
+    table.down = True
+    buffer.add(_event(0))
+    buffer.add(_event(1))
+    await buffer.flush()
+    buffer.add(_event(2))
+    await buffer.flush()
+
+    spool = tmp_path / "spool.ndjson"
+    assert len(spool.read_text().splitlines()) == 2
+    assert spool.stat().st_size <= buffer.spool_max_bytes
+    assert buffer.snapshot()["spooled"] == 2 and buffer.snapshot()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rows_added_while_spooling_stay_queued(
+    table: FakeTable, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    buffer = _buffer(tmp_path)
+    started, release = threading.Event(), threading.Event()
+    append = buffer._append_to_spool
+
+    def slow_append(data: bytes) -> bool:
+        started.set()
+        release.wait(5)
+        return append(data)
+
+    monkeypatch.setattr(buffer, "_append_to_spool", slow_append)
+    table.down = True
+    buffer.add(_event(0))
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.to_thread(started.wait, 5)
+    buffer.add(_event(1))
+    release.set()
+    await flushing
+
+    assert buffer.snapshot()["queued"] == 1
+    table.down = False
+    await buffer.close()
+    assert sorted(r["properties"]["i"] for r in table.rows) == [0, 1]
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from app import analytics_batcher, main
+from app.analytics_batcher import AnalyticsBatcher
+from app.auth import AuthenticatedUser, require_user
+from app.main import app as api_app
+
+
+class FakeEventsTable:
+    def __init__(self) -> None:
+        self.rows: list[dict[str, Any]] = []
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def insert_many(
+        self, table: str, rows: list[dict[str, Any]], *, returning: str | None = "*"
+    ) -> list[dict[str, Any]]:
+        assert table == "analytics_events" and returning is None
+        self.calls += 1
+        await self.release.wait()
+        if any(r["event_name"] == "bad_row" for r in rows):
+            request = httpx.Request("POST", "https://db.example/rest/v1/analytics_events")
+            raise httpx.HTTPStatusError("bad row", request=request, response=httpx.Response(400, request=request))
+        self.rows.extend(rows)
+        return rows
+
+
+JOB_ID = "7d0f6a52-3c1e-4a8b-9f4e-2b1d5c6e7a80"
+
+
+@pytest.fixture
+def events_table(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeEventsTable]:
+    table = FakeEventsTable()
+    monkeypatch.setattr(analytics_batcher, "insert_many", table.insert_many)
+
+    async def select_many(table_name: str, params: dict[str, str]) -> list[dict[str, Any]]:
+        assert table_name == "jobs"
+        assert params["user_id"] == "eq.user-1"
+        ids = params["id"].removeprefix("in.(").removesuffix(")").split(",")
+        return [{"id": job_id} for job_id in ids if job_id == JOB_ID]
+
+    monkeypatch.setattr(main, "select_many", select_many)
+    api_app.dependency_overrides[require_user] = lambda: AuthenticatedUser(user_id="user-1", email=None)
+    yield table
+    api_app.dependency_overrides.pop(require_user, None)
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api_app), base_url="http://api.test")
+
+
+@pytest.mark.asyncio
+async def test_track_event_responds_before_the_insert(events_table: FakeEventsTable) -> None:
+    events_table.release.clear()  # the DB hangs
+    async with _client() as client:
+        resp = await asyncio.wait_for(
+            client.post("/analytics/events", json={"event_name": "Page View", "properties": {"path": "/"}}),
+            timeout=1,
+        )
+    assert resp.json() == {"ok": True}
+
+    events_table.release.set()
+    await analytics_batcher.close_analytics_batcher()
+    assert events_table.rows == [{"user_id": "user-1", "event_name": "page_view", "properties": {"path": "/"}}]
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_queues_every_event_for_one_insert(events_table: FakeEventsTable) -> None:
+    events = [
+        {"event_name": "stage_viewed", "job_id": JOB_ID, "stage_number": n, "properties": {"n": n}}
+        for n in range(6)
+    ]
+    async with _client() as client:
+        resp = await client.post("/analytics/events/batch", json={"events": events})
+    assert resp.json() == {"ok": True, "accepted": 6}
+
+    await analytics_batcher.close_analytics_batcher()
+    assert events_table.calls == 1
+    assert [r["stage_number"] for r in events_table.rows] == list(range(6))
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_rejects_foreign_jobs_and_bad_names(events_table: FakeEventsTable) -> None:
+    async with _client() as client:
+        foreign = await client.post(
+            "/analytics/events/batch",
+            json={
+                "events": [
+                    {"event_name": "a_b", "job_id": JOB_ID},
+                    {"event_name": "a_b", "job_id": str(uuid.uuid4())},
+                ]
+            },
+        )
+        malformed = await client.post(
+            "/analytics/events/batch",
+            json={"events": [{"event_name": "a_b", "job_id": "1),user_id.neq.(x"}]},
+        )
+        bad_name = await client.post(
+            "/analytics/events/batch",
+            json={"events": [{"event_name": "ok_name"}, {"event_name": "no!"}]},
+        )
+        empty = await client.post("/analytics/events/batch", json={"events": []})
+
+    assert foreign.status_code == 400
+    assert (malformed.status_code, malformed.json()["detail"]) == (400, "Invalid job_id")
+    assert bad_name.status_code == 400
+    assert empty.status_code == 422
+    await analytics_batcher.close_analytics_batcher()
+    assert events_table.rows == []
+
+
+@pytest.mark.asyncio
+async def test_rejected_row_is_dropped_alone(events_table: FakeEventsTable) -> None:
+    batcher = AnalyticsBatcher(max_batch=3, flush_interval_seconds=60.0, max_queue=3)
+    for name in ("one", "bad_row", "two", "three"):
+        batcher.enqueue({"user_id": "user-1", "event_name": name, "properties": {}})
+    await batcher.close()
+
+    assert [r["event_name"] for r in events_table.rows] == ["one", "two"]
+    assert batcher.snapshot()["dropped"] == 2  # the bad row and the one over max_queue
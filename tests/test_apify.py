@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+from collections.abc import Awaitable, Callable, Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from app import apify_webhooks
+from app.main import app as api_app
+from worker_app import apify, http_clients
+from worker_app.pipeline import fetch_amazon_listing_via_apify
+
+
+class FakeApify:
+    """In-process stand-in for the Apify v2 API used by the worker."""
+
+    def __init__(self, *, polls_before_success: int = 0) -> None:
+        self.polls_before_success = polls_before_success
+        self.requests: list[tuple[str, str]] = []
+        self.started_inputs: list[dict[str, Any]] = []
+        self.aborted: list[str] = []
+        self._polls: dict[str, int] = {}
+        self.deliver_webhook: Callable[[str, dict[str, Any]], Awaitable[None]] | None = None
+        self._deliveries: set[asyncio.Task[None]] = set()
+
+    def _run(self, run_id: str, status: str) -> dict[str, Any]:
+        return {"id": run_id, "status": status, "defaultDatasetId": f"ds-{run_id}"}
+
+    def _items_for(self, run_input: dict[str, Any]) -> list[dict[str, Any]]:
+        items = []
+        for start in run_input.get("startUrls", []):
+            url = start["url"]
+            asin = url.rstrip("/").rsplit("/", 1)[-1]
+            items.append(
+                {
+                    "url": url,
+                    "asin": asin,
+                    "title": f"Product {asin}",
+                    "bullets": ["One", "Two"],
+                    "main_image_url": f"https://m.media-amazon.com/images/I/{asin}.jpg",
+                    "image_urls": [f"https://m.media-amazon.com/images/I/{asin}.jpg"],
+                }
+            )
+        return items
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/v2")
+        self.requests.append((request.method, path))
+        if request.method == "POST" and path.endswith("/run-sync-get-dataset-items"):
+            run_input = json.loads(request.content)
+            self.started_inputs.append(run_input)
+            return httpx.Response(201, json=self._items_for(run_input))
+        if request.method == "POST" and path.endswith("/runs"):
+            run_input = json.loads(request.content)
+            self.started_inputs.append(run_input)
+            run_id = f"run-{len(self.started_inputs)}"
+            webhooks = request.url.params.get("webhooks")
+            if webhooks and self.deliver_webhook is not None:
+                spec = json.loads(base64.b64decode(webhooks))[0]
+                task = asyncio.get_running_loop().create_task(self.deliver_webhook(run_id, spec))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+            if "waitForFinish" in request.url.params and self.polls_before_success == 0:
+                return httpx.Response(201, json={"data": self._run(run_id, "SUCCEEDED")})
+            return httpx.Response(201, json={"data": {"id": run_id, "status": "RUNNING"}})
+        if request.method == "POST" and path.endswith("/abort"):
+            self.aborted.append(path.split("/")[2])
+            return httpx.Response(200, json={"data": {"status": "ABORTED"}})
+        if request.method == "GET" and path.startswith("/actor-runs/"):
+            run_id = path.split("/")[2]
+            self._polls[run_id] = self._polls.get(run_id, 0) + 1
+            done = self._polls[run_id] > self.polls_before_success
+            if "waitForFinish" in request.url.params and self.polls_before_success < 1000:
+                # Long poll: the fake run finishes while the request is held.
+                done = True
+            return httpx.Response(
+                200, json={"data": self._run(run_id, "SUCCEEDED" if done else "RUNNING")}
+            )
+        if request.method == "GET" and path.startswith("/datasets/"):
+            run_index = int(path.split("/")[2].rsplit("-", 1)[-1]) - 1
+            return httpx.Response(200, json=self._items_for(self.started_inputs[run_index]))
+        return httpx.Response(404, json={"error": "not found"})
+
+
+@pytest.fixture
+def fake_apify(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeApify]:
+    fake = FakeApify()
+    monkeypatch.setenv("APIFY_POLL_INTERVAL_SECONDS", "1")
+    http_clients.set_transport_override(http_clients.APIFY, httpx.MockTransport(fake.handler))
+    try:
+        yield fake
+    finally:
+        http_clients.set_transport_override(http_clients.APIFY, None)
+
+
+@pytest.mark.asyncio
+async def test_single_fetch_runs_one_actor_per_asin(fake_apify: FakeApify) -> None:
+    result = await fetch_amazon_listing_via_apify("B000000001", "token", "actor~x")
+
+    assert result["ok"] is True
+    assert result["title"] == "Product B000000001"
+    assert len(fake_apify.started_inputs) == 1
+    assert fake_apify.started_inputs[0]["maxPagesPerCrawl"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batcher_shares_one_run_across_concurrent_jobs(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_BATCH_WINDOW_MS", "50")
+
+    results = await asyncio.gather(
+        fetch_amazon_listing_via_apify("B000000001", "token", "actor~x"),
+        fetch_amazon_listing_via_apify("B000000002", "token", "actor~x"),
+        fetch_amazon_listing_via_apify("B000000003", "token", "actor~x"),
+    )
+
+    assert [r["ok"] for r in results] == [True, True, True]
+    assert [r["asin"] for r in results] == ["B000000001", "B000000002", "B000000003"]
+    assert {r["title"] for r in results} == {f"Product B00000000{i}" for i in (1, 2, 3)}
+    assert len(fake_apify.started_inputs) == 1
+    assert len(fake_apify.started_inputs[0]["startUrls"]) == 3
+    assert all(r["apify_batch_size"] == 3 for r in results)
+
+
+@pytest.mark.asyncio
+async def test_batch_run_is_aborted_when_all_waiters_cancel(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_BATCH_WINDOW_MS", "10")
+    fake_apify.polls_before_success = 1000
+
+    waiter = asyncio.create_task(fetch_amazon_listing_via_apify("B000000001", "token", "actor~x"))
+    while not fake_apify.started_inputs:
+        await asyncio.sleep(0.01)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    for _ in range(20):
+        if fake_apify.aborted:
+            break
+        await asyncio.sleep(0.01)
+
+    assert fake_apify.aborted == ["run-1"]
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_reaches_every_waiter(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_BATCH_WINDOW_MS", "10")
+
+    def broken_listing(*args: Any) -> dict[str, Any]:
+        raise ValueError("unexpected dataset item")
+
+    monkeypatch.setattr(apify, "listing_from_item", broken_listing)
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            fetch_amazon_listing_via_apify("B000000001", "token", "actor~x"),
+            fetch_amazon_listing_via_apify("B000000002", "token", "actor~x"),
+            return_exceptions=True,
+        ),
+        timeout=2,
+    )
+
+    assert [type(r) for r in results] == [ValueError, ValueError]
+
+
+def test_batch_run_timeout_scales_with_url_count(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("APIFY_RUN_TIMEOUT_SECONDS", "60")
+    monkeypatch.delenv("APIFY_BATCH_RUN_TIMEOUT_SECONDS", raising=False)
+
+    assert apify.run_timeout_seconds(1) == 60
+    assert apify.run_timeout_seconds(5) == 300
+    assert apify.run_timeout_seconds(20) == 600
+
+    monkeypatch.setenv("APIFY_BATCH_RUN_TIMEOUT_SECONDS", "30")
+    assert apify.run_timeout_seconds(20) == 60
+
+
+def test_asin_from_item_falls_back_to_url() -> None:
+    assert apify.asin_from_item({"url": "https://www.amazon.com/dp/b000000009?th=1"}) == "B000000009"
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the webhook relay."""
+
+    def __init__(self) -> None:
+        self.values: dict[str, str] = {}
+        self.subscribers: dict[str, list[asyncio.Queue[dict[str, Any]]]] = {}
+
+    async def set(self, key: str, value: str, ex: int | None = None) -> None:
+        self.values[key] = value
+
+    async def get(self, key: str) -> str | None:
+        return self.values.get(key)
+
+    async def publish(self, channel: str, message: str) -> int:
+        queues = self.subscribers.get(channel, [])
+        for queue in queues:
+            queue.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(queues)
+
+    def pubsub(self) -> "FakePubSub":
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.channels: list[str] = []
+
+    async def subscribe(self, channel: str) -> None:
+        self.channels.append(channel)
+        self.redis.subscribers.setdefault(channel, []).append(self.queue)
+
+    async def get_message(self, ignore_subscribe_messages: bool, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def unsubscribe(self, channel: str) -> None:
+        self.redis.subscribers.get(channel, []).remove(self.queue)
+
+    async def aclose(self) -> None:
+        return None
+
+
+@pytest.mark.asyncio
+async def test_wait_mode_finishes_in_fewer_requests_than_polling(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    fake_apify.polls_before_success = 2
+    polled = await fetch_amazon_listing_via_apify("B000000001", "token", "actor~x")
+    polled_requests = len(fake_apify.requests)
+
+    fake_apify.requests.clear()
+    monkeypatch.setenv("APIFY_COMPLETION_MODE", "wait")
+    waited = await fetch_amazon_listing_via_apify("B000000002", "token", "actor~x")
+
+    assert polled["ok"] and waited["ok"]
+    assert polled["apify_requests"] == polled_requests == 5
+    assert waited["apify_completion_mode"] == "wait"
+    assert waited["apify_requests"] == len(fake_apify.requests) == 3
+    assert fake_apify.requests[1] == ("GET", "/actor-runs/run-2")
+
+
+@pytest.mark.asyncio
+async def test_sync_mode_uses_single_request(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_COMPLETION_MODE", "sync")
+
+    result = await fetch_amazon_listing_via_apify("B000000001", "token", "actor~x")
+
+    assert result["ok"] is True
+    assert result["title"] == "Product B000000001"
+    assert result["apify_requests"] == 1
+    assert fake_apify.requests == [("POST", "/acts/actor~x/run-sync-get-dataset-items")]
+
+
+@pytest.mark.asyncio
+async def test_webhook_mode_completes_on_api_signal(
+    fake_apify: FakeApify,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    redis = FakeRedis()
+    monkeypatch.setattr(apify, "get_signal_redis", lambda: redis)
+    monkeypatch.setattr(apify_webhooks, "get_redis", lambda: redis)
+    monkeypatch.setenv("APIFY_COMPLETION_MODE", "webhook")
+    monkeypatch.setenv("APIFY_WEBHOOK_URL", "http://api.test/webhooks/apify")
+    monkeypatch.setenv("APIFY_WEBHOOK_SECRET", "s3cret")
+    fake_apify.polls_before_success = 1000
+    deliveries: list[int] = []
+
+    async def deliver(run_id: str, spec: dict[str, Any]) -> None:
+        await asyncio.sleep(0.05)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=api_app), base_url="http://api.test"
+        ) as client:
+            resp = await client.post(
+                "/webhooks/apify",
+                headers=json.loads(spec["headersTemplate"]),
+                json={
+                    "eventType": "ACTOR.RUN.SUCCEEDED",
+                    "eventData": {"actorRunId": run_id},
+                    "resource": fake_apify._run(run_id, "SUCCEEDED"),
+                },
+            )
+        deliveries.append(resp.status_code)
+
+    fake_apify.deliver_webhook = deliver
+
+    result = await fetch_amazon_listing_via_apify("B000000001", "token", "actor~x")
+
+    assert deliveries == [200]
+    assert result["ok"] is True
+    assert result["apify_webhook_signalled"] is True
+    assert result["apify_requests"] == 2  # start run + dataset items
+    assert not any(path.startswith("/actor-runs/") for _, path in fake_apify.requests)
+
+
+@pytest.mark.asyncio
+async def test_apify_webhook_rejects_bad_secret(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("APIFY_WEBHOOK_SECRET", "s3cret")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=api_app), base_url="http://api.test"
+    ) as client:
+        resp = await client.post(
+            "/webhooks/apify",
+            headers={"X-Apify-Webhook-Secret": "nope"},
+            json={"resource": {"id": "run-1"}},
+        )
+    assert resp.status_code == 401
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+pytest.importorskip("arq")
+
+from worker_app import worker  # noqa: E402
+
+
+def test_job_timeout_outlasts_the_pipeline_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    for key in ("JOB_DEADLINE_SECONDS", "JOB_DEADLINE_BULK_SECONDS", "OPENAI_BATCH_MODE"):
+        monkeypatch.delenv(key, raising=False)
+    assert worker.job_timeout_seconds() == 180000 + worker.JOB_TIMEOUT_MARGIN_SECONDS
+
+    monkeypatch.setenv("OPENAI_BATCH_MODE", "off")
+    assert worker.job_timeout_seconds() == 1200 + worker.JOB_TIMEOUT_MARGIN_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_bulk_jobs_run_with_a_heartbeat(monkeypatch: pytest.MonkeyPatch) -> None:
+    ran: list[tuple[str, str]] = []
+    priorities = {"job-1": "interactive", "job-2": "bulk"}
+
+    async def select_one(table: str, params: dict[str, str]) -> dict[str, Any]:
+        return {"priority": priorities[params["id"].removeprefix("eq.")]}
+
+    async def run_pipeline_for_job(job_id: str) -> dict[str, Any]:
+        ran.append(("plain", job_id))
+        return {"status": "completed"}
+
+    async def run_bulk_job(job_id: str) -> dict[str, Any]:
+        ran.append(("bulk", job_id))
+        return {"status": "completed"}
+
+    monkeypatch.setattr(worker, "select_one", select_one)
+    monkeypatch.setattr(worker, "run_pipeline_for_job", run_pipeline_for_job)
+    monkeypatch.setattr(worker, "run_bulk_job", run_bulk_job)
+
+    await worker.run_pipeline({}, "job-1")
+    await worker.run_pipeline({}, "job-2")
+
+    assert ran == [("plain", "job-1"), ("bulk", "job-2")]
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import db_health, pipeline, poller, postgres_store, storage
+from worker_app.json_codec import loads
+
+
+Responder = Callable[[httpx.Request], httpx.Response]
+
+
+class FakePostgrest:
+    def __init__(self) -> None:
+        self.seen: list[httpx.Request] = []
+        self.script: list[Responder] = []
+
+    def serve(self, *responses: Responder) -> None:
+        """Answer with `responses` in order, repeating the last one."""
+        self.script = list(responses)
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.seen.append(request)
+        respond = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        return respond(request)
+
+
+@pytest.fixture
+def postgrest(monkeypatch: pytest.MonkeyPatch) -> FakePostgrest:
+    monkeypatch.setenv("SUPABASE_URL", "https://db.example")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service")
+    monkeypatch.setenv("SUPABASE_RETRY_BASE_MS", "10")
+    monkeypatch.setattr(db_health, "_db_breaker", None)
+    monkeypatch.setattr(db_health, "_table_stats", {})
+    fake = FakePostgrest()
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(fake.handler)
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kw: real_client(transport=transport, **kw))
+    return fake
+
+
+def status(code: int) -> Responder:
+    return lambda request: httpx.Response(code, json=[{"id": "row-1"}] if code < 400 else {"message": "x"})
+
+
+def raises(exc: type[httpx.TransportError]) -> Responder:
+    def respond(request: httpx.Request) -> httpx.Response:
+        raise exc("boom", request=request)
+
+    return respond
+
+
+@pytest.mark.asyncio
+async def test_mark_stage_rides_out_a_transient_5xx(postgrest: FakePostgrest) -> None:
+    postgrest.serve(status(502), raises(httpx.ReadTimeout), status(200))
+
+    await pipeline.mark_stage("job-1", 2, {"status": "completed"})
+
+    assert [r.method for r in postgrest.seen] == ["PATCH"] * 3
+    stats = db_health.db_health_snapshot()["tables"]["job_stages"]
+    assert stats["calls"] == 1 and stats["retries"] == 2 and stats["errors"] == 0
+    assert db_health.get_db_breaker().state == "closed"
+
+
+def lost_claim(job: dict[str, Any], *, applies: bool) -> Responder:
+    """A jobs table whose PATCH responses never arrive."""
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        if request.method == "PATCH":
+            if applies:
+                job.update(loads(request.content))
+            raise httpx.ReadTimeout("response lost", request=request)
+        if all(params.get(column, f"eq.{value}") == f"eq.{value}" for column, value in job.items()):
+            return httpx.Response(200, json=[{"id": job["id"]}])
+        return httpx.Response(200, json=[])
+
+    return respond
+
+
+@pytest.mark.asyncio
+async def test_a_claim_whose_response_was_lost_is_not_resent(postgrest: FakePostgrest) -> None:
+    job = {"id": "job-1", "status": "queued", "updated_at": "2026-01-01T00:00:00+00:00"}
+    postgrest.serve(lost_claim(job, applies=True))
+
+    assert await poller.claim_next_job() == "job-1"
+    assert [r.method for r in postgrest.seen] == ["GET", "PATCH", "GET"]  # claim, then confirm by re-reading
+    assert job["status"] == "processing"
+    assert postgrest.seen[2].url.params["updated_at"] == f"eq.{job['updated_at']}"
+
+    # Another worker's claim landed first: this one applied nothing.
+    postgrest.seen.clear()
+    job.update(status="queued")
+    postgrest.serve(lost_claim(job, applies=False))
+    assert await poller._claim_job_with_status("queued") is None
+    assert [r.method for r in postgrest.seen] == ["GET", "PATCH", "GET"]
+
+
+@pytest.mark.asyncio
+async def test_inserts_are_only_resent_when_they_never_reached_the_db(postgrest: FakePostgrest) -> None:
+    postgrest.serve(raises(httpx.ConnectError), status(503), status(201))
+    assert await storage.insert_many("analytics_events", [{"event_name": "x"}]) == [{"id": "row-1"}]
+    assert len(postgrest.seen) == 3
+
+    postgrest.seen.clear()
+    postgrest.serve(status(502))
+    with pytest.raises(httpx.HTTPStatusError):
+        await storage.insert_many("analytics_events", [{"event_name": "x"}])
+    assert len(postgrest.seen) == 1  # a 502 may have been applied; don't double-insert
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried_and_do_not_trip_the_breaker(
+    postgrest: FakePostgrest, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("DB_CIRCUIT_FAILURE_THRESHOLD", "1")
+    postgrest.serve(status(400))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await storage.select_many("jobs", {"select": "nope"})
+
+    assert len(postgrest.seen) == 1
+    assert db_health.get_db_breaker().state == "closed"
+    assert db_health.db_health_snapshot()["tables"]["jobs"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_outages_open_the_db_circuit(
+    postgrest: FakePostgrest, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("DB_CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("SUPABASE_MAX_RETRIES", "1")
+    postgrest.serve(status(503))
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await storage.select_many("jobs", {"select": "id"})
+
+    assert len(postgrest.seen) == 4
+    breaker = db_health.get_db_breaker()
+    assert breaker.state == "open"
+    assert not breaker.allow()  # the poller stops claiming
+
+    postgrest.serve(status(200))
+    assert breaker.opened_at is not None
+    breaker.opened_at -= breaker.cooldown_seconds  # cooldown over
+    assert breaker.allow()  # half-open probe: the next claim
+    await storage.select_many("jobs", {"select": "id"})
+    assert breaker.state == "closed"
+
+
+class AdminShutdown(Exception):
+    sqlstate = "57P01"  # what asyncpg raises while the server restarts
+
+
+@pytest.mark.asyncio
+async def test_postgres_backend_gets_the_same_retries_and_breaker(
+    postgrest: FakePostgrest, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("WORKER_STORAGE_BACKEND", "postgres")
+    monkeypatch.setenv("DB_CIRCUIT_FAILURE_THRESHOLD", "1")
+    failures: list[BaseException] = [ConnectionRefusedError("refused"), AdminShutdown("terminating")]
+    statements: list[str] = []
+
+    async def fetch_json(sql: str, args: list[Any], *, service_role: bool = False) -> Any:
+        statements.append(sql.split()[0])
+        if failures:
+            raise failures.pop(0)
+        return [{"id": "row-1"}]
+
+    monkeypatch.setattr(postgres_store, "_fetch_json", fetch_json)
+
+    assert await storage.select_many("jobs", {"select": "id"}) == [{"id": "row-1"}]
+    assert len(statements) == 3
+    assert db_health.db_health_snapshot()["tables"]["jobs"]["retries"] == 2
+
+    failures.append(AdminShutdown("terminating"))
+    with pytest.raises(AdminShutdown):
+        await storage.rpc("transition_stage", {"p_job_id": "job-1"})  # may have run; not resent
+    assert db_health.get_db_breaker().state == "open"
+    assert db_health.db_health_snapshot()["tables"]["rpc/transition_stage"]["errors"] == 1
+    assert postgrest.seen == []
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from worker_app import http_clients
+from worker_app.pipeline import download_bytes_limited
+
+
+def _png_bytes(width: int, height: int) -> bytes:
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + b"\x00\x00\x00\rIHDR"
+        + width.to_bytes(4, "big")
+        + height.to_bytes(4, "big")
+        + b"\x00" * 16
+    )
+
+
+def test_host_class_for_url_splits_pages_and_cdn() -> None:
+    assert http_clients.host_class_for_url("https://www.amazon.com/dp/B000000001") == http_clients.AMAZON_PAGES
+    assert http_clients.host_class_for_url("https://m.media-amazon.com/images/I/x.jpg") == http_clients.AMAZON_IMAGES
+    assert http_clients.host_class_for_url("https://images.example.com/a.jpg") == http_clients.EXTERNAL
+
+
+def test_token_bucket_spaces_requests_after_burst(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(http_clients.time, "monotonic", lambda: now[0])
+
+    bucket = http_clients.TokenBucket(rate_per_second=2.0, burst=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    now[0] += 2.0
+    assert bucket.reserve() == 0.0
+
+
+@pytest.mark.asyncio
+async def test_downloads_share_one_pooled_client() -> None:
+    seen_hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_hosts.append(request.url.host)
+        return httpx.Response(200, content=_png_bytes(1200, 1000), headers={"content-type": "image/png"})
+
+    http_clients.set_transport_override(http_clients.AMAZON_IMAGES, httpx.MockTransport(handler))
+    try:
+        first = http_clients.get_client(http_clients.AMAZON_IMAGES)
+        meta = await download_bytes_limited("https://m.media-amazon.com/images/I/a.png")
+        again = http_clients.get_client(http_clients.AMAZON_IMAGES)
+    finally:
+        http_clients.set_transport_override(http_clients.AMAZON_IMAGES, None)
+        await http_clients.aclose_clients()
+
+    assert first is again
+    assert seen_hosts == ["m.media-amazon.com"]
+    assert meta["ok"] is True
+    assert (meta["width"], meta["height"]) == (1200, 1000)
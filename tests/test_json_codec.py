@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+
+import httpx
+import pytest
+
+from app import json_codec as api_codec
+from app.main import app as api_app
+from worker_app import json_codec as worker_codec, supabase_rest
+
+STAGE_OUTPUT = {
+    "stage_name": "gallery_cvr",
+    "asin_a": {"sampled_images": [{"url": "https://m.media-amazon.com/a.jpg", "width": 1500}], "score": 0.79},
+    "asin_b": {"evidence": ["Weiß – no lifestyle shots"], "score": None},
+    "confidence": 0.32,
+}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def codec_backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setenv("JSON_CODEC", request.param)
+    for codec in (api_codec, worker_codec):
+        codec.backend.cache_clear()
+    yield request.param
+    for codec in (api_codec, worker_codec):
+        codec.backend.cache_clear()
+
+
+def test_codec_round_trips_like_stdlib(codec_backend: str) -> None:
+    assert worker_codec.backend() == codec_backend
+    encoded = worker_codec.dumps({**STAGE_OUTPUT, "by_stage": {1: "done"}})
+    assert json.loads(encoded) == {**STAGE_OUTPUT, "by_stage": {"1": "done"}}
+    assert worker_codec.loads(encoded.decode("utf-8"))["asin_b"]["evidence"] == ["Weiß – no lifestyle shots"]
+
+
+@pytest.mark.asyncio
+async def test_rest_writes_and_reads_through_the_codec(codec_backend: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SUPABASE_URL", "https://db.example")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service")
+    sent: list[bytes] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request.content)
+        return httpx.Response(200, content=request.content)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        supabase_rest.httpx, "AsyncClient", lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw)
+    )
+
+    rows = await supabase_rest.update_many("job_stages", {"job_id": "eq.j1"}, {"output": STAGE_OUTPUT})
+
+    assert rows == [{"output": STAGE_OUTPUT}]
+    assert sent == [worker_codec.dumps({"output": STAGE_OUTPUT})]
+
+
+@pytest.mark.asyncio
+async def test_api_responses_use_the_codec(codec_backend: str) -> None:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_app), base_url="http://api.test") as client:
+        resp = await client.get("/healthz")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.content == api_codec.dumps(resp.json())
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import http_clients, openai_batch, poller
+from worker_app.pipeline import openai_chat_json
+
+
+class FakeBatchAPI:
+    """Local stand-in for OpenAI's /files and /batches endpoints."""
+
+    def __init__(self, *, polls_before_done: int = 1) -> None:
+        self.polls_before_done = polls_before_done
+        self.uploads: list[list[dict[str, Any]]] = []
+        self.batches: dict[str, dict[str, Any]] = {}
+        self.files: dict[str, str] = {}
+        self.chat_calls = 0
+        self.poll_failures: list[int] = []  # statuses answered to the next polls
+        self.cancelled: list[str] = []
+
+    def _complete(self, batch: dict[str, Any]) -> None:
+        outputs, errors = [], []
+        for line in self.uploads[int(batch["input_file_id"].rsplit("-", 1)[-1])]:
+            body = line["body"]
+            text = body["messages"][1]["content"][0]["text"]
+            if "fail" in text:
+                errors.append(
+                    {
+                        "custom_id": line["custom_id"],
+                        "response": {"status_code": 400, "body": {"error": {"message": "bad"}}},
+                    }
+                )
+                continue
+            outputs.append(
+                {
+                    "custom_id": line["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"content": json.dumps({"echo": text})}}]},
+                    },
+                }
+            )
+        batch["status"] = "completed"
+        batch["output_file_id"] = f"out-{batch['id']}"
+        batch["error_file_id"] = f"err-{batch['id']}"
+        self.files[batch["output_file_id"]] = "\n".join(json.dumps(o) for o in outputs)
+        self.files[batch["error_file_id"]] = "\n".join(json.dumps(e) for e in errors)
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/v1")
+        if path == "/chat/completions":
+            self.chat_calls += 1
+            return httpx.Response(500)
+        if request.method == "POST" and path == "/files":
+            raw = request.content.decode("utf-8")
+            lines = [json.loads(x) for x in raw.splitlines() if x.startswith('{"custom_id"')]
+            self.uploads.append(lines)
+            return httpx.Response(200, json={"id": f"file-{len(self.uploads) - 1}"})
+        if request.method == "POST" and path == "/batches":
+            body = json.loads(request.content)
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "status": "validating",
+                "input_file_id": body["input_file_id"],
+                "polls": 0,
+            }
+            return httpx.Response(200, json=self.batches[batch_id])
+        if request.method == "POST" and path.endswith("/cancel"):
+            self.cancelled.append(path.split("/")[2])
+            return httpx.Response(200, json={"status": "cancelling"})
+        if request.method == "GET" and path.startswith("/batches/") and self.poll_failures:
+            return httpx.Response(self.poll_failures.pop(0), json={"error": {"message": "x"}})
+        if request.method == "GET" and path.startswith("/batches/"):
+            batch = self.batches[path.split("/")[2]]
+            batch["polls"] += 1
+            if batch["polls"] >= self.polls_before_done:
+                self._complete(batch)
+            else:
+                batch["status"] = "in_progress"
+            return httpx.Response(200, json=batch)
+        if request.method == "GET" and path.startswith("/files/") and path.endswith("/content"):
+            return httpx.Response(200, text=self.files[path.split("/")[2]])
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def fake_batch_api(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeBatchAPI]:
+    fake = FakeBatchAPI()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_BATCH_WINDOW_SECONDS", "0")
+    monkeypatch.setenv("OPENAI_BATCH_POLL_SECONDS", "1")
+    http_clients.set_transport_override(http_clients.OPENAI, httpx.MockTransport(fake.handler))
+    try:
+        yield fake
+    finally:
+        http_clients.set_transport_override(http_clients.OPENAI, None)
+
+
+async def _bulk_call(text: str) -> dict[str, Any]:
+    openai_batch.llm_tier.set(openai_batch.tier_for_job({"priority": "bulk"}))
+    return await openai_chat_json(
+        system_prompt="Return JSON.",
+        user_content=[{"type": "text", "text": text}],
+        model="gpt-test",
+    )
+
+
+@pytest.mark.asyncio
+async def test_bulk_calls_share_one_batch_and_route_results(fake_batch_api: FakeBatchAPI) -> None:
+    results = await asyncio.gather(
+        _bulk_call("first"),
+        _bulk_call("second"),
+        _bulk_call("please fail"),
+        return_exceptions=True,
+    )
+
+    assert results[0] == {"echo": "first"}
+    assert results[1] == {"echo": "second"}
+    assert isinstance(results[2], Exception) and "400" in str(results[2])
+    assert len(fake_batch_api.uploads) == 1
+    assert len(fake_batch_api.uploads[0]) == 3
+    assert fake_batch_api.uploads[0][0]["url"] == "/v1/chat/completions"
+    assert fake_batch_api.chat_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_poll_rides_out_transient_errors(fake_batch_api: FakeBatchAPI, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_RETRY_BASE_MS", "50")
+    fake_batch_api.poll_failures = [503, 429, 502]
+
+    assert await _bulk_call("first") == {"echo": "first"}
+    assert fake_batch_api.poll_failures == []
+    assert fake_batch_api.cancelled == []
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_cancelled(fake_batch_api: FakeBatchAPI, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_RETRY_BASE_MS", "50")
+    monkeypatch.setenv("OPENAI_BATCH_MAX_RETRIES", "1")
+    fake_batch_api.poll_failures = [503, 503]
+
+    with pytest.raises(openai_batch.OpenAIBatchError):
+        await _bulk_call("first")
+    assert fake_batch_api.cancelled == ["batch-0"]
+
+
+def test_tier_for_job_respects_priority_and_mode(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert openai_batch.tier_for_job({"priority": "bulk"}) == "batch"
+    assert openai_batch.tier_for_job({"priority": "interactive"}) == "interactive"
+    assert openai_batch.tier_for_job({}) == "interactive"
+    monkeypatch.setenv("OPENAI_BATCH_MODE", "off")
+    assert openai_batch.tier_for_job({"priority": "bulk"}) == "interactive"
+
+
+@pytest.mark.asyncio
+async def test_interactive_claim_skips_bulk_jobs(monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[tuple[str, dict[str, str] | None]] = []
+
+    async def fake_claim(
+        status: str,
+        extra_filters: dict[str, str] | None = None,
+        *,
+        order: str = "created_at.asc",
+    ) -> str | None:
+        seen.append((status, extra_filters))
+        return "job-bulk-1" if extra_filters == {"priority": "eq.bulk"} else None
+
+    monkeypatch.setattr(poller, "_claim_job_with_status", fake_claim)
+
+    assert await poller.claim_next_job() is None
+    assert await poller.claim_next_bulk_job() == "job-bulk-1"
+    assert seen[0] == ("queued", {"priority": "neq.bulk"})
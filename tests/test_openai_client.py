@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import http_clients, openai_client, pipeline
+from worker_app.openai_client import QuotaWindow
+from worker_app.pipeline import openai_chat_json
+
+
+class FakeOpenAI:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.script: list[httpx.Response] = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+            if self.script:
+                return self.script.pop(0)
+            body = json.loads(request.content)
+            return httpx.Response(
+                200,
+                json={
+                    "model": body["model"],
+                    "choices": [{"message": {"content": '{"winner": "A"}'}}],
+                    "usage": {"total_tokens": 120},
+                },
+            )
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_openai(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeOpenAI]:
+    fake = FakeOpenAI()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_RETRY_BASE_MS", "50")
+    http_clients.set_transport_override(http_clients.OPENAI, httpx.MockTransport(fake.handler))
+    try:
+        yield fake
+    finally:
+        http_clients.set_transport_override(http_clients.OPENAI, None)
+
+
+async def _call(model: str = "gpt-test") -> dict[str, Any]:
+    return await openai_chat_json(
+        system_prompt="Return JSON.",
+        user_content=[{"type": "text", "text": "compare"}],
+        model=model,
+    )
+
+
+@pytest.mark.asyncio
+async def test_retries_429_honoring_retry_after(fake_openai: FakeOpenAI) -> None:
+    fake_openai.script = [
+        httpx.Response(429, headers={"retry-after-ms": "30"}, json={"error": {"code": "rate_limit_exceeded"}}),
+        httpx.Response(503, text="overloaded"),
+    ]
+
+    assert await _call() == {"winner": "A"}
+    assert fake_openai.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_insufficient_quota(fake_openai: FakeOpenAI) -> None:
+    fake_openai.script = [httpx.Response(429, json={"error": {"code": "insufficient_quota"}})]
+
+    with pytest.raises(openai_client.OpenAIHTTPError) as exc:
+        await _call()
+    assert exc.value.status_code == 429
+    assert fake_openai.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_per_model_concurrency_is_capped(
+    fake_openai: FakeOpenAI,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENT_PER_MODEL", "2")
+
+    results = await asyncio.gather(*[_call("gpt-capped") for _ in range(6)])
+
+    assert len(results) == 6
+    assert fake_openai.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_timeout_covers_all_attempts(fake_openai: FakeOpenAI, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "10")
+    fake_openai.script = [httpx.Response(503, headers={"retry-after-ms": "200"}, text="overloaded")] * 10
+    payload = {"model": "gpt-deadline", "messages": [{"role": "user", "content": "compare"}]}
+
+    started = asyncio.get_running_loop().time()
+    with pytest.raises(openai_client.OpenAIHTTPError) as exc:
+        await openai_client.chat_completion(payload, api_key="sk-test", timeout_seconds=0.5)
+
+    assert exc.value.status_code == 503
+    assert fake_openai.calls == 3  # a fourth would start after the deadline
+    assert asyncio.get_running_loop().time() - started < 0.5
+
+
+def test_parse_retry_after_variants() -> None:
+    assert openai_client.parse_retry_after(httpx.Headers({"retry-after": "2"})) == 2.0
+    assert openai_client.parse_retry_after(httpx.Headers({"retry-after-ms": "250"})) == 0.25
+    assert openai_client.parse_retry_after(httpx.Headers({})) is None
+
+
+@pytest.mark.asyncio
+async def test_quota_window_queues_until_tokens_free(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    slept: list[float] = []
+
+    async def fake_sleep(seconds: float) -> None:
+        slept.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(openai_client.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(openai_client.asyncio, "sleep", fake_sleep)
+    window = QuotaWindow(rpm_limit=0, tpm_limit=1000)
+
+    first = await window.acquire(700)
+    now[0] += 10
+    await window.acquire(700)
+
+    assert slept == [pytest.approx(50.0)]
+    window.settle(first, 100)
+    assert window.snapshot()["tokens_in_window"] == 700
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_skips_calls_and_stage_reports_it(
+    fake_openai: FakeOpenAI,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "0")
+    monkeypatch.setenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("OPENAI_TEXT_MODEL", "gpt-outage")
+    monkeypatch.setattr(openai_client, "_breakers", {})
+    fake_openai.script = [httpx.Response(503, text="down"), httpx.Response(500, text="down")]
+
+    for _ in range(2):
+        with pytest.raises(openai_client.OpenAIHTTPError):
+            await _call("gpt-outage")
+    calls_before = fake_openai.calls
+
+    with pytest.raises(openai_client.OpenAICircuitOpenError):
+        await _call("gpt-outage")
+    stage3 = await pipeline.stage3_text_alignment(
+        {
+            "asin_a": {"asin": "B000000001", "title": "Steel bottle", "bullets": ["Keeps cold"]},
+            "asin_b": {"asin": "B000000002", "title": "Glass bottle", "bullets": ["Dishwasher safe"]},
+        }
+    )
+
+    assert fake_openai.calls == calls_before
+    assert stage3["provider"] == "heuristics_fallback"
+    assert stage3["openai_circuit"]["state"] == "open"
+    assert stage3["openai_circuit"]["name"] == "openai:gpt-outage"
+
+
+@pytest.mark.asyncio
+async def test_local_failure_does_not_close_a_half_open_circuit(
+    fake_openai: FakeOpenAI, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "1")
+    monkeypatch.setattr(openai_client, "_breakers", {})
+    breaker = openai_client.get_model_breaker("gpt-probe")
+    breaker.record_failure("http_503")
+    assert breaker.opened_at is not None
+    breaker.opened_at -= breaker.cooldown_seconds  # cooldown over
+    payload = {"model": "gpt-probe", "messages": [{"role": "user", "content": "compare"}]}
+
+    with pytest.raises(TimeoutError):  # out of budget before reaching OpenAI
+        await openai_client.chat_completion(payload, api_key="sk-test", timeout_seconds=0)
+
+    assert breaker.state == "half_open"
+    assert fake_openai.calls == 0
+    assert breaker.allow()  # the probe slot was released
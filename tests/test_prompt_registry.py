@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from worker_app import pipeline, prompt_registry
+from worker_app.prompt_registry import PromptRegistry, sha256_hex
+
+
+def _write(root: Path, rel: str, text: str) -> Path:
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+@pytest.mark.asyncio
+async def test_db_rows_override_files_and_bad_hashes_are_rejected(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    _write(tmp_path, "vision-ctr/v1.0.md", "file prompt")
+    _write(tmp_path, "text-alignment/v1.0.md", "file text prompt")
+    rows = [
+        {"id": "pv-1", "type": "vision-ctr", "version": "v1.0", "content": "db prompt",
+         "content_hash": sha256_hex("db prompt")},
+        {"id": "pv-2", "type": "text-alignment", "version": "v1.0", "content": "tampered",
+         "content_hash": "0" * 64},
+    ]
+
+    async def fake_select_many(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+        assert table == "prompt_versions" and params["is_active"] == "eq.true"
+        return rows
+
+    monkeypatch.setattr(prompt_registry, "select_many", fake_select_many)
+    registry = PromptRegistry(tmp_path)
+    await registry.refresh()
+
+    ctr = registry.get("vision-ctr/v1.0.md")
+    text = registry.get("text-alignment/v1.0.md")
+    assert ctr is not None and ctr.content == "db prompt" and ctr.prompt_version_id == "pv-1"
+    assert text is not None and text.source == "file"
+    assert registry.rejected_rows == ["text-alignment/v1.0.md"]
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_files_and_hot_reloads_changes(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def db_down(table: str, params: dict[str, str]) -> list[dict[str, Any]]:
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(prompt_registry, "select_many", db_down)
+    monkeypatch.setenv("PROMPT_REGISTRY_REFRESH_SECONDS", "0")
+    path = _write(tmp_path, "vision-ctr/v1.0.md", "v1")
+    registry = PromptRegistry(tmp_path)
+    await registry.ensure_fresh()
+    assert registry.get("vision-ctr/v1.0.md").content == "v1"
+    assert registry.db_error == "db down"
+
+    path.write_text("v1 edited", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    await registry.ensure_fresh()
+
+    entry = registry.get("vision-ctr/v1.0.md")
+    assert entry.content == "v1 edited"
+    assert entry.content_hash == sha256_hex("v1 edited")
+
+
+def test_integrity_reports_prompt_version_id_without_io(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    registry = PromptRegistry(tmp_path)
+    registry._install(
+        {
+            "vision-ctr/v1.0.md": prompt_registry.PromptEntry(
+                rel_path="vision-ctr/v1.0.md",
+                type="vision-ctr",
+                version="v1.0",
+                content="db prompt",
+                content_hash=sha256_hex("db prompt"),
+                prompt_version_id="pv-1",
+                source="db",
+            )
+        }
+    )
+    monkeypatch.setattr(prompt_registry, "_registry", registry)
+    job = {"prompt_versions_pinned": {"vision-ctr": sha256_hex("db prompt")}}
+
+    prompt, integrity = pipeline.load_prompt_with_integrity(job, "vision-ctr/v1.0.md")
+
+    assert prompt == "db prompt"
+    assert integrity["prompt_version_id"] == "pv-1"
+    assert integrity["validated"] is True
+    assert pipeline.stage_prompt_version({"prompt_integrity": integrity}) == {"prompt_version_id": "pv-1"}
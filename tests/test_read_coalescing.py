@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from app import read_coalescing as api_read_coalescing, supabase_rest as api_rest
+from worker_app import supabase_rest as worker_rest
+from worker_app.read_coalescing import ReadCoalescer
+
+
+class FakePostgrest:
+    def __init__(self) -> None:
+        self.gets = 0
+        self.release = asyncio.Event()
+        self.release.set()
+        self.fail = False
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            self.gets += 1
+            read = self.gets
+            await self.release.wait()
+            if self.fail:
+                return httpx.Response(503, json={"message": "unavailable"})
+            return httpx.Response(200, json=[{"id": "job-1", "status": "queued", "read": read}])
+        return httpx.Response(200, json=[{"id": "job-1"}])
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        # Both apps' supabase_rest modules share the httpx module.
+        real_client = httpx.AsyncClient
+        transport = httpx.MockTransport(self.handler)
+        monkeypatch.setattr(httpx, "AsyncClient", lambda **kw: real_client(transport=transport, **kw))
+
+
+@pytest.fixture
+def postgrest(monkeypatch: pytest.MonkeyPatch) -> FakePostgrest:
+    monkeypatch.setenv("SUPABASE_URL", "https://db.example")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service")
+    fake = FakePostgrest()
+    fake.install(monkeypatch)
+    return fake
+
+
+JOB = {"select": "*", "id": "eq.job-1"}
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_reads_share_one_request(postgrest: FakePostgrest) -> None:
+    postgrest.release.clear()
+    reads = [asyncio.create_task(worker_rest.select_one("jobs", dict(JOB))) for _ in range(10)]
+    await asyncio.sleep(0.01)
+    postgrest.release.set()
+    rows = await asyncio.gather(*reads)
+
+    assert postgrest.gets == 1
+    assert all(row == {"id": "job-1", "status": "queued", "read": 1} for row in rows)
+    rows[0]["status"] = "mutated"  # every caller decodes its own copy
+    assert rows[1]["status"] == "queued"
+
+    await worker_rest.select_one("jobs", dict(JOB))
+    assert postgrest.gets == 2  # nothing cached once the request finished
+
+
+@pytest.mark.asyncio
+async def test_a_write_detaches_reads_already_in_flight(postgrest: FakePostgrest) -> None:
+    postgrest.release.clear()
+    before = asyncio.create_task(worker_rest.select_one("jobs", dict(JOB)))
+    await asyncio.sleep(0.01)
+    await worker_rest.update_many("jobs", {"id": "eq.job-1"}, {"status": "processing"})
+    after = asyncio.create_task(worker_rest.select_one("jobs", dict(JOB)))
+    await asyncio.sleep(0.01)
+    postgrest.release.set()
+
+    assert (await before)["read"] == 1
+    assert (await after)["read"] == 2
+
+
+@pytest.mark.asyncio
+async def test_one_caller_cancelling_does_not_cancel_the_others(postgrest: FakePostgrest) -> None:
+    postgrest.release.clear()
+    impatient = asyncio.create_task(worker_rest.select_one("jobs", dict(JOB)))
+    patient = asyncio.create_task(worker_rest.select_one("jobs", dict(JOB)))
+    await asyncio.sleep(0.01)
+    impatient.cancel()
+    postgrest.release.set()
+
+    assert (await patient)["id"] == "job-1"
+    assert impatient.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_are_not_cached(postgrest: FakePostgrest) -> None:
+    postgrest.fail = True
+    results = await asyncio.gather(
+        *(worker_rest.select_one("jobs", dict(JOB)) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+    assert postgrest.gets == 1
+
+    postgrest.fail = False
+    assert (await worker_rest.select_one("jobs", dict(JOB)))["read"] == 2
+
+
+@pytest.mark.asyncio
+async def test_micro_ttl_cache_serves_hot_profile_rows(postgrest: FakePostgrest, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SUPABASE_READ_CACHE_TABLES", "user_profiles")
+    monkeypatch.setenv("SUPABASE_READ_CACHE_TTL_MS", "60000")
+    profile = {"select": "*", "id": "eq.user-1"}
+
+    for _ in range(3):
+        await api_rest.select_one("user_profiles", dict(profile))
+    await api_rest.select_one("jobs", dict(JOB))
+    await api_rest.select_one("jobs", dict(JOB))
+    assert postgrest.gets == 3  # one profile read, two job reads
+
+    await api_rest.rpc("apply_credit_purchase", {})
+    await api_rest.select_one("user_profiles", dict(profile))
+    assert postgrest.gets == 4
+    assert api_read_coalescing.get_read_coalescer().snapshot()["cache_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_coalescing_can_be_turned_off() -> None:
+    calls = 0
+
+    async def fetch() -> bytes:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return b"[]"
+
+    coalescer = ReadCoalescer(enabled=False)
+    await asyncio.gather(*(coalescer.read("jobs", JOB, fetch) for _ in range(4)))
+    assert calls == 4
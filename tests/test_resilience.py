@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from worker_app import pipeline, resilience
+from worker_app.resilience import CircuitBreaker, NegativeCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+def test_breaker_opens_on_burst_and_recovers_through_probe(clock: FakeClock) -> None:
+    breaker = CircuitBreaker("t", failure_threshold=3, window_seconds=30, cooldown_seconds=60)
+
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure("captcha")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += 61
+    assert breaker.allow()  # half-open probe
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["open_count"] == 1
+
+
+def test_breaker_ignores_failures_outside_window(clock: FakeClock) -> None:
+    breaker = CircuitBreaker("t", failure_threshold=2, window_seconds=10, cooldown_seconds=60)
+    breaker.record_failure()
+    clock.now += 11
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens(clock: FakeClock) -> None:
+    breaker = CircuitBreaker("t", failure_threshold=1, window_seconds=10, cooldown_seconds=5)
+    breaker.record_failure()
+    clock.now += 6
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.open_count == 2
+
+
+def test_released_probe_leaves_the_circuit_half_open(clock: FakeClock) -> None:
+    breaker = CircuitBreaker("t", failure_threshold=1, window_seconds=10, cooldown_seconds=5)
+    breaker.record_failure()
+    clock.now += 6
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # another caller may probe right away
+
+
+def test_negative_cache_expires(clock: FakeClock) -> None:
+    cache: NegativeCache[str] = NegativeCache(ttl_seconds=30)
+    cache.put("B000000001", "blocked")
+    assert cache.get("B000000001") == "blocked"
+    clock.now += 31
+    assert cache.get("B000000001") is None
+
+
+@pytest.mark.asyncio
+async def test_direct_fetch_fails_fast_while_circuit_open(
+    clock: FakeClock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.delenv("AMAZON_PROXY_URLS", raising=False)
+    breaker = CircuitBreaker("amazon_direct_html", failure_threshold=2, window_seconds=60, cooldown_seconds=120)
+    monkeypatch.setattr(pipeline, "_direct_fetch_breaker", breaker)
+    monkeypatch.setattr(pipeline, "_direct_fetch_negative_cache", NegativeCache(ttl_seconds=60))
+    calls: list[str] = []
+
+    async def blocked_fetch(asin: str, *, proxy: str | None = None) -> dict[str, Any]:
+        calls.append(asin)
+        return {"asin": asin, "ok": False, "http_status": 200, "blocked": True, "error": "captcha"}
+
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing", blocked_fetch)
+
+    first = await pipeline.fetch_amazon_listing_direct_reliable("B000000001")
+    second = await pipeline.fetch_amazon_listing_direct_reliable("B000000002")
+    cached = await pipeline.fetch_amazon_listing_direct_reliable("B000000001")
+    skipped = await pipeline.fetch_amazon_listing_direct_reliable("B000000003")
+
+    assert first["ok"] is False and second["ok"] is False
+    assert breaker.state == "open"
+    assert cached.get("negative_cache_hit") is True
+    assert skipped.get("circuit_open") is True
+    assert calls == ["B000000001", "B000000002"]
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from app import supabase_rest as api_rest
+from worker_app import pipeline, supabase_rest as worker_rest
+
+
+class FakePostgrest:
+    def __init__(self) -> None:
+        self.seen: list[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.seen.append(request)
+        if "return=minimal" in request.headers.get("Prefer", ""):
+            return httpx.Response(204 if request.method != "POST" else 201)
+        row = {"id": "row-1", "status": "queued", "output": {"notes": ["x" * 200]}}
+        select = request.url.params.get("select")
+        if select:
+            row = {c: row.get(c) for c in select.split(",")}
+        return httpx.Response(200, json=[row])
+
+
+@pytest.fixture
+def postgrest(monkeypatch: pytest.MonkeyPatch) -> FakePostgrest:
+    monkeypatch.setenv("SUPABASE_URL", "https://db.example")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "service")
+    fake = FakePostgrest()
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(fake.handler)
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kw: real_client(transport=transport, **kw))
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_stage_and_job_writes_ask_for_nothing_back(postgrest: FakePostgrest) -> None:
+    await pipeline.mark_stage("job-1", 2, {"status": "completed", "output": {"big": "x" * 5000}})
+    await pipeline.set_job_status("job-1", "completed")
+
+    assert [r.headers["Prefer"] for r in postgrest.seen] == ["return=minimal"] * 2
+    assert all("select" not in r.url.params for r in postgrest.seen)
+
+
+@pytest.mark.asyncio
+async def test_returning_projects_the_written_rows(postgrest: FakePostgrest) -> None:
+    rows = await worker_rest.update_many("jobs", {"id": "eq.row-1"}, {"status": "queued"}, returning="id")
+    assert rows == [{"id": "row-1"}]
+    assert postgrest.seen[-1].url.params["select"] == "id"
+    assert postgrest.seen[-1].url.params["id"] == "eq.row-1"
+
+    assert await worker_rest.delete_many("jobs", {"id": "eq.row-1"}, returning=None) == []
+    assert await worker_rest.insert_one("jobs", {"status": "queued"}, returning=None) == {}
+
+    full = await worker_rest.update_one("jobs", {"id": "eq.row-1"}, {"status": "queued"})
+    assert full is not None and "output" in full  # the default is unchanged
+    assert postgrest.seen[-1].headers["Prefer"] == "return=representation"
+
+
+@pytest.mark.asyncio
+async def test_api_writes_support_the_same_options(postgrest: FakePostgrest) -> None:
+    assert await api_rest.insert_one("jobs", {"status": "seeding"}, returning="id") == {"id": "row-1"}
+    assert await api_rest.insert_many("job_stages", [{"stage_number": 0}], returning=None) == []
+    assert await api_rest.update_one("jobs", {"id": "eq.row-1"}, {"status": "queued"}, returning=None) is None
+    assert [r.headers["Prefer"] for r in postgrest.seen] == [
+        "return=representation",
+        "return=minimal",
+        "return=minimal",
+    ]
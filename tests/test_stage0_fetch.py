@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from worker_app import pipeline
+
+
+def _listing(asin: str, provider: str) -> dict[str, Any]:
+    return {
+        "asin": asin,
+        "ok": True,
+        "provider": provider,
+        "title": f"Product {asin}",
+        "bullets": ["One", "Two"],
+        "main_image_url": f"https://m.media-amazon.com/images/I/{asin}.jpg",
+        "image_urls": [f"https://m.media-amazon.com/images/I/{asin}.jpg"],
+    }
+
+
+@pytest.mark.asyncio
+async def test_hedged_fetch_prefers_fast_direct_and_cancels_apify(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_API_KEY", "test-token")
+    monkeypatch.setenv("STAGE0_FETCH_MODE", "hedged")
+    apify_cancelled: list[str] = []
+
+    async def slow_apify(asin: str, apify_api_key: str, actor_id: str) -> dict[str, Any]:
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            apify_cancelled.append(asin)
+            raise
+        return _listing(asin, "apify_actor")
+
+    async def fast_direct(asin: str) -> dict[str, Any]:
+        return _listing(asin, "direct_html")
+
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_via_apify_reliable", slow_apify)
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_direct_reliable", fast_direct)
+
+    output = await pipeline.stage0_listing_fetch({"asin_a": "B000000001", "asin_b": "B000000002"})
+    await asyncio.gather(*list(pipeline._background_tasks))
+
+    pipeline.validate_stage_output(0, output)
+    assert output["ok"] is True
+    assert output["fetch_mode"] == "hedged"
+    assert output["asin_a"]["provider"] == "direct_html_hedged"
+    assert output["asin_a"]["hedge"]["winner"] == "direct_html"
+    assert output["asin_a"]["hedge"]["cancelled"] == ["apify_actor"]
+    assert sorted(apify_cancelled) == ["B000000001", "B000000002"]
+
+
+@pytest.mark.asyncio
+async def test_hedged_fetch_waits_for_apify_when_direct_is_blocked(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("APIFY_API_KEY", "test-token")
+    monkeypatch.setenv("STAGE0_FETCH_MODE", "hedged")
+
+    async def apify(asin: str, apify_api_key: str, actor_id: str) -> dict[str, Any]:
+        await asyncio.sleep(0.01)
+        return _listing(asin, "apify_actor")
+
+    async def blocked_direct(asin: str) -> dict[str, Any]:
+        return {"asin": asin, "ok": False, "blocked": True, "error": "captcha"}
+
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_via_apify_reliable", apify)
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_direct_reliable", blocked_direct)
+
+    result = await pipeline.fetch_listing_hedged("B000000001", "test-token", "actor")
+
+    assert result["ok"] is True
+    assert result["provider"] == "apify_actor"
+    assert result["hedge"]["winner"] == "apify_actor"
+    assert result["hedge"]["cancelled"] == []
+
+
+@pytest.mark.asyncio
+async def test_prefetch_starts_per_asin_work_before_the_slow_side_lands(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.delenv("APIFY_API_KEY", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    release_b = asyncio.Event()
+    downloads: list[str] = []
+
+    async def direct(asin: str) -> dict[str, Any]:
+        if asin == "B000000002":
+            await release_b.wait()
+        return _listing(asin, "direct_html")
+
+    async def fake_download(url: str, max_bytes: int = 2_000_000) -> dict[str, Any]:
+        downloads.append(url)
+        if "B000000001" in url:
+            # A's image work runs while B's listing is still in flight.
+            release_b.set()
+        return {"url": url, "ok": True, "width": 1000, "height": 1000}
+
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_direct_reliable", direct)
+    monkeypatch.setattr(pipeline, "download_bytes_limited", fake_download)
+
+    prefetch = pipeline.ListingPrefetch()
+    stage0 = await asyncio.wait_for(
+        pipeline.stage0_listing_fetch({"asin_a": "B000000001", "asin_b": "B000000002"}, prefetch=prefetch),
+        timeout=2,
+    )
+    stage1 = await pipeline.stage1_main_image_ctr(stage0, prefetch=prefetch)
+    stage2 = await pipeline.stage2_gallery_cvr(stage0, prefetch=prefetch)
+    stage3 = await pipeline.stage3_text_alignment(stage0, prefetch=prefetch)
+    prefetch.close()
+
+    assert stage0["listing_ready_ms"]["asin_a"] <= stage0["listing_ready_ms"]["asin_b"]
+    assert stage1["asin_a"]["score"] > 0
+    assert stage2["asin_b"]["sampled_images"]
+    assert stage3["asin_a"]["metrics"]["bullet_count"] == 2
+    # Each image was downloaded once (main + gallery per side), all via the prefetch.
+    assert len(downloads) == 4
+    assert prefetch.hits == 6
+
+
+@pytest.mark.asyncio
+async def test_failed_side_cancels_the_other_asins_fetch(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("APIFY_API_KEY", raising=False)
+    cancelled: list[str] = []
+
+    async def direct(asin: str) -> dict[str, Any]:
+        if asin == "B000000001":
+            return {"asin": asin, "ok": False, "error": "blocked"}
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(asin)
+            raise
+        return _listing(asin, "direct_html")
+
+    monkeypatch.setattr(pipeline, "fetch_amazon_listing_direct_reliable", direct)
+
+    output = await asyncio.wait_for(
+        pipeline.stage0_listing_fetch({"asin_a": "B000000001", "asin_b": "B000000002"}),
+        timeout=2,
+    )
+
+    pipeline.validate_stage_output(0, output)
+    assert output["ok"] is False
+    assert output["asin_a"]["error"] == "blocked"
+    assert output["asin_b"]["provider"] == "cancelled"
+    assert cancelled == ["B000000002"]
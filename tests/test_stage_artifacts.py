@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from app import main
+from app.auth import AuthenticatedUser, require_user
+from app.main import app as api_app
+from worker_app import stage_artifacts
+from worker_app.pipeline import validate_stage_output
+
+
+def _stage0() -> dict[str, Any]:
+    def listing(asin: str) -> dict[str, Any]:
+        return {
+            "asin": asin,
+            "ok": True,
+            "provider": "apify_actor",
+            "title": f"Product {asin}",
+            "main_image_url": f"https://images.example.com/{asin}/main.jpg",
+            "image_urls": [f"https://images.example.com/{asin}/{i}.jpg" for i in range(3)],
+            "apify_attempt_count": 2,
+            "apify_attempts": [{"attempt": 1, "ok": False, "error": "upstream timeout"}, {"attempt": 2, "ok": True}],
+            "direct_attempts": [],
+        }
+
+    return {"stage_name": "listing_fetch", "ok": True, "asin_a": listing("B0A"), "asin_b": listing("B0B")}
+
+
+class FakeArtifactTable:
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.inserts = 0
+        self.down = False
+
+    async def insert_many(
+        self,
+        table: str,
+        rows: list[dict[str, Any]],
+        *,
+        returning: str | None = "*",
+        ignore_duplicates: bool = False,
+    ) -> list[dict[str, Any]]:
+        assert table == "stage_artifacts" and returning is None and ignore_duplicates
+        if self.down:
+            raise httpx.ConnectError("connection refused")
+        self.inserts += 1
+        for row in rows:
+            self.rows.setdefault(row["content_hash"], row)
+        return []
+
+
+@pytest.fixture
+def artifacts(monkeypatch: pytest.MonkeyPatch) -> FakeArtifactTable:
+    monkeypatch.delenv("STAGE_DEBUG_ARTIFACTS", raising=False)
+    monkeypatch.setattr(stage_artifacts, "_known_hashes", OrderedDict())
+    table = FakeArtifactTable()
+    monkeypatch.setattr(stage_artifacts, "insert_many", table.insert_many)
+    return table
+
+
+def test_summary_keeps_what_the_job_page_and_schema_gate_use() -> None:
+    evidence = [{"asin": "A", "factor": f"f{i}", "detail": "d"} for i in range(12)]
+    output = {**_stage0(), "notes": ["Heuristic proxy."], "evidence": evidence}
+
+    summary, debug = stage_artifacts.split_stage_output(output)
+
+    validate_stage_output(0, summary)
+    assert summary["asin_a"]["title"] == "Product B0A"
+    assert summary["asin_a"]["main_image_url"].endswith("/B0A/main.jpg")
+    assert summary["asin_a"]["apify_attempt_count"] == 2
+    assert "apify_attempts" not in summary["asin_a"] and "notes" not in summary
+    assert summary["evidence"] == evidence[:8]
+    assert debug == {
+        "asin_a": {"apify_attempts": output["asin_a"]["apify_attempts"], "direct_attempts": []},
+        "asin_b": {"apify_attempts": output["asin_b"]["apify_attempts"], "direct_attempts": []},
+        "notes": ["Heuristic proxy."],
+        "evidence": evidence,
+    }
+
+
+@pytest.mark.asyncio
+async def test_identical_debug_detail_is_stored_once(artifacts: FakeArtifactTable) -> None:
+    first = await stage_artifacts.slim_stage_output(_stage0())
+    reordered = {k: dict(reversed(list(v.items()))) if isinstance(v, dict) else v for k, v in _stage0().items()}
+    second = await stage_artifacts.slim_stage_output(reordered)
+
+    digest = first["debug_artifact"]
+    assert second["debug_artifact"] == digest  # hashed over canonical JSON
+    assert artifacts.inserts == 1
+    assert artifacts.rows[digest]["content"]["asin_b"]["apify_attempts"][0]["error"] == "upstream timeout"
+    assert artifacts.rows[digest]["size_bytes"] > 0
+
+    plain = {"stage_name": "avatars", "avatars": []}
+    assert await stage_artifacts.slim_stage_output(plain) is plain  # nothing to split out
+
+
+@pytest.mark.asyncio
+async def test_output_stays_inline_when_the_artifact_cannot_be_stored(
+    artifacts: FakeArtifactTable, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    artifacts.down = True
+    output = _stage0()
+    assert await stage_artifacts.slim_stage_output(output) == output
+
+    artifacts.down = False
+    monkeypatch.setenv("STAGE_DEBUG_ARTIFACTS", "off")
+    assert await stage_artifacts.slim_stage_output(output) == output
+    assert artifacts.inserts == 0
+
+
+@pytest.fixture
+def api_rows(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[tuple[str, dict[str, str]]]]:
+    reads: list[tuple[str, dict[str, str]]] = []
+    rows = {
+        "jobs": {"id": "job-1", "user_id": "user-1"},
+        "job_stages": {"debug_artifact": "abc123"},
+        "stage_artifacts": {"content": {"notes": ["Heuristic proxy."]}},
+    }
+
+    async def select_one(table: str, params: dict[str, str]) -> dict[str, Any] | None:
+        reads.append((table, params))
+        return rows[table]
+
+    monkeypatch.setattr(main, "select_one", select_one)
+    api_app.dependency_overrides[require_user] = lambda: AuthenticatedUser(user_id="user-1", email=None)
+    yield reads
+    api_app.dependency_overrides.pop(require_user, None)
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoint_serves_the_owners_artifact(api_rows: list[tuple[str, dict[str, str]]]) -> None:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_app), base_url="http://api.test") as client:
+        resp = await client.get("/jobs/job-1/stages/2/debug")
+        assert resp.json() == {
+            "job_id": "job-1",
+            "stage_number": 2,
+            "content_hash": "abc123",
+            "debug": {"notes": ["Heuristic proxy."]},
+        }
+        assert api_rows[1] == (
+            "job_stages",
+            {"select": "debug_artifact:output->>debug_artifact", "job_id": "eq.job-1", "stage_number": "eq.2"},
+        )
+        assert api_rows[2][1]["content_hash"] == "eq.abc123"
+
+        api_app.dependency_overrides[require_user] = lambda: AuthenticatedUser(user_id="user-2", email=None)
+        assert (await client.get("/jobs/job-1/stages/2/debug")).status_code == 404
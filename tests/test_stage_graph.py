@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import pipeline
+from worker_app.stage_graph import (
+    ABORT_JOB,
+    JobBudget,
+    StageContext,
+    StageOutcome,
+    StageSpec,
+    run_stage_graph,
+    validate_graph,
+)
+
+
+def _spec(number: int, deps: tuple[int, ...] = (), **kwargs: Any) -> StageSpec:
+    async def run(ctx: StageContext) -> dict[str, Any]:
+        return {}
+
+    return StageSpec(number=number, name=f"s{number}", run=run, depends_on=deps, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_stage_starts_when_its_own_dependencies_finish() -> None:
+    order: list[str] = []
+    slow_done = asyncio.Event()
+
+    async def execute(spec: StageSpec) -> StageOutcome:
+        order.append(f"start {spec.number}")
+        if spec.number == 1:
+            await slow_done.wait()
+        if spec.number == 3:
+            slow_done.set()
+        order.append(f"end {spec.number}")
+        return StageOutcome(status="completed")
+
+    specs = [_spec(0), _spec(1, (0,)), _spec(3, (0,)), _spec(4, (1, 3))]
+    run = await run_stage_graph(specs, execute)
+
+    # Stage 3 ran to completion while Stage 1 was still in flight.
+    assert order.index("end 3") < order.index("end 1")
+    assert order[-1] == "end 4"
+    assert run.critical_path(specs) == [0, 1, 4]
+    assert run.failed_stage is None
+
+
+@pytest.mark.asyncio
+async def test_abort_stage_cancels_the_rest_of_the_graph() -> None:
+    started: list[int] = []
+
+    async def execute(spec: StageSpec) -> StageOutcome:
+        started.append(spec.number)
+        if spec.number == 2:
+            await asyncio.sleep(10)
+        return StageOutcome(status="failed", error="boom") if spec.number == 1 else StageOutcome(status="completed")
+
+    specs = [_spec(0), _spec(1, (0,), on_failure=ABORT_JOB), _spec(2, (0,)), _spec(3, (1, 2))]
+    run = await asyncio.wait_for(run_stage_graph(specs, execute), timeout=2)
+
+    assert run.failed_stage == 1
+    assert 3 not in started
+    assert 2 not in run.outcomes
+    assert run.summary(specs)["stages"]["2"]["status"] == "cancelled"
+
+
+def test_job_budget_caps_each_stage() -> None:
+    budget = JobBudget(total_seconds=100.0)
+
+    assert budget.stage_seconds(_spec(0, timeout_seconds=900, budget_share=0.5)) == pytest.approx(50.0)
+    assert budget.stage_seconds(_spec(1, timeout_seconds=10, budget_share=0.5)) == 10
+    assert budget.stage_seconds(_spec(2)) == pytest.approx(100.0, abs=0.5)
+
+    budget.started_at -= 99.5
+    assert budget.stage_seconds(_spec(3, budget_share=0.5)) == 1.0  # floor
+
+
+def test_bulk_jobs_get_their_own_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    for key in ("JOB_DEADLINE_SECONDS", "JOB_DEADLINE_BULK_SECONDS", "STAGE1_TIMEOUT_SECONDS", "STAGE_TIMEOUT_BULK_SECONDS"):
+        monkeypatch.delenv(key, raising=False)
+    interactive = pipeline.job_budget()
+    stage1 = pipeline.default_stage_graph()[1]
+    assert interactive.total_seconds == 1200
+    assert interactive.stage_seconds(stage1) == pytest.approx(300.0)
+
+    token = pipeline.openai_batch.llm_tier.set("batch")
+    try:
+        bulk = pipeline.job_budget()
+        specs = pipeline.default_stage_graph()
+    finally:
+        pipeline.openai_batch.llm_tier.reset(token)
+    assert bulk.total_seconds == 180000
+    assert [spec.budget_share for spec in specs] == [0.5, None, None, None, None, None]
+    assert bulk.stage_seconds(specs[1]) == pytest.approx(90000.0)
+    assert bulk.stage_seconds(specs[0]) == pytest.approx(900.0)  # Stage 0 makes no LLM calls
+
+
+def test_graph_validation_rejects_cycles_and_unknown_deps() -> None:
+    with pytest.raises(ValueError, match="cycle"):
+        validate_graph([_spec(0, (1,)), _spec(1, (0,))])
+    with pytest.raises(ValueError, match="unknown"):
+        validate_graph([_spec(0, (7,))])
+
+
+@pytest.mark.asyncio
+async def test_heuristic_result_is_published_before_the_llm_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    events: list[str] = []
+    published: list[dict[str, Any]] = []
+
+    async def download(url: str, max_bytes: int = 2_000_000, **_: Any) -> dict[str, Any]:
+        return {"url": url, "ok": True, "width": 1500, "height": 1500, "bytes_downloaded": 180_000}
+
+    async def chat_json(**kwargs: Any) -> dict[str, Any]:
+        events.append("llm")
+        return {"ctr_score_a": 7, "ctr_score_b": 5}
+
+    async def on_provisional(output: dict[str, Any]) -> None:
+        events.append("provisional")
+        published.append(output)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(pipeline, "download_bytes_limited", download)
+    monkeypatch.setattr(pipeline, "openai_chat_json", chat_json)
+    monkeypatch.setattr(pipeline, "load_prompt_with_integrity", lambda job, rel: ("prompt", {"ok": True}))
+    stage0 = {
+        side: {"asin": asin, "main_image_url": f"https://m.media-amazon.com/images/I/{asin}.jpg"}
+        for side, asin in (("asin_a", "B000000001"), ("asin_b", "B000000002"))
+    }
+
+    final = await pipeline.stage1_main_image_ctr(stage0, on_provisional=on_provisional)
+
+    assert events == ["provisional", "llm"]
+    assert published[0]["provisional"] is True
+    assert published[0]["provider"] == "heuristics"
+    assert published[0]["ctr_winner"] in {"A", "B", "TIE"}
+    assert final["provider"] == "openai"
+    assert "provisional" not in final
+
+
+class FakeJobStore:
+    """Records what run_pipeline_for_job writes instead of calling Supabase."""
+
+    def __init__(self) -> None:
+        self.marks: list[tuple[int, str | None]] = []
+        self.outputs: dict[int, dict[str, Any]] = {}
+        self.events: dict[str, dict[str, Any]] = {}
+        self.job_status: list[str] = []
+        self.rpc_available = True
+        self.rpc_calls = 0
+        self.separate_writes = 0
+        self.job: dict[str, Any] = {"id": "job-1", "user_id": "user-1", "asin_a": "A", "asin_b": "B"}
+
+    def _mark(self, n: int, patch: dict[str, Any]) -> None:
+        self.marks.append((n, patch.get("status")))
+        if "output" in patch:
+            self.outputs[n] = patch["output"]
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        async def rpc(function_name: str, params: dict[str, Any]) -> Any:
+            assert function_name == "transition_stage"
+            if not self.rpc_available:
+                request = httpx.Request("POST", "https://db.example/rest/v1/rpc/transition_stage")
+                response = httpx.Response(404, request=request)
+                raise httpx.HTTPStatusError("not found", request=request, response=response)
+            self.rpc_calls += 1
+            if params["p_stage_number"] is not None and params["p_stage_patch"]:
+                self._mark(params["p_stage_number"], params["p_stage_patch"])
+            if params["p_job_status"]:
+                self.job_status.append(params["p_job_status"])
+            if params["p_event"]:
+                self.events[params["p_event"]["event_name"]] = params["p_event"]["properties"]
+            return {"applied": True, "stage_rows": 1}
+
+        async def select_one(table: str, params: dict[str, str]) -> dict[str, Any]:
+            return dict(self.job)
+
+        async def mark_stage(job_id: str, n: int, patch: dict[str, Any]) -> None:
+            self.separate_writes += 1
+            self._mark(n, patch)
+
+        async def set_job_status(job_id: str, status: str) -> None:
+            self.separate_writes += 1
+            self.job_status.append(status)
+
+        async def noop(*args: Any, **kwargs: Any) -> None:
+            return None
+
+        async def record_event(*, event_name: str, properties: dict[str, Any] | None = None, **kwargs: Any) -> None:
+            self.separate_writes += 1
+            self.events[event_name] = properties or {}
+
+        async def stage0(job: dict[str, Any], **kwargs: Any) -> dict[str, Any]:
+            return {"stage_name": "listing_fetch", "ok": True, "asin_a": {}, "asin_b": {}}
+
+        monkeypatch.setattr(pipeline, "_transition_rpc_missing_at", None)
+        monkeypatch.setattr(pipeline, "rpc", rpc)
+        monkeypatch.setattr(pipeline, "select_one", select_one)
+        monkeypatch.setattr(pipeline, "mark_stage", mark_stage)
+        monkeypatch.setattr(pipeline, "set_job_status", set_job_status)
+        monkeypatch.setattr(pipeline, "ensure_stage_rows", noop)
+        monkeypatch.setattr(pipeline, "record_analytics_event", record_event)
+        monkeypatch.setattr(pipeline.get_prompt_registry(), "ensure_fresh", noop)
+        monkeypatch.setattr(pipeline, "stage0_listing_fetch", stage0)
+        monkeypatch.setattr(pipeline, "validate_stage_output", lambda n, out: None)
+
+
+@pytest.fixture
+def job_store(monkeypatch: pytest.MonkeyPatch) -> FakeJobStore:
+    store = FakeJobStore()
+    store.install(monkeypatch)
+    return store
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rpc_available", [True, False])
+async def test_pipeline_runs_default_graph(
+    job_store: FakeJobStore,
+    monkeypatch: pytest.MonkeyPatch,
+    rpc_available: bool,
+) -> None:
+    job_store.rpc_available = rpc_available
+
+    async def stage3(s0: dict[str, Any], job: dict[str, Any], **kwargs: Any) -> dict[str, Any]:
+        raise RuntimeError("text model down")
+
+    async def stage_ok(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        return {"stage_name": "x", "winner": "asin_a", "confidence": 0.7}
+
+    monkeypatch.setattr(pipeline, "stage3_text_alignment", stage3)
+    for name in ("stage1_main_image_ctr", "stage2_gallery_cvr", "stage4_avatars", "stage5_verdict"):
+        monkeypatch.setattr(pipeline, name, stage_ok)
+
+    result = await pipeline.run_pipeline_for_job("job-1")
+
+    assert result["status"] == "completed"
+    assert job_store.job_status == ["processing", "completed"]
+    assert (3, "failed") in job_store.marks
+    assert (5, "completed") in job_store.marks
+    completed = job_store.events["pipeline_completed"]
+    assert completed["critical_path"][0] == 0
+    assert completed["winner"] == "asin_a"
+    assert job_store.events["stage_failed"]["error"] == "text model down"
+    assert job_store.outputs[3]["deadline"]["job_deadline_ms"] == 1_200_000
+    if rpc_available:
+        # Start, two transitions per stage, finish; one call each.
+        assert job_store.rpc_calls == 1 + 2 * 6 + 1
+        assert job_store.separate_writes == 0
+    else:
+        assert job_store.rpc_calls == 0
+        assert job_store.separate_writes > 14
+    assert 0 < job_store.outputs[5]["deadline"]["job_remaining_ms"] <= 1_200_000
+
+
+@pytest.mark.asyncio
+async def test_verdict_is_published_before_avatars(job_store: FakeJobStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    release_avatars = asyncio.Event()
+    verdict_before_avatars: list[bool] = []
+
+    def side_output(name: str, score: float) -> dict[str, Any]:
+        return {"stage_name": name, "provider": "heuristics", "asin_a": {"score": score}, "asin_b": {"score": 0.2}}
+
+    async def stage1(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        return side_output("main_image_ctr", 0.9)
+
+    async def stage2(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        return side_output("gallery_cvr", 0.8)
+
+    async def stage3(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        return {"stage_name": "text_alignment", "asin_a": {"metrics": {"score": 0.7}}, "asin_b": {"metrics": {"score": 0.3}}}
+
+    async def stage4(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        await release_avatars.wait()
+        return {"stage_name": "avatars", "provider": "openai", "avatars": [{"name": "Busy parent"}]}
+
+    real_verdict = pipeline.stage5_verdict
+
+    async def stage5(*args: Any) -> dict[str, Any]:
+        out = await real_verdict(*args)
+        verdict_before_avatars.append(out.get("avatars_pending") is True)
+        release_avatars.set()
+        return out
+
+    monkeypatch.setattr(pipeline, "stage1_main_image_ctr", stage1)
+    monkeypatch.setattr(pipeline, "stage2_gallery_cvr", stage2)
+    monkeypatch.setattr(pipeline, "stage3_text_alignment", stage3)
+    monkeypatch.setattr(pipeline, "stage4_avatars", stage4)
+    monkeypatch.setattr(pipeline, "stage5_verdict", stage5)
+
+    result = await asyncio.wait_for(pipeline.run_pipeline_for_job("job-1"), timeout=2)
+
+    assert result["status"] == "completed"
+    assert verdict_before_avatars == [True]
+    assert job_store.marks.index((5, "completed")) < job_store.marks.index((4, "completed"))
+    final = job_store.outputs[5]
+    assert final["winner"] == "A"
+    assert final["avatars_summary"] == ["Busy parent"]
+    assert final["provider_summary"]["stage4"] == "openai"
+    assert "avatars_pending" not in final
+    assert job_store.events["pipeline_completed"]["verdict_ms"] is not None
+
+
+@pytest.mark.asyncio
+async def test_bulk_job_stages_wait_for_a_slow_batch(job_store: FakeJobStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    job_store.job["priority"] = "bulk"
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.delenv("OPENAI_BATCH_MODE", raising=False)
+    for n in range(1, 6):
+        monkeypatch.setenv(f"STAGE{n}_TIMEOUT_SECONDS", "1")
+    submitted: list[str] = []
+
+    async def slow_batch(payload: dict[str, Any], *, api_key: str) -> dict[str, Any]:
+        submitted.append(payload["model"])
+        await asyncio.sleep(1.2)  # longer than every interactive stage timeout
+        return {"choices": [{"message": {"content": '{"confidence": 0.4}'}}]}
+
+    async def llm_stage(*args: Any, **kwargs: Any) -> dict[str, Any]:
+        out = await pipeline.openai_chat_json(system_prompt="p", user_content=[], model="gpt-4o-mini")
+        return {"stage_name": "x", "winner": "A", "confidence": out["confidence"]}
+
+    monkeypatch.setattr(pipeline.openai_batch, "chat_completion_via_batch", slow_batch)
+    for name in ("stage1_main_image_ctr", "stage2_gallery_cvr", "stage3_text_alignment", "stage4_avatars", "stage5_verdict"):
+        monkeypatch.setattr(pipeline, name, llm_stage)
+
+    result = await asyncio.wait_for(pipeline.run_pipeline_for_job("job-1"), timeout=10)
+
+    assert result["status"] == "completed"
+    assert len(submitted) == 5
+    assert [n for n, status in job_store.marks if status == "failed"] == []
+    assert job_store.outputs[1]["deadline"]["stage_budget_ms"] > 1000
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import base64
+import io
+import json
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from worker_app import http_clients, pipeline, vision_images
+
+
+def _png_bytes(width: int, height: int) -> bytes:
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + b"\x00\x00\x00\rIHDR"
+        + width.to_bytes(4, "big")
+        + height.to_bytes(4, "big")
+        + b"\x00" * 16
+    )
+
+
+@pytest.fixture
+def fake_hosts(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[dict[str, Any]]]:
+    openai_payloads: list[dict[str, Any]] = []
+
+    def image_handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=_png_bytes(1500, 1500), headers={"content-type": "image/png"})
+
+    def openai_handler(request: httpx.Request) -> httpx.Response:
+        openai_payloads.append(json.loads(request.content))
+        content = '{"ctr_score_a": 7, "ctr_score_b": 5, "cvr_vision_score_a": 6, "cvr_vision_score_b": 4}'
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_VISION_MODEL", "gpt-vision-test")
+    monkeypatch.setattr(pipeline, "load_prompt_with_integrity", lambda job, rel: ("prompt", {"ok": True}))
+    http_clients.set_transport_override(http_clients.AMAZON_IMAGES, httpx.MockTransport(image_handler))
+    http_clients.set_transport_override(http_clients.OPENAI, httpx.MockTransport(openai_handler))
+    try:
+        yield openai_payloads
+    finally:
+        http_clients.set_transport_override(http_clients.AMAZON_IMAGES, None)
+        http_clients.set_transport_override(http_clients.OPENAI, None)
+
+
+def _stage0() -> dict[str, Any]:
+    def side(asin: str) -> dict[str, Any]:
+        urls = [f"https://m.media-amazon.com/images/I/{asin}-{i}.png" for i in range(2)]
+        return {"asin": asin, "main_image_url": urls[0], "image_urls": urls}
+
+    return {"asin_a": side("B000000001"), "asin_b": side("B000000002")}
+
+
+def _image_parts(payload: dict[str, Any]) -> list[dict[str, Any]]:
+    return [p["image_url"] for p in payload["messages"][1]["content"] if p["type"] == "image_url"]
+
+
+@pytest.mark.asyncio
+async def test_url_mode_passes_amazon_urls(fake_hosts: list[dict[str, Any]]) -> None:
+    out = await pipeline.stage1_main_image_ctr(_stage0())
+
+    assert out["provider"] == "openai"
+    assert [p["url"] for p in _image_parts(fake_hosts[0])] == [
+        "https://m.media-amazon.com/images/I/B000000001-0.png",
+        "https://m.media-amazon.com/images/I/B000000002-0.png",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_inline_mode_reuses_downloaded_bytes(
+    fake_hosts: list[dict[str, Any]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("VISION_IMAGE_MODE", "inline")
+
+    stage1 = await pipeline.stage1_main_image_ctr(_stage0())
+    stage2 = await pipeline.stage2_gallery_cvr(_stage0())
+
+    main_parts = _image_parts(fake_hosts[0])
+    gallery_parts = _image_parts(fake_hosts[1])
+    assert all(p["url"].startswith("data:image/png;base64,") for p in main_parts + gallery_parts)
+    assert {p["detail"] for p in main_parts} == {"high"}
+    assert {p["detail"] for p in gallery_parts} == {"low"}
+    assert stage1["image_transport"]["inlined"] == 2
+    assert stage2["image_transport"]["inlined"] == 4
+    # Raw bytes must never leak into persisted stage output.
+    json.dumps(stage1)
+    json.dumps(stage2)
+    assert "data" not in stage1["asin_a"]["image"]
+
+
+@pytest.mark.asyncio
+async def test_image_part_falls_back_to_url_for_truncated_download(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("VISION_IMAGE_MODE", "inline")
+    meta = {"url": "https://m.media-amazon.com/x.jpg", "ok": True, "truncated": True, "data": b"\xFF\xD8"}
+
+    part, info = await vision_images.image_part(meta, target_px=512)
+
+    assert part["image_url"] == {"url": "https://m.media-amazon.com/x.jpg"}
+    assert info == {"inline": False, "reason": "download_unusable"}
+    assert "data" not in meta
+
+
+@pytest.mark.asyncio
+async def test_inline_images_are_downscaled_and_reencoded(monkeypatch: pytest.MonkeyPatch) -> None:
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setenv("VISION_IMAGE_MODE", "inline")
+    buf = io.BytesIO()
+    Image.effect_noise((1500, 1000), 64).convert("RGBA").save(buf, format="PNG")
+    meta = {"url": "https://m.media-amazon.com/x.png", "ok": True, "data": buf.getvalue()}
+
+    part, info = await vision_images.image_part(meta, target_px=768)
+
+    prefix, encoded = part["image_url"]["url"].split(",", 1)
+    assert prefix == "data:image/jpeg;base64"
+    with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+        assert (img.format, img.mode, img.size) == ("JPEG", "RGB", (768, 512))
+    assert part["image_url"]["detail"] == "high"
+    assert info["downscaled"] is True
+    assert info["inline_bytes"] < info["source_bytes"] // 4
+
+
+@pytest.mark.asyncio
+async def test_transparent_images_are_flattened_onto_white(monkeypatch: pytest.MonkeyPatch) -> None:
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setenv("VISION_IMAGE_MODE", "inline")
+    buf = io.BytesIO()
+    Image.new("RGBA", (600, 600), (0, 0, 0, 0)).save(buf, format="PNG")
+    meta = {"url": "https://m.media-amazon.com/x.png", "ok": True, "data": buf.getvalue()}
+
+    part, _ = await vision_images.image_part(meta, target_px=512)
+
+    encoded = part["image_url"]["url"].split(",", 1)[1]
+    with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+        assert img.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_detail_follows_rubric_resolution() -> None:
+    assert vision_images.detail_for(1500, 1500, 512) == "low"
+    assert vision_images.detail_for(1500, 1500, 768) == "high"
+    assert vision_images.detail_for(400, 300, 768) == "low"
+
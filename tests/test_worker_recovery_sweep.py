@@ -32,7 +32,10 @@ async def test_startup_recovery_requeues_stale_processing_and_seeding_jobs(
         table: str,
         match_params: dict[str, str],
         patch: dict[str, Any],
+        *,
+        returning: str | None = "*",
     ) -> list[dict[str, Any]]:
+        assert returning == ("id" if table == "jobs" else None)
         update_calls.append((table, dict(match_params), dict(patch)))
         if table == "jobs" and match_params["id"] == "eq.job-proc-1":
             return [{"id": "job-proc-1"}]
@@ -78,6 +81,8 @@ async def test_startup_recovery_noop_when_no_stale_jobs(
         table: str,
         match_params: dict[str, str],
         patch: dict[str, Any],
+        *,
+        returning: str | None = "*",
     ) -> list[dict[str, Any]]:
         raise AssertionError("No updates expected when no stale jobs are found")
 
@@ -123,7 +128,10 @@ async def test_cleanup_sweep_applies_ttl_filters(monkeypatch: pytest.MonkeyPatch
 
     delete_calls: list[tuple[str, dict[str, str]]] = []
 
-    async def fake_delete_many(table: str, match_params: dict[str, str]) -> list[dict[str, Any]]:
+    async def fake_delete_many(
+        table: str, match_params: dict[str, str], *, returning: str | None = "*"
+    ) -> list[dict[str, Any]]:
+        assert returning == "id"  # only the count is used
         delete_calls.append((table, dict(match_params)))
         if table == "vision_cache":
             return [{"id": "v1"}, {"id": "v2"}]